@@ -0,0 +1,96 @@
+import glob
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib import json_cache
+from lib import json_codec
+from lib import profile_generator
+
+# Compares the JSON codecs behind json_codec, parsing profiles and base definitions and the canonical
+# serialization reports use, with the stdlib json as the baseline.  Checks the output is the same.
+# Then, for each codec, the components of a profile serialized directly and through json_cache's
+# serialization cache (every lookup a hit), against canonical_json, which only uses the cache where it is quicker.
+# Core definitions are read from a FHIR package folder if one is given, e.g. an unpacked hl7.fhir.r3.core.
+#
+#   python src/benchmarks/bench_json_codec.py [package folder]
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/tests/data'
+REPEAT = 5
+
+
+def get_texts(package_dir=None):
+    files = sorted(glob.glob(DATA_DIR + '/*.profile.json')) + [DATA_DIR + '/CareConnect-AllergyIntolerance-1.json']
+    texts = [(os.path.basename(f), open(f, 'rb').read()) for f in files]
+
+    for size in [1000, 10000]:
+        profile = profile_generator.generate_profile(size)
+        texts.append(('generated-' + str(size), json_codec.json_dumps_pretty(profile).encode('utf-8')))
+
+    if package_dir:
+        definitions = [open(f, 'rb').read() for f in sorted(glob.glob(os.path.join(package_dir, '*.json')))]
+        texts.append(('package (' + str(len(definitions)) + ' files)', definitions))
+
+    return texts
+
+
+def best_time(function, texts):
+    return min(timeit.repeat(lambda: [function(t) for t in texts], number=1, repeat=REPEAT))
+
+
+def run(name, texts):
+    texts = texts if isinstance(texts, list) else [texts]
+    values = [json_codec.json_loads(t) for t in texts]
+    megabytes = sum(len(t) for t in texts) / 1024 / 1024
+    print(name + ' (%.1f MiB)' % megabytes)
+
+    baseline_loads = best_time(json_codec.json_loads, texts)
+    baseline_dumps = best_time(json_codec.json_dumps_pretty, values)
+    for codec, (loads, dumps_pretty) in json_codec.CODECS.items():
+        assert [dumps_pretty(loads(t)) for t in texts] == [json_codec.json_dumps_pretty(v) for v in values]
+        loads_time = best_time(loads, texts)
+        dumps_time = best_time(dumps_pretty, values)
+        print('  %-8s loads %8.4fs  x%-5.1f dumps_pretty %8.4fs  x%.1f' %
+              (codec + ':', loads_time, baseline_loads / loads_time, dumps_time, baseline_dumps / dumps_time))
+
+
+# The object valued components of every element, as the diff serializes them
+def get_components(filename):
+    profile = json_codec.json_loads(open(DATA_DIR + '/' + filename, 'rb').read())
+    return [v for section in ['snapshot', 'differential'] for e in profile[section]['element']
+            for v in e.values() if isinstance(v, (dict, list))]
+
+
+def run_canonical(name, values):
+    print(name + ' (' + str(len(values)) + ' components)')
+
+    for codec in json_codec.CODECS:
+        json_codec.set_codec(codec)
+        json_cache.clear_cache()
+        json_cache.set_cache_limits(max_entries=len(values))
+        # Warm, so every cached lookup is a hit
+        for v in values:
+            json_cache.cached_canonical_json(v)
+        assert [json_cache.cached_canonical_json(v) for v in values] == [json_codec.dumps_pretty(v) for v in values]
+
+        direct_time = best_time(json_codec.dumps_pretty, values)
+        cached_time = best_time(json_cache.cached_canonical_json, values)
+        canonical_time = best_time(json_cache.canonical_json, values)
+        print('  %-8s direct %8.4fs  cache hits %8.4fs  x%-5.1f canonical_json %8.4fs  x%.1f' %
+              (codec + ':', direct_time, cached_time, direct_time / cached_time, canonical_time,
+               direct_time / canonical_time))
+
+    json_codec.set_codec(json_codec.DEFAULT_CODEC)
+    json_cache.clear_cache()
+
+
+def main():
+    for name, texts in get_texts(sys.argv[1] if len(sys.argv) > 1 else None):
+        run(name, texts)
+
+    filename = 'CareConnect-AllergyIntolerance-1.json'
+    run_canonical(filename, get_components(filename))
+
+
+if __name__ == "__main__":
+    main()
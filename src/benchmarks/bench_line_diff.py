@@ -0,0 +1,73 @@
+import difflib
+import json
+import os
+import random
+import sys
+import timeit
+from itertools import islice
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib import line_diff
+from lib import profile_diff
+
+# Compares the line diff engines behind profile_diff.list_diff with the original implementation,
+# difflib.unified_diff with full context and the output built up by string concatenation.
+#
+#   python src/benchmarks/bench_line_diff.py
+DATA_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__))) + '/tests/data'
+REPEAT = 3
+
+
+def original_list_diff(left, right) -> str:
+    diff_text = ''
+    diff_generator = difflib.unified_diff(left, right, n=max(len(left), len(right)))
+    for diff in islice(diff_generator, 3, None):
+        diff_text = diff_text + diff + '  \n'
+    return diff_text
+
+
+def element_id_lists(size, change_rate=0.02, seed=0):
+    rng = random.Random(seed)
+    profile = json.load(open(DATA_DIR + '/CareConnect-AllergyIntolerance-1.json'))
+    ids = [e['id'] for e in profile['snapshot']['element']]
+    left = [ids[i % len(ids)] + ':' + str(i // len(ids)) for i in range(size)]
+    right = [e for e in left if rng.random() > change_rate / 2]
+    for _ in range(int(size * change_rate / 2)):
+        right.insert(rng.randrange(len(right)), 'AllergyIntolerance.added:' + str(rng.random()))
+    return left, right
+
+
+def json_lines(copies, seed=0):
+    rng = random.Random(seed)
+    profile = json.load(open(DATA_DIR + '/CareConnect-AllergyIntolerance-1.json'))
+    left = [dict(e, id=e['id'] + ':' + str(c)) for c in range(copies) for e in profile['snapshot']['element']]
+    right = [dict(e) for e in left]
+    for e in rng.sample(right, len(right) // 50):
+        e['max'] = '0'
+    return profile_diff.json_pretty(left).splitlines(), profile_diff.json_pretty(right).splitlines()
+
+
+def best_time(function, *args):
+    return min(timeit.repeat(lambda: function(*args), number=1, repeat=REPEAT))
+
+
+def run(name, left, right):
+    original = best_time(original_list_diff, left, right)
+    print(name + ' (' + str(len(left)) + ' / ' + str(len(right)) + ' lines)')
+    print('  original difflib + concatenation: %8.3fs' % original)
+    for engine in line_diff.DIFF_ENGINES:
+        line_diff.set_diff_engine(engine)
+        elapsed = best_time(profile_diff.list_diff, left, right)
+        print('  %-31s %8.3fs  x%.1f' % (engine + ':', elapsed, original / elapsed))
+    line_diff.set_diff_engine(line_diff.DEFAULT_ENGINE)
+
+
+def main():
+    for size in [1000, 10000]:
+        run('Element ids', *element_id_lists(size))
+    for copies in [1, 5]:
+        run('json_diff', *json_lines(copies))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,203 @@
+import argparse
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.realpath(__file__))))
+from lib import base_definitions
+from lib import json_cache
+from lib import profile_diff
+from lib import profile_elements
+from lib import profile_generator
+from lib import profile_report
+from lib import snapshot_generator
+from lib.structuredefinition_reader import read_profile, read_profile_sections
+
+# Times each stage of a diff, over the test data pair and generated pairs (see profile_generator) of
+# 100 / 1k / 10k elements, reporting the best wall time of a few runs and the peak memory (tracemalloc)
+# of one more.  Base definitions are read from the test data, nothing is downloaded.  Results are saved
+# as JSON, and can be compared with an earlier run.
+#
+#   python src/benchmarks/bench_suite.py -o bench_results.json
+#   python src/benchmarks/bench_suite.py -o after.json --compare before.json
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.realpath(__file__)))
+DATA_DIR = SRC_DIR + '/tests/data'
+TEMPLATE = SRC_DIR + '/templates/markdown.md.jinja2'
+LEFT_PROFILE = DATA_DIR + '/CareConnect-AllergyIntolerance-1.json'
+RIGHT_PROFILE = DATA_DIR + '/CareConnect-GPC-AllergyIntolerance-1.json'
+SIZES = [100, 1000, 10000]
+REPEAT = 3
+
+
+# Base definitions from the test data, or an empty definition (as a failed download) for anything else
+def read_stub_definition(resource_type, version):
+    path = os.path.join(DATA_DIR, resource_type.lower() + '.profile.json')
+    if os.path.exists(path):
+        with open(path) as f:
+            return f.read()
+
+    return '{}'
+
+
+def write_profiles(directory, name, left, right):
+    paths = []
+    for side, profile in [('left', left), ('right', right)]:
+        path = os.path.join(directory, name + '-' + side + '.json')
+        with open(path, 'w') as f:
+            json.dump(profile, f)
+        paths.append(path)
+
+    return paths
+
+
+def get_datasets(directory, sizes, slice_depth, divergence, seed):
+    datasets = [('test-data', LEFT_PROFILE, RIGHT_PROFILE)]
+    for size in sizes:
+        pair = profile_generator.generate_pair(size, slice_depth, divergence, seed)
+        datasets.append(('generated-' + str(size), *write_profiles(directory, 'generated-' + str(size), *pair)))
+
+    return datasets
+
+
+def base_lookups(aligned, version):
+    for element in aligned:
+        for component in profile_elements.align_elements(element.left, element.right):
+            base_definitions.get_base_component(element, component.key, version)
+
+
+def render(left, left_version, right, right_version, element_level_diff, component_level_diff):
+    out = io.StringIO()
+    report = profile_report.get_diff_report(left, left_version, right, right_version,
+                                            element_level_diff, component_level_diff)
+    profile_report.get_template(TEMPLATE).stream(report=report, **report._asdict()).dump(out)
+    return out
+
+
+# Name -> (function, setup), setup is run before each measurement, outside it
+def get_benchmarks(left_file, right_file):
+    left, left_version, _, _ = read_profile(left_file)
+    right, right_version, _, _ = read_profile(right_file)
+    left_elements = profile_elements.extract_elements(left)
+    left_differential = {k: v for k, v in left.items() if k != 'snapshot'}
+    right_elements = profile_elements.extract_elements(right)
+    aligned = profile_elements.align_elements(left_elements, right_elements)
+    # Warm the definition cache, lookups are measured without the parsing
+    base_lookups(aligned, left_version)
+    element_level_diff = profile_diff.element_diff(left, right)
+    component_level_diff = profile_diff.detailed_diff(left_elements, right_elements, left_version)
+    # And compile the template
+    render(left, left_version, right, right_version, element_level_diff, component_level_diff)
+
+    return {'read_profile': (lambda: read_profile(left_file), None),
+            'read_profile_sections': (lambda: read_profile_sections(left_file), None),
+            'element_diff': (lambda: profile_diff.element_diff(left, right), None),
+            'extract_elements': (lambda: profile_elements.extract_elements(left), None),
+            'generate_snapshot': (lambda: snapshot_generator.generate_snapshot(left_differential, left_version), None),
+            'align_elements': (lambda: profile_elements.align_elements(left_elements, right_elements), None),
+            'detailed_diff': (lambda: profile_diff.detailed_diff(left_elements, right_elements, left_version),
+                              json_cache.clear_cache),
+            'get_base_component': (lambda: base_lookups(aligned, left_version), None),
+            'render': (lambda: render(left, left_version, right, right_version,
+                                      element_level_diff, component_level_diff), None)}
+
+
+def measure(function, setup, repeat):
+    times = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        start = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start)
+
+    # Separate run for memory, tracemalloc slows everything down
+    if setup:
+        setup()
+    tracemalloc.start()
+    function()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    return min(times), peak
+
+
+def run_benchmarks(sizes=None, repeat=REPEAT, only=None, slice_depth=2, divergence=0.05, seed=0):
+    sizes = SIZES if sizes is None else sizes
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory, \
+            mock.patch('lib.base_definitions.read_definition', side_effect=read_stub_definition):
+        base_definitions.resource_cache.clear()
+        for dataset, left_file, right_file in get_datasets(directory, sizes, slice_depth, divergence, seed):
+            elements = len(read_profile(left_file)[0]['differential']['element'])
+            for name, (function, setup) in get_benchmarks(left_file, right_file).items():
+                if only and name not in only:
+                    continue
+                seconds, peak = measure(function, setup, repeat)
+                results.append({'benchmark': name,
+                                'dataset': dataset,
+                                'elements': elements,
+                                'seconds': seconds,
+                                'peak_bytes': peak})
+                print('%-20s %-18s %8.4fs %10.1f KiB' % (name, dataset, seconds, peak / 1024))
+
+    return {'python': platform.python_version(),
+            'generated': {'slice_depth': slice_depth, 'divergence': divergence, 'seed': seed},
+            'platform': platform.platform(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'repeat': repeat,
+            'results': results}
+
+
+def compare(results, previous):
+    previous_results = {(r['benchmark'], r['dataset']): r for r in previous['results']}
+
+    print('\n%-20s %-18s %10s %10s' % ('benchmark', 'dataset', 'time', 'peak'))
+    for r in results['results']:
+        p = previous_results.get((r['benchmark'], r['dataset']))
+        if p:
+            print('%-20s %-18s %9.2fx %9.2fx' % (r['benchmark'], r['dataset'],
+                                                 p['seconds'] / r['seconds'] if r['seconds'] else 0,
+                                                 p['peak_bytes'] / r['peak_bytes'] if r['peak_bytes'] else 0))
+
+
+def get_args():
+    parser = argparse.ArgumentParser(description='Benchmark the stages of a profile diff.')
+    parser.add_argument('-o', '--output', help='Save the results to this JSON file')
+    parser.add_argument('-c', '--compare', help='Earlier results JSON file to compare with, as speed up')
+    parser.add_argument('-s', '--sizes', type=int, nargs='*', default=SIZES,
+                        help='Sizes (elements) of the generated profiles. Default ' + str(SIZES))
+    parser.add_argument('-sd', '--slicedepth', type=int, default=2,
+                        help='Slice depth of the generated profiles. Default 2')
+    parser.add_argument('-d', '--divergence', type=float, default=0.05,
+                        help='Fraction of the generated right hand elements that differ. Default 0.05')
+    parser.add_argument('--seed', type=int, default=0, help='Seed for the generated profiles. Default 0')
+    parser.add_argument('-r', '--repeat', type=int, default=REPEAT,
+                        help='Runs timed per benchmark, the best is reported. Default ' + str(REPEAT))
+    parser.add_argument('-b', '--benchmark', action='append',
+                        help='Only run this benchmark, can be given more than once')
+
+    return parser.parse_args()
+
+
+def main():
+    args = get_args()
+    results = run_benchmarks(args.sizes, args.repeat, args.benchmark, args.slicedepth, args.divergence, args.seed)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(results, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,25 @@
+from lib import profile_args
+from lib import batch_diff
+
+
+def fhir_structure_batch(args):
+    unmatched = []
+    if args.manifest:
+        pairs = batch_diff.read_manifest(args.manifest)
+    else:
+        pairs, unmatched = batch_diff.match_directories(args.leftdir, args.rightdir)
+
+    return batch_diff.batch_diff(pairs, args.outputdir, args.template,
+                                 workers=args.workers,
+                                 definition_args=args,
+                                 unmatched=unmatched,
+                                 diff_engine=args.diffengine)
+
+
+def main():
+    args = profile_args.get_batch_args()
+    fhir_structure_batch(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,31 +1,35 @@
-import os
-from jinja2 import Template
-from lib import profile_diff as pd
 from lib import profile_args
+from lib import profile_report
+from lib import structured_report
+from lib import base_definitions
+from lib import line_diff
+from lib import instrumentation
+from lib import result_cache
 
 
 def fhir_structure_diff(args):
-    element_level_diff = pd.element_diff(args.leftprofile, args.rightprofile)
-    component_level_diff = pd.component_diff(args.leftprofile, args.rightprofile, args.leftversion)  # TODO support multiple versions
+    if args.format in structured_report.FILE_EXTENSIONS:
+        diff_file = args.output if args.output else './' + structured_report.get_report_filename(args.format)
+        structured_report.write_structured_report(args.leftprofile, args.leftversion,
+                                                  args.rightprofile, args.rightversion,
+                                                  diff_file, args.format)
+        return
 
-    diff_template = open(args.template).read()
-    t = Template(diff_template)
-    diff_rendered = t.render(resource_type=args.leftprofile['type'],
-                             left_profile=args.leftprofile['name'],
-                             left_version=args.leftversion,
-                             right_profile=args.rightprofile['name'],
-                             right_version=args.rightversion,
-                             element_level_diff=element_level_diff,
-                             component_results=component_level_diff)
-
-    diff_file = './' + os.path.basename(args.template).rsplit('.', 1)[0]
-    diff = open(diff_file, 'w')
-    diff.write(diff_rendered)
+    diff_file = args.output if args.output else './' + profile_report.get_report_filename(args.template)
+    profile_report.write_report(args.leftprofile, args.leftversion,
+                                args.rightprofile, args.rightversion,
+                                args.template, diff_file)
 
 
 def main():
     args = profile_args.get_args()
-    fhir_structure_diff(args)
+    base_definitions.configure_definition_sources(args)
+    profile_report.configure_template_cache(args)
+    result_cache.configure(args)
+    line_diff.set_diff_engine(args.diffengine)
+    with instrumentation.span('fhir_structure_diff'):
+        fhir_structure_diff(args)
+    instrumentation.write_output(args)
 
 
 if __name__ == "__main__":
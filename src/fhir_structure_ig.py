@@ -0,0 +1,18 @@
+from lib import profile_args
+from lib import ig_diff
+
+
+def fhir_structure_ig(args):
+    return ig_diff.ig_diff(args.leftig, args.rightig, args.outputdir, args.template,
+                           workers=args.workers,
+                           definition_args=args,
+                           diff_engine=args.diffengine)
+
+
+def main():
+    args = profile_args.get_ig_args()
+    fhir_structure_ig(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,28 @@
+import os
+from lib import profile_args
+from lib import matrix_diff
+
+
+def fhir_structure_matrix(args):
+    right_files = []
+    for right in args.rightprofiles:
+        if os.path.isdir(right):
+            right_files.extend(os.path.join(right, filename) for filename in sorted(os.listdir(right))
+                               if os.path.splitext(filename)[1].lower() == '.json')
+        else:
+            right_files.append(right)
+
+    return matrix_diff.matrix_diff(args.leftprofile, right_files, args.outputdir, args.template,
+                                   workers=args.workers,
+                                   definition_args=args,
+                                   left_version=args.leftversion,
+                                   diff_engine=args.diffengine)
+
+
+def main():
+    args = profile_args.get_matrix_args()
+    fhir_structure_matrix(args)
+
+
+if __name__ == "__main__":
+    main()
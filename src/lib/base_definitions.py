@@ -1,5 +1,11 @@
-import json
-import requests
+import hashlib
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from . import definition_cache
+from . import instrumentation
+from . import json_codec
+from . import package_source
+from . import profile_ancestors
 
 # Constants for base profile URL's.
 # Might be worth adding config for this,
@@ -8,45 +14,96 @@ import requests
 BASE_URL = 'https://hl7.org/fhir/'
 BASE_FILE_TYPE = '.profile.json'
 
-# Again, only need a cache here, slightly more cohesive and would be easy to move if needed
-resource_cache = {}
-# TODO. Could make this more flexible to allow for using cache as opposed to web
-#       Could use npm
-#       Naming convention seems to be much messier
-#       For simplicity leaving this for now
+# Again, only need a cache here, slightly more cohesive and would be easy to move if needed.
+# Holds the parsed base definitions along with an index of lower case element id -> element,
+# so a lookup is a single dict access once a definition has been parsed.  Least recently used
+# definitions are evicted once either limit is exceeded, the size is the length of the raw json.
+# Each entry also has the sha256 of the raw json, so results can be keyed on the definitions they used.
+resource_cache = OrderedDict()
+cache_limits = {'max_entries': 64, 'max_bytes': 256 * 1024 * 1024}
+# Definitions are read from any FHIR packages registered with package_source first, and only
+# downloaded if none of them has the definition.
 
 
-def get_base_component(element_operands, component, version):
+# Takes the parsed definition source arguments, see profile_args.add_definition_args
+def configure_definition_sources(args):
+    definition_cache.configure(directory=None if args.nocache else args.cachedir, offline=args.offline)
+    for package in args.package:
+        package_source.add_package(package)
+    for corpus in args.ancestors:
+        profile_ancestors.add_ancestor_source(corpus)
 
-    base_component = check_base_definition(element_operands, component, version)
+
+def set_cache_limits(max_entries=None, max_bytes=None):
+    if max_entries is not None:
+        cache_limits['max_entries'] = max_entries
+    if max_bytes is not None:
+        cache_limits['max_bytes'] = max_bytes
+
+    evict_definitions()
+
+
+# element is a profile_elements.AlignedElement
+def get_base_component(element, component, version):
+    instrumentation.count('base_lookups')
+
+    base_component = check_base_definition(element, component, version)
     if base_component != {}:
         return base_component
 
-    return check_defined_base_path(element_operands, component, version)
+    return check_defined_base_path(element, component, version)
+
 
+# As get_base_component, remembering the results in base_components, for many diffs against one profile.
+# The result only depends on the element id, component, version and base path.
+def get_base_component_memo(base_components, element, component, version):
+    base_path = get_element_base_path(element)
+    memo_key = (element.key, component, version, base_path['path'] if base_path else None)
+    if memo_key not in base_components:
+        base_components[memo_key] = get_base_component(element, component, version)
 
-def check_base_definition(element_operands, component, version):
-    element_key = str(*element_operands.keys())
-    resource_type = element_key.split('.')[0]
-    base_definition = json.loads(get_definition(resource_type, version))  # TODO pull fhirVersion out of operands
+    return base_components[memo_key]
 
-    return search_definition(base_definition, element_key, component)
 
+def check_base_definition(element, component, version):
+    resource_type = element.key.split('.')[0]
+    element_index = get_element_index(resource_type, version)  # TODO pull fhirVersion out of operands
 
-def check_defined_base_path(element_operands, component, version):
-    element_base_path = get_element_base_path(element_operands)
+    return search_index(element_index, element.key, component)
+
+
+def check_defined_base_path(element, component, version):
+    element_base_path = get_element_base_path(element)
 
     if element_base_path:
         resource_type = element_base_path['path'].split('.')[0]
-        base_element_definition = json.loads(get_definition(resource_type, version))
-        return search_definition(base_element_definition, element_base_path['path'], component)
+        element_index = get_element_index(resource_type, version)
+        return search_index(element_index, element_base_path['path'], component)
 
     return {}
 
 
-def get_element_base_path(element_operands):
-    left_element = tuple(*element_operands.values())[0]
-    right_element = tuple(*element_operands.values())[1]
+# sha256 of each definition get_base_component can look the element up in, or None if any is empty, i.e. was not
+# found or could not be downloaded
+def get_definition_digests(element, version):
+    resource_types = [element.key.split('.')[0]]
+    element_base_path = get_element_base_path(element)
+    if element_base_path:
+        resource_types.append(element_base_path['path'].split('.')[0])
+
+    digests = []
+    for resource_type in resource_types:
+        base_definition, element_index, size, digest = get_cache_entry(resource_type, version)
+        if not base_definition:
+            return None
+        digests.append(digest)
+
+    return digests
+
+
+def get_element_base_path(element):
+    left_element = element.left
+    right_element = element.right
 
     if 'base' in left_element and 'base' in right_element and \
             left_element and right_element and \
@@ -65,6 +122,21 @@ def get_element_base_path(element_operands):
 
 
 def search_definition(base_definition, element, component):
+    return search_index(index_definition(base_definition), element, component)
+
+
+def search_index(element_index, element, component):
+    if not element_index:
+        return {}
+
+    e = element_index.get(element.lower(), {})
+    if component in e.keys():
+        return e[component]
+
+    return {}
+
+
+def index_definition(base_definition):
     if not base_definition:
         return {}
     if 'snapshot' not in base_definition:
@@ -74,35 +146,115 @@ def search_definition(base_definition, element, component):
         raise ValueError('No elements found in base definition.\n\nBase definition -->\n\n' +
                          str(base_definition))
 
+    element_index = {}
     for e in base_definition['snapshot']['element']:
-        if 'id' in e and e['id'].lower() == element.lower():
-            if component in e.keys():
-                return e[component]
+        if 'id' in e:
+            # Keep the first occurrence, matches the previous linear search
+            element_index.setdefault(e['id'].lower(), e)
 
-    return {}
+    return element_index
 
 
 def get_definition(resource_type, version):
-    if resource_type + version not in resource_cache:
-        return download_definition(resource_type, version)
+    return get_cache_entry(resource_type, version)[0]
+
 
-    return resource_cache[resource_type + version]
+def get_element_index(resource_type, version):
+    return get_cache_entry(resource_type, version)[1]
+
+
+def get_cache_entry(resource_type, version):
+    cache_key = resource_type + version
+    if cache_key in resource_cache:
+        resource_cache.move_to_end(cache_key)
+        instrumentation.count('definition_cache_hits')
+        return resource_cache[cache_key]
+
+    instrumentation.count('definition_cache_misses')
+    return add_cache_entry(resource_type, version, read_definition(resource_type, version))
+
+
+def add_cache_entry(resource_type, version, definition_text):
+    cache_key = resource_type + version
+    with instrumentation.span('parse_definition', type=resource_type):
+        base_definition = json_codec.loads(definition_text)
+        element_index = index_definition(base_definition)
+    raw = definition_text.encode('utf-8') if isinstance(definition_text, str) else definition_text
+    resource_cache[cache_key] = (base_definition, element_index, len(definition_text), hashlib.sha256(raw).hexdigest())
+    evict_definitions()
+
+    return resource_cache[cache_key]
+
+
+def evict_definitions():
+    cache_bytes = sum(entry[2] for entry in resource_cache.values())
+
+    # Always keep the most recently used definition, even if it is larger than the limit on its own
+    while len(resource_cache) > 1 and \
+            (len(resource_cache) > cache_limits['max_entries'] or cache_bytes > cache_limits['max_bytes']):
+        cache_bytes -= resource_cache.popitem(last=False)[1][2]
+
+
+# (resource type, version) of every base definition a diff of the profile can look up, i.e. the root of each
+# differential element id and of the snapshot base path of each.  Only differential elements are diffed, so the
+# base paths of other snapshot elements, e.g. BackboneElement, are never looked up.
+def required_definitions(profile, version):
+    differential_ids = {e['id'] for e in profile['differential']['element'] if 'id' in e}
+    required = {(i.split('.')[0], version) for i in differential_ids}
+    required |= {(e['base']['path'].split('.')[0], version)
+                 for e in profile.get('snapshot', {}).get('element', [])
+                 if e.get('id') in differential_ids and 'base' in e and 'path' in e['base']}
+
+    return required
+
+
+# Reads (downloads, if not in a package) every definition that is not already cached, concurrently,
+# before the diff needs them.  Parsing is left to this thread, it would not run in parallel anyway.
+def prefetch_definitions(required, workers=8):
+    missing = sorted(r for r in required if r[0] + r[1] not in resource_cache)
+    if not missing:
+        return
+
+    with instrumentation.span('prefetch_definitions', definitions=len(missing)), \
+            ThreadPoolExecutor(max_workers=workers) as executor:
+        definition_texts = list(executor.map(lambda r: read_definition(*r), missing))
+
+    for (resource_type, version), definition_text in zip(missing, definition_texts):
+        add_cache_entry(resource_type, version, definition_text)
+
+
+# Cache entries can be handed to other processes, see import_cache
+def export_cache():
+    return OrderedDict(resource_cache)
+
+
+def import_cache(entries):
+    resource_cache.update(entries)
+    evict_definitions()
+
+
+def read_definition(resource_type, version):
+    with instrumentation.span('read_definition', type=resource_type):
+        definition_text = package_source.get_definition_text(resource_type, version)
+        if definition_text is not None:
+            return definition_text
+
+        return download_definition(resource_type, version)
 
 
 def download_definition(resource_type, version):
     profile_url = get_profile_url(resource_type, version)
 
     # Allow exceptions to be raised, i.e. connection failure etc...
-    response = requests.get(profile_url)
+    # Goes through the on-disk cache when a cache directory has been configured
+    content = definition_cache.fetch(profile_url)
 
-    if response.ok:
-        resource_cache[resource_type + version] = response.content.decode('utf-8')
-        return resource_cache[resource_type + version]
+    if content is not None:
+        return content
     else:
         # requests will have raised an exception on a connection error, so this just
-        # stops attempts to download invalid types by storing an empty json object
-        resource_cache[resource_type + version] = '{}'
-        return resource_cache[resource_type + version]
+        # stops attempts to download invalid types by caching an empty json object
+        return '{}'
 
 
 def get_profile_url(resource_type, version):
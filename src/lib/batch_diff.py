@@ -0,0 +1,222 @@
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from . import base_definitions
+from . import line_diff
+from . import package_source
+from . import profile_ancestors
+from . import profile_corpus
+from . import profile_report
+from . import result_cache
+from .profile_args import check_resource_properties
+from .profile_corpus import read_profile
+
+# Diffs many left/right profile pairs, fanned out over a process pool.  The base definitions every pair
+# needs are loaded once up front and handed to each worker, so workers do not download or parse them again.
+INDEX_FILE = 'index.md'
+INDEX_JSON_FILE = 'index.json'
+
+
+# Manifest is a .csv with a header row, or a .json list of objects, with the columns/keys left, right and
+# optionally leftversion, rightversion (major version, as -lv/-rv).  Paths are relative to the manifest.
+def read_manifest(manifest):
+    manifest_extension = os.path.splitext(manifest)[1].lower()
+    manifest_dir = os.path.dirname(os.path.abspath(manifest))
+
+    with open(manifest, newline='') as f:
+        if manifest_extension == '.json':
+            rows = json.load(f)
+        elif manifest_extension == '.csv':
+            rows = list(csv.DictReader(f))
+        else:
+            raise TypeError('Unrecognised manifest file extension: ' + manifest_extension)
+
+    pairs = []
+    for row in rows:
+        if not isinstance(row, dict) or not row.get('left') or not row.get('right'):
+            raise ValueError('Manifest entry must have a left and right profile.\n\nEntry -> ' + str(row))
+
+        pairs.append({'left': os.path.join(manifest_dir, row['left']),
+                      'right': os.path.join(manifest_dir, row['right']),
+                      'leftversion': str(row['leftversion']) if row.get('leftversion') else None,
+                      'rightversion': str(row['rightversion']) if row.get('rightversion') else None})
+
+    return pairs
+
+
+# Pairs the profiles in two directories by resource type.  Returns the pairs and the files that have no counterpart.
+def match_directories(left_dir, right_dir):
+    left_types = index_directory(left_dir)
+    right_types = index_directory(right_dir)
+
+    pairs = [{'left': left_types[t], 'right': right_types[t], 'leftversion': None, 'rightversion': None}
+             for t in left_types if t in right_types]
+    unmatched = [left_types[t] for t in left_types if t not in right_types] + \
+                [right_types[t] for t in right_types if t not in left_types]
+
+    return pairs, unmatched
+
+
+def index_directory(directory):
+    types = {}
+    for filename in sorted(os.listdir(directory)):
+        if os.path.splitext(filename)[1].lower() != '.json':
+            continue
+
+        path = os.path.join(directory, filename)
+        try:
+            profile_type = read_profile(path)[3]
+        except ValueError:
+            # Not a StructureDefinition with a differential
+            continue
+
+        if profile_type in types:
+            raise ValueError('More than one profile with resource type ' + profile_type + ' in ' + directory +
+                             '.\n\n' + types[profile_type] + '\n' + path + '\n\nUse a manifest to pair these.')
+        types[profile_type] = path
+
+    return types
+
+
+def batch_diff(pairs, output_dir, template, workers=None, definition_args=None, unmatched=None, diff_engine=None):
+    os.makedirs(output_dir, exist_ok=True)
+    jobs = assign_report_files([prepare_job(pair) for pair in pairs], template)
+
+    if definition_args is not None:
+        base_definitions.configure_definition_sources(definition_args)
+        profile_report.configure_template_cache(definition_args)
+        result_cache.configure(definition_args)
+
+    if diff_engine is not None:
+        line_diff.set_diff_engine(diff_engine)
+
+    required = set()
+    for job in jobs:
+        required |= job.pop('required')
+    base_definitions.prefetch_definitions(required)
+    cache_entries = base_definitions.export_cache()
+
+    if workers is not None and workers <= 1:
+        results = [diff_pair(job, output_dir, template) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(definition_args, cache_entries, diff_engine,
+                                           list(profile_ancestors.ancestor_sources))) as executor:
+            results = list(executor.map(diff_pair, jobs, [output_dir] * len(jobs), [template] * len(jobs)))
+
+    write_index(results, unmatched or [], output_dir)
+    return results
+
+
+def prepare_job(pair):
+    job = {'left': pair['left'],
+           'right': pair['right'],
+           'left_name': os.path.splitext(os.path.basename(pair['left']))[0],
+           'right_name': os.path.splitext(os.path.basename(pair['right']))[0],
+           'error': None}
+
+    # A pair that cannot be read or compared, e.g. a missing file or a different resource type, is recorded in
+    # the index rather than losing the rest of the batch
+    try:
+        job.update(prepare_pair(pair))
+    except Exception as e:
+        job.update(required=set(), error=type(e).__name__ + ': ' + str(e).split('\n')[0])
+
+    return job
+
+
+def prepare_pair(pair):
+    left, left_ver, left_name, left_type = read_profile(pair['left'])
+    right, right_ver, right_name, right_type = read_profile(pair['right'])
+    versions = argparse.Namespace(leftprofile=pair['left'], rightprofile=pair['right'],
+                                  leftversion=pair['leftversion'], rightversion=pair['rightversion'])
+    left_ver, right_ver = check_resource_properties(left_type, right_type, left_ver, right_ver, versions)
+
+    return {'left': pair['left'],
+            'right': pair['right'],
+            'left_name': left_name,
+            'right_name': right_name,
+            'leftversion': left_ver,
+            'rightversion': right_ver,
+            'required': base_definitions.required_definitions(left, left_ver) |
+                        base_definitions.required_definitions(right, left_ver)}
+
+
+def assign_report_files(jobs, template):
+    extension = os.path.splitext(profile_report.get_report_filename(template))[1]
+    used = set()
+
+    for job in jobs:
+        report_file = job['left_name'] + '__' + job['right_name'] + extension
+        count = 1
+        while report_file in used:
+            count += 1
+            report_file = job['left_name'] + '__' + job['right_name'] + '-' + str(count) + extension
+        used.add(report_file)
+        job['report'] = report_file
+
+    return jobs
+
+
+# Workers may be spawned rather than forked, so start with nothing set up and are passed everything they need.
+# ancestor_sources are the parent's profile_ancestors.ancestor_sources, including those not from the arguments,
+# e.g. the guides in ig_diff.
+def init_worker(definition_args, cache_entries, diff_engine, ancestor_sources=()):
+    # Forked workers inherit the parent's indexed corpora, and their open files
+    profile_corpus.reopen_corpora()
+    if definition_args is not None:
+        # Forked workers inherit the parent's open packages
+        package_source.clear_packages()
+        base_definitions.configure_definition_sources(definition_args)
+        profile_report.configure_template_cache(definition_args)
+        result_cache.configure(definition_args)
+    for path in ancestor_sources:
+        profile_ancestors.add_ancestor_source(path)
+    base_definitions.import_cache(cache_entries)
+    if diff_engine is not None:
+        line_diff.set_diff_engine(diff_engine)
+
+
+def diff_pair(job, output_dir, template):
+    result = {'left': job['left'],
+              'right': job['right'],
+              'left_name': job['left_name'],
+              'right_name': job['right_name'],
+              'report': job['report'],
+              'error': job.get('error')}
+    if result['error']:
+        result['report'] = None
+        return result
+
+    # One bad pair should not lose the rest of the batch, the error is recorded in the index
+    try:
+        left = read_profile(job['left'])[0]
+        right = read_profile(job['right'])[0]
+        profile_report.write_report(left, job['leftversion'], right, job['rightversion'],
+                                    template, os.path.join(output_dir, job['report']))
+    except Exception as e:
+        result['report'] = None
+        result['error'] = type(e).__name__ + ': ' + str(e).split('\n')[0]
+
+    return result
+
+
+def write_index(results, unmatched, output_dir):
+    with open(os.path.join(output_dir, INDEX_JSON_FILE), 'w') as f:
+        json.dump({'results': results, 'unmatched': unmatched}, f, indent=2)
+
+    with open(os.path.join(output_dir, INDEX_FILE), 'w') as f:
+        f.write('# FHIR Profile Batch Diff  \n')
+        f.write('|Lefthand Profile|Righthand Profile|Report|\n')
+        f.write('|----|----|----|\n')
+        for result in results:
+            report = '[' + result['report'] + '](' + result['report'] + ')' if result['report'] else result['error']
+            f.write('|' + result['left_name'] + '|' + result['right_name'] + '|' + report + '|\n')
+
+        if unmatched:
+            f.write('\n**No counterpart:**  \n')
+            for filename in unmatched:
+                f.write(filename + '  \n')
@@ -0,0 +1,252 @@
+import hashlib
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+import requests
+from concurrent.futures import Future
+from . import instrumentation
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+# On-disk cache for downloaded base definitions, shared between runs (and processes).
+#
+#   <directory>/objects/<sha256 of content>.json   raw definition, content addressed
+#   <directory>/urls/<sha256 of url>.json          metadata for a url, points at an object
+#
+# Cached content is used as is for max_age seconds, after which it is revalidated with
+# If-None-Match/If-Modified-Since.  If revalidation fails (a connection error or any status other than 304
+# or 404/410) the stale copy is used, with a warning.  Only a 404/410 is remembered, for negative_ttl seconds.
+# All writes go to a temporary file that is renamed into place, so concurrent runs only
+# ever see complete files.  Offline never makes a request and fails if there is no entry.
+DEFAULT_DIRECTORY = os.path.join(os.path.expanduser('~'), '.cache', 'fhir-structure-diff')
+NOT_FOUND_STATUSES = [404, 410]
+
+cache_settings = {'directory': None,
+                  'offline': False,
+                  'max_age': 24 * 60 * 60,
+                  'negative_ttl': 24 * 60 * 60}
+
+# Downloads share one Session per process, keep-alive connections are pooled per host.
+# Connection errors and the listed statuses are retried with exponential backoff.
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+http_settings = {'timeout': 30,
+                 'retries': 3,
+                 'backoff_factor': 0.5,
+                 'pool_size': 16}
+http_session = {'pid': None, 'session': None}
+
+logger = logging.getLogger(__name__)
+
+# Url -> Future for the downloads currently in progress, so concurrent requests for the same url share one download
+in_flight = {}
+in_flight_lock = threading.Lock()
+
+
+def configure(directory=None, offline=None, max_age=None, negative_ttl=None):
+    if directory is not None:
+        cache_settings['directory'] = directory
+    if offline is not None:
+        cache_settings['offline'] = offline
+    if max_age is not None:
+        cache_settings['max_age'] = max_age
+    if negative_ttl is not None:
+        cache_settings['negative_ttl'] = negative_ttl
+
+
+# Returns the content for the url as a string, or None if the url was not found
+def fetch(url):
+    with in_flight_lock:
+        future = in_flight.get(url)
+        owner = future is None
+        if owner:
+            future = in_flight[url] = Future()
+
+    if not owner:
+        return future.result()
+
+    try:
+        future.set_result(fetch_once(url))
+    except BaseException as e:
+        future.set_exception(e)
+    finally:
+        with in_flight_lock:
+            del in_flight[url]
+
+    return future.result()
+
+
+def fetch_once(url):
+    if not cache_settings['directory']:
+        return fetch_uncached(url)
+
+    metadata = read_metadata(url)
+    content = read_object(metadata['content']) if metadata and metadata.get('content') else None
+
+    if cache_settings['offline']:
+        if metadata and (content is not None or metadata['status'] in NOT_FOUND_STATUSES):
+            return content
+        raise FileNotFoundError('Offline and no cached copy of: ' + url)
+
+    if metadata and is_fresh(metadata, content):
+        instrumentation.count('disk_cache_hits')
+        return content
+
+    headers = {}
+    if content is not None:
+        if metadata.get('etag'):
+            headers['If-None-Match'] = metadata['etag']
+        if metadata.get('last_modified'):
+            headers['If-Modified-Since'] = metadata['last_modified']
+
+    # Allow exceptions to be raised, i.e. connection failure etc... unless there is a stale copy to fall back on
+    try:
+        response = http_get(url, headers)
+    except requests.RequestException as e:
+        if content is None:
+            raise
+        return stale_content(url, content, type(e).__name__ + ': ' + str(e).split('\n')[0])
+
+    if response.status_code == 304 and content is not None:
+        metadata['fetched'] = time.time()
+        write_metadata(url, metadata)
+        return content
+
+    if response.ok:
+        write_metadata(url, {'url': url,
+                             'status': response.status_code,
+                             'content': write_object(response.content),
+                             'etag': response.headers.get('ETag'),
+                             'last_modified': response.headers.get('Last-Modified'),
+                             'fetched': time.time()})
+        return response.content.decode('utf-8')
+
+    if response.status_code in NOT_FOUND_STATUSES:
+        write_metadata(url, {'url': url,
+                             'status': response.status_code,
+                             'content': None,
+                             'fetched': time.time()})
+        return None
+
+    if content is not None:
+        return stale_content(url, content, 'HTTP ' + str(response.status_code))
+
+    return None
+
+
+def stale_content(url, content, reason):
+    # Not written back, so the next run tries to revalidate again
+    logger.warning('Unable to revalidate %s (%s), using the cached copy', url, reason)
+    instrumentation.count('stale_cache_hits')
+    return content
+
+
+def fetch_uncached(url):
+    if cache_settings['offline']:
+        raise FileNotFoundError('Offline and no definition cache directory set, unable to get: ' + url)
+
+    response = http_get(url)
+
+    if response.ok:
+        return response.content.decode('utf-8')
+
+    return None
+
+
+def http_get(url, headers=None):
+    with instrumentation.span('download', url=url):
+        response = get_session().get(url, headers=headers, timeout=http_settings['timeout'])
+
+    instrumentation.count('downloads')
+    instrumentation.count('bytes_downloaded', len(response.content))
+    return response
+
+
+def get_session():
+    # A forked process must not share the parent's connections
+    if http_session['session'] is None or http_session['pid'] != os.getpid():
+        retry = Retry(total=http_settings['retries'],
+                      backoff_factor=http_settings['backoff_factor'],
+                      status_forcelist=RETRY_STATUSES,
+                      allowed_methods=['GET'],
+                      raise_on_status=False)
+        adapter = HTTPAdapter(pool_connections=http_settings['pool_size'],
+                              pool_maxsize=http_settings['pool_size'],
+                              max_retries=retry)
+        session = requests.Session()
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        http_session['session'] = session
+        http_session['pid'] = os.getpid()
+
+    return http_session['session']
+
+
+def is_fresh(metadata, content):
+    age = time.time() - metadata.get('fetched', 0)
+
+    if metadata['status'] in NOT_FOUND_STATUSES:
+        return age < cache_settings['negative_ttl']
+
+    return content is not None and age < cache_settings['max_age']
+
+
+def read_metadata(url):
+    try:
+        with open(metadata_path(url)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        # Missing or unreadable, treat as not cached
+        return None
+
+
+def write_metadata(url, metadata):
+    atomic_write(metadata_path(url), json.dumps(metadata).encode('utf-8'))
+
+
+def read_object(digest):
+    try:
+        with open(object_path(digest), 'rb') as f:
+            content = f.read()
+    except OSError:
+        return None
+
+    # Protect against a truncated or tampered object, the name is the hash of the content
+    if hashlib.sha256(content).hexdigest() != digest:
+        return None
+
+    return content.decode('utf-8')
+
+
+def write_object(content):
+    digest = hashlib.sha256(content).hexdigest()
+
+    if not os.path.exists(object_path(digest)):
+        atomic_write(object_path(digest), content)
+
+    return digest
+
+
+def atomic_write(path, data):
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-')
+    try:
+        with os.fdopen(handle, 'wb') as f:
+            f.write(data)
+        os.replace(temp_path, path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def metadata_path(url):
+    return os.path.join(cache_settings['directory'], 'urls', hashlib.sha256(url.encode('utf-8')).hexdigest() + '.json')
+
+
+def object_path(digest):
+    return os.path.join(cache_settings['directory'], 'objects', digest + '.json')
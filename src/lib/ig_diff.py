@@ -0,0 +1,209 @@
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor
+from . import base_definitions
+from . import batch_diff
+from . import line_diff
+from . import profile_ancestors
+from . import profile_report
+from . import result_cache
+from .matrix_diff import element_status, SAME, DIFFERS, ADDED, REMOVED
+from .profile_corpus import get_corpus, profile_location, read_profile
+from .profile_elements import extract_elements, align_elements
+
+# Diffs two releases of an implementation guide, or any two corpora of profiles (see profile_corpus).
+# Profiles are paired by canonical url, then those left over by resource type and name, e.g. where the url
+# has changed.  Each pair is diffed over a process pool as in batch_diff, one report each, and the results
+# are combined in a summary with the profiles added and removed.  Profiles derived from others in either
+# guide have their bases from them (see profile_ancestors), the left-hand guide's where both have the url.
+SUMMARY_FILE = 'summary.md'
+SUMMARY_JSON_FILE = 'summary.json'
+
+MATCHED_BY_URL = 'url'
+MATCHED_BY_NAME = 'type+name'
+
+
+def ig_diff(left_path, right_path, output_dir, template, workers=None, definition_args=None, diff_engine=None):
+    os.makedirs(output_dir, exist_ok=True)
+
+    if definition_args is not None:
+        base_definitions.configure_definition_sources(definition_args)
+        profile_report.configure_template_cache(definition_args)
+        result_cache.configure(definition_args)
+
+    if diff_engine is not None:
+        line_diff.set_diff_engine(diff_engine)
+
+    left_corpus = get_corpus(left_path)
+    right_corpus = get_corpus(right_path)
+    profile_ancestors.add_ancestor_source(left_path)
+    profile_ancestors.add_ancestor_source(right_path)
+    pairs, removed, added = pair_profiles(left_corpus, right_corpus)
+
+    jobs = batch_diff.assign_report_files([prepare_pair(left_corpus, right_corpus, *pair) for pair in pairs],
+                                          template)
+    required = set()
+    for job in jobs:
+        required |= job.pop('required')
+    base_definitions.prefetch_definitions(required)
+
+    if workers is not None and workers <= 1:
+        results = [diff_pair(job, output_dir, template) for job in jobs]
+    else:
+        # The guides are ancestor sources in the workers too, see batch_diff.init_worker
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=batch_diff.init_worker,
+                                 initargs=(definition_args, base_definitions.export_cache(), diff_engine,
+                                           list(profile_ancestors.ancestor_sources))) as executor:
+            results = list(executor.map(diff_pair, jobs, [output_dir] * len(jobs), [template] * len(jobs)))
+
+    summary = get_summary(left_corpus, right_corpus, results,
+                          [profile_summary(left_corpus, e) for e in removed],
+                          [profile_summary(right_corpus, e) for e in added])
+    write_summary(summary, output_dir)
+    return summary
+
+
+# Returns the pairs (left, right, matched by) of index entries, then the left and right entries not paired
+def pair_profiles(left_corpus, right_corpus):
+    lefts = diffable_profiles(left_corpus)
+    rights = diffable_profiles(right_corpus)
+    right_urls = {e['url']: e for e in rights if e.get('url')}
+
+    pairs = []
+    paired = set()
+    unpaired = []
+    for left in lefts:
+        right = right_urls.get(left.get('url'))
+        if right is not None:
+            pairs.append((left, right, MATCHED_BY_URL))
+            paired.add(id(right))
+        else:
+            unpaired.append(left)
+
+    right_names = {}
+    for right in rights:
+        if id(right) not in paired:
+            right_names.setdefault((right.get('type'), right.get('name')), right)
+
+    removed = []
+    for left in unpaired:
+        right = right_names.pop((left.get('type'), left.get('name')), None)
+        if right is not None:
+            pairs.append((left, right, MATCHED_BY_NAME))
+            paired.add(id(right))
+        else:
+            removed.append(left)
+
+    return pairs, removed, [e for e in rights if id(e) not in paired]
+
+
+# Profiles with a differential, once each where the same url is in the corpus more than once
+def diffable_profiles(corpus):
+    return [e for e in corpus['entries']
+            if e.get('differential') and (not e.get('url') or corpus['urls'][e['url']] is e)]
+
+
+def prepare_pair(left_corpus, right_corpus, left, right, matched_by):
+    pair = {'left': profile_location(left_corpus, left),
+            'right': profile_location(right_corpus, right),
+            'leftversion': None,
+            'rightversion': None}
+    job = {'left_name': left.get('name') or left['type'], 'right_name': right.get('name') or right['type'],
+           'url': left.get('url'), 'matched_by': matched_by, 'error': None}
+
+    # Not comparable, e.g. a different resource type, is reported in the summary
+    try:
+        job.update(batch_diff.prepare_pair(pair))
+    except (ValueError, TypeError) as e:
+        job.update(pair, required=set(), error=type(e).__name__ + ': ' + str(e).split('\n')[0])
+
+    return job
+
+
+def diff_pair(job, output_dir, template):
+    result = {k: job[k] for k in ['left', 'right', 'left_name', 'right_name', 'url', 'matched_by', 'report',
+                                  'error']}
+    result['status'] = None
+    result['elements'] = None
+    if job['error']:
+        result['report'] = None
+        return result
+
+    # One bad pair should not lose the rest, the error is recorded in the summary
+    try:
+        left = read_profile(job['left'])[0]
+        right = read_profile(job['right'])[0]
+        result['elements'] = element_changes(left, right, job['leftversion'])
+        result['status'] = DIFFERS if any(result['elements'].values()) else SAME
+        profile_report.write_report(left, job['leftversion'], right, job['rightversion'],
+                                    template, os.path.join(output_dir, job['report']))
+    except Exception as e:
+        result['report'] = None
+        result['error'] = type(e).__name__ + ': ' + str(e).split('\n')[0]
+
+    return result
+
+
+# Number of differential elements added, removed and changed, as in the matrix_diff matrix
+def element_changes(left, right, version):
+    statuses = [element_status(e) for e in align_elements(extract_elements(left, version=version),
+                                                          extract_elements(right, version=version))]
+    return {'added': statuses.count(ADDED), 'removed': statuses.count(REMOVED), 'changed': statuses.count(DIFFERS)}
+
+
+def profile_summary(corpus, entry):
+    return {'name': entry.get('name'),
+            'url': entry.get('url'),
+            'version': entry.get('version'),
+            'type': entry.get('type'),
+            'location': profile_location(corpus, entry)}
+
+
+def get_summary(left_corpus, right_corpus, results, removed, added):
+    statuses = [r['status'] for r in results]
+    return {'left': left_corpus['path'],
+            'right': right_corpus['path'],
+            'profiles': {'paired': len(results),
+                         'changed': statuses.count(DIFFERS),
+                         'unchanged': statuses.count(SAME),
+                         'errors': len([r for r in results if r['error']]),
+                         'added': len(added),
+                         'removed': len(removed)},
+            'pairs': results,
+            'added': added,
+            'removed': removed}
+
+
+def write_summary(summary, output_dir):
+    with open(os.path.join(output_dir, SUMMARY_JSON_FILE), 'w') as f:
+        json.dump(summary, f, indent=2)
+
+    with open(os.path.join(output_dir, SUMMARY_FILE), 'w') as f:
+        f.write('# FHIR Implementation Guide Diff  \n')
+        f.write('**Lefthand:** ' + summary['left'] + '  \n')
+        f.write('**Righthand:** ' + summary['right'] + '  \n\n')
+        f.write('|Paired|Changed|Unchanged|Errors|Added|Removed|\n')
+        f.write('|----|----|----|----|----|----|\n')
+        f.write('|' + '|'.join(str(summary['profiles'][k]) for k in ['paired', 'changed', 'unchanged', 'errors',
+                                                                     'added', 'removed']) + '|\n\n')
+
+        f.write('## Changed and unchanged profiles  \n')
+        f.write('|Lefthand Profile|Righthand Profile|Matched By|Status|Elements Added|Elements Removed|'
+                'Elements Changed|Report|\n')
+        f.write('|----|----|----|----|----|----|----|----|\n')
+        for result in summary['pairs']:
+            elements = result['elements'] or {}
+            report = '[' + result['report'] + '](' + result['report'] + ')' if result['report'] else result['error']
+            f.write('|' + '|'.join([result['left_name'], result['right_name'], result['matched_by'],
+                                    result['status'] or '',
+                                    *[str(elements.get(k, '')) for k in ['added', 'removed', 'changed']],
+                                    report]) + '|\n')
+
+        for section in ['added', 'removed']:
+            if summary[section]:
+                f.write('\n## ' + section.capitalize() + ' profiles  \n')
+                f.write('|Profile|Type|Url|\n')
+                f.write('|----|----|----|\n')
+                for profile in summary[section]:
+                    f.write('|' + '|'.join(str(profile[k] or '') for k in ['name', 'type', 'url']) + '|\n')
@@ -0,0 +1,137 @@
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import nullcontext
+
+# Where a run spends its time.  Phases are timed with span (total time and number of calls per phase name),
+# count adds to named counters, and with tracing on every span is also kept as a trace event, nested by
+# thread, which can be written in the Chrome trace format (chrome://tracing, or https://ui.perfetto.dev).
+#
+# Off by default.  When off, span returns a shared do-nothing context manager and count returns straight
+# away, so leaving the calls in costs next to nothing.
+#
+#   instrumentation.enable(trace=True)
+#   with instrumentation.span('component_diff'):
+#       instrumentation.count('components_diffed')
+#   instrumentation.get_stats(), instrumentation.write_trace('trace.json')
+settings = {'enabled': False, 'trace': False}
+
+phases = {}
+counters = {}
+trace_events = []
+stats_lock = threading.Lock()
+thread_state = threading.local()
+NO_SPAN = nullcontext()
+
+
+# Takes the parsed arguments, see profile_args.add_instrumentation_args
+def configure(args):
+    if args.stats or args.stats_file or args.trace:
+        enable(trace=bool(args.trace))
+
+
+def enable(trace=False):
+    reset()
+    settings['enabled'] = True
+    settings['trace'] = trace
+
+
+def disable():
+    settings['enabled'] = False
+    settings['trace'] = False
+
+
+def reset():
+    with stats_lock:
+        phases.clear()
+        counters.clear()
+        trace_events.clear()
+
+
+def span(name, **trace_args):
+    if not settings['enabled']:
+        return NO_SPAN
+
+    return Span(name, trace_args)
+
+
+def count(name, n=1):
+    if not settings['enabled']:
+        return
+
+    with stats_lock:
+        counters[name] = counters.get(name, 0) + n
+
+
+class Span:
+    __slots__ = ('name', 'trace_args', 'start')
+
+    def __init__(self, name, trace_args):
+        self.name = name
+        self.trace_args = trace_args
+        self.start = None
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        thread_state.depth = getattr(thread_state, 'depth', 0) + 1
+        return self
+
+    def __exit__(self, *exc_info):
+        end = time.perf_counter()
+        thread_state.depth -= 1
+
+        with stats_lock:
+            phase = phases.setdefault(self.name, {'seconds': 0.0, 'calls': 0})
+            phase['seconds'] += end - self.start
+            phase['calls'] += 1
+            if settings['trace']:
+                trace_events.append({'name': self.name,
+                                     'ph': 'X',
+                                     'ts': self.start * 1000000,
+                                     'dur': (end - self.start) * 1000000,
+                                     'pid': os.getpid(),
+                                     'tid': threading.get_ident(),
+                                     'args': dict(self.trace_args, depth=thread_state.depth)})
+
+        return False
+
+
+def get_stats() -> dict:
+    with stats_lock:
+        return {'phases': {name: dict(phase) for name, phase in phases.items()},
+                'counters': dict(counters)}
+
+
+def get_trace() -> dict:
+    with stats_lock:
+        return {'traceEvents': list(trace_events), 'displayTimeUnit': 'ms'}
+
+
+# None writes to stderr, so it is kept apart from a report written to stdout
+def write_stats(filename=None):
+    write_json(get_stats(), filename)
+
+
+def write_trace(filename):
+    write_json(get_trace(), filename)
+
+
+def write_json(data, filename):
+    if filename is None:
+        json.dump(data, sys.stderr, indent=2)
+        sys.stderr.write('\n')
+    else:
+        with open(filename, 'w') as f:
+            json.dump(data, f, indent=2)
+
+
+# Takes the parsed arguments, writes whatever was asked for once the run is done
+def write_output(args):
+    if args.stats_file:
+        write_stats(args.stats_file)
+    elif args.stats:
+        write_stats()
+    if args.trace:
+        write_trace(args.trace)
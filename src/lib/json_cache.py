@@ -0,0 +1,85 @@
+from collections import OrderedDict
+from . import instrumentation
+from . import json_codec
+
+# Cache of the canonical (sorted keys, indent 2) serialization of json values, keyed on the value's
+# structural hash, so a value that turns up again (the same base component for every profile pair that
+# references it, a match rendered in more than one place, ...) is only serialized once per run.
+# Each entry keeps the value it was made from, a hit is only used if that is still equal to the value,
+# so a hash collision or a value changed since can never give the wrong text.  Least recently used
+# entries are evicted once max_entries is exceeded.  Scalars are not worth caching.
+#
+# Only worth it for json's pure Python encoder.  Finding the key hashes the whole value in Python, which
+# takes longer than orjson takes to serialize it, so with orjson (see json_codec) values are not cached.
+CACHED_CODECS = ['json']
+serialization_cache = OrderedDict()
+cache_limits = {'max_entries': 4096}
+cache_stats = {'hits': 0, 'misses': 0}
+
+
+def set_cache_limits(max_entries=None):
+    if max_entries is not None:
+        cache_limits['max_entries'] = max_entries
+
+    evict_serializations()
+
+
+def clear_cache():
+    serialization_cache.clear()
+    cache_stats['hits'] = 0
+    cache_stats['misses'] = 0
+
+
+# hashes can be the memo of a structural diff of the value, see json_tree_diff, to save hashing it again
+def canonical_json(value, hashes=None) -> str:
+    if not isinstance(value, (dict, list)) or json_codec.codec_settings['codec'] not in CACHED_CODECS:
+        return json_codec.dumps_pretty(value)
+
+    return cached_canonical_json(value, hashes)
+
+
+def cached_canonical_json(value, hashes=None) -> str:
+    value_hash = structural_hash(value, {} if hashes is None else hashes)
+    entry = serialization_cache.get(value_hash)
+    if entry is not None and entry[0] == value:
+        serialization_cache.move_to_end(value_hash)
+        cache_stats['hits'] += 1
+        instrumentation.count('serialization_cache_hits')
+        return entry[1]
+
+    text = json_codec.dumps_pretty(value)
+    cache_stats['misses'] += 1
+    instrumentation.count('serialization_cache_misses')
+    serialization_cache[value_hash] = (value, text)
+    evict_serializations()
+
+    return text
+
+
+def evict_serializations():
+    while len(serialization_cache) > cache_limits['max_entries']:
+        serialization_cache.popitem(last=False)
+
+
+# Hash of the value's structure and contents, memoised on the object for the length of one diff
+def structural_hash(value, hashes):
+    value_id = id(value)
+    if value_id in hashes:
+        return hashes[value_id]
+
+    if isinstance(value, dict):
+        h = hash(('dict', tuple(sorted((k, structural_hash(v, hashes)) for k, v in value.items()))))
+    elif isinstance(value, list):
+        h = hash(('list', tuple(structural_hash(v, hashes) for v in value)))
+    else:
+        h = hash((type(value).__name__, value))
+
+    if isinstance(value, (dict, list)):
+        hashes[value_id] = h
+
+    return h
+
+
+# Different values can have the same hash (hash(-1) == hash(-2)), so equal hashes are only confirmed by comparing
+def same_value(left, right, hashes):
+    return structural_hash(left, hashes) == structural_hash(right, hashes) and left == right
@@ -0,0 +1,122 @@
+import codecs
+import json
+import re
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# JSON parsing, and the canonical serialization (sorted keys, indent 2) reports show values in, for profiles,
+# base definitions and packages.  orjson is used if it is installed, json's indented output is written by
+# its pure Python encoder, orjson's is many times quicker.  Output is the same byte for byte whichever codec
+# is used, orjson's output is checked for where the two can differ
+#
+#   - non-ASCII text, json escapes it (\u00e9), orjson writes UTF-8.  Escaped afterwards in the same way, by
+#     an encoding error handler, so it is only called for the non-ASCII characters.
+#   - floats Python writes with an exponent (1e+16, 1e-05), orjson writes 1e16, 0.00001
+#   - null, as orjson also writes null for NaN and Infinity
+#   - anything orjson will not serialize, i.e. ints over 64 bits, non-str keys, tuple subclasses
+#
+# and json is used for that value instead.  For parsing, json is used for
+#
+#   - anything orjson rejects (NaN, Infinity, lone surrogates...), so errors are json's
+#   - runs of 19 or more digits, as orjson reads ints over 64 bits as floats
+#
+# The checks are on the bytes as a whole, mapped to a few classes of character with bytes.translate then
+# searched for fixed strings, as a regular expression over all of it is slower than the parse.  Only the
+# lines a number check finds are then looked at in full.  A check can match inside a string, which only
+# means json is used when it did not need to be.
+DEFAULT_CODEC = 'orjson' if orjson is not None else 'json'
+
+codec_settings = {'codec': DEFAULT_CODEC}
+
+# Digits -> 0, for the digit runs
+DIGIT_CLASSES = bytes(b'0'[0] if b in b'0123456789' else b' '[0] for b in range(256))
+LONG_DIGIT_RUN = b'0' * 19
+# Digits -> 0, keeping e/E and ., for any number orjson writes differently
+NUMBER_CLASSES = bytes(b'0'[0] if b in b'0123456789' else b'e'[0] if b in b'eE' else b if b == b'.'[0] else b' '[0]
+                       for b in range(256))
+NUMBER_DIFFERENCES = [b'0e', b'0.0000']
+# A line of orjson's output with a number value.  A json string can not span lines.
+NUMBER_LINE = re.compile(rb' *(?:"(?:[^"\\]|\\.)*": )?-?[0-9][0-9.eE+-]*,?')
+ESCAPE_ERRORS = 'fhir_structure_diff_json_escape'
+
+
+def set_codec(codec):
+    if codec not in CODECS:
+        raise ValueError('Unknown JSON codec: ' + str(codec) + '. Available: ' + ', '.join(CODECS))
+
+    codec_settings['codec'] = codec
+
+
+# text is a str, or bytes in UTF-8
+def loads(text):
+    return CODECS[codec_settings['codec']][0](text)
+
+
+def dumps_pretty(value) -> str:
+    return CODECS[codec_settings['codec']][1](value)
+
+
+def json_loads(text):
+    return json.loads(text)
+
+
+def json_dumps_pretty(value) -> str:
+    return json.dumps(value, indent=2, sort_keys=True)
+
+
+def orjson_loads(text):
+    digits = text.encode('utf-8') if isinstance(text, str) else text
+    if LONG_DIGIT_RUN in digits.translate(DIGIT_CLASSES):
+        return json.loads(text)
+
+    try:
+        return orjson.loads(text)
+    except orjson.JSONDecodeError:
+        return json.loads(text)
+
+
+def orjson_dumps_pretty(value) -> str:
+    try:
+        text = orjson.dumps(value, option=orjson.OPT_INDENT_2 | orjson.OPT_SORT_KEYS)
+    except orjson.JSONEncodeError:
+        return json_dumps_pretty(value)
+
+    if b'null' in text or has_exponent_floats(text):
+        return json_dumps_pretty(value)
+
+    if text.isascii() and b'\x7f' not in text:
+        return text.decode('ascii')
+
+    # DEL is ASCII, but json escapes it
+    return text.decode('utf-8').encode('ascii', ESCAPE_ERRORS).decode('ascii').replace('\x7f', '\\u007f')
+
+
+def has_exponent_floats(text) -> bool:
+    number_classes = text.translate(NUMBER_CLASSES)
+    for difference in NUMBER_DIFFERENCES:
+        position = number_classes.find(difference)
+        while position != -1:
+            line_start = text.rfind(b'\n', 0, position) + 1
+            line_end = text.find(b'\n', position)
+            line_end = len(text) if line_end == -1 else line_end
+            if NUMBER_LINE.fullmatch(text, line_start, line_end):
+                return True
+            position = number_classes.find(difference, line_end)
+
+    return False
+
+
+def escape_errors(error):
+    return json.encoder.encode_basestring_ascii(error.object[error.start:error.end])[1:-1], error.end
+
+
+codecs.register_error(ESCAPE_ERRORS, escape_errors)
+
+
+# Name -> (loads, dumps_pretty)
+CODECS = {'json': (json_loads, json_dumps_pretty)}
+if orjson is not None:
+    CODECS['orjson'] = (orjson_loads, orjson_dumps_pretty)
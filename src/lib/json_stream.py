@@ -0,0 +1,151 @@
+import mmap
+import re
+from contextlib import contextmanager
+from . import json_codec
+
+# Reads selected parts of a JSON document from a memory mapped file, without parsing (or reading into memory)
+# the rest of it.  Values that are not wanted are skipped over by a regular expression that jumps from one
+# bracket to the next, past whole strings, so the parse is only of the wanted values, one at a time, by
+# json_codec.
+#
+# A reader is a function (buffer, position) -> (value, end position), for the value starting at position.
+# read_object and read_array are built from the readers for an object's members or an array's items, e.g.
+#
+#   read_object(buffer, 0, {'name': read_value,
+#                           'items': lambda b, p: read_array(b, p, read_value)})
+#
+# reads only the name and items of the top level object, each item parsed on its own.  Skipped values are
+# not checked as JSON, only enough to find where they end.
+WHITESPACE = re.compile(rb'[ \t\n\r]*')
+STRING = re.compile(rb'"[^"\\]*(?:\\.[^"\\]*)*"')
+# Numbers, true, false and null
+LITERAL = re.compile(rb'[^,:}\] \t\n\r]+')
+# Everything up to the next bracket, including whole strings
+TO_BRACKET = re.compile(rb'[^"{}\[\]]*(?:"[^"\\]*(?:\\.[^"\\]*)*"[^"{}\[\]]*)*')
+
+OPEN_OBJECT, CLOSE_OBJECT, OPEN_ARRAY, CLOSE_ARRAY = b'{}[]'
+QUOTE, COLON, COMMA = b'":,'
+DEPTH_CHANGE = {OPEN_OBJECT: 1, OPEN_ARRAY: 1, CLOSE_OBJECT: -1, CLOSE_ARRAY: -1}
+
+
+@contextmanager
+def open_buffer(filename):
+    with open(filename, 'rb') as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as buffer:
+        yield buffer
+
+
+def read_document(filename, reader):
+    with open_buffer(filename) as buffer:
+        return read_buffer(buffer, reader, filename)
+
+
+# buffer is anything bytes like, i.e. bytes or an mmap.  name is for errors.
+def read_buffer(buffer, reader, name):
+    try:
+        value, end = reader(buffer, skip_whitespace(buffer, 0))
+    except IndexError:
+        raise ValueError('Unexpected end of JSON in ' + name)
+
+    if skip_whitespace(buffer, end) != len(buffer):
+        raise ValueError('Extra data after JSON in ' + name + ' at byte ' + str(end))
+
+    return value
+
+
+def skip_whitespace(buffer, position):
+    return WHITESPACE.match(buffer, position).end()
+
+
+def expect(buffer, position, character):
+    if buffer[position] != character:
+        raise ValueError('Expected ' + chr(character) + ' at byte ' + str(position) + ', found ' +
+                         repr(chr(buffer[position])))
+
+
+def skip_value(buffer, position):
+    first = buffer[position]
+    if first == QUOTE:
+        return match_end(STRING, buffer, position)
+    if first not in (OPEN_OBJECT, OPEN_ARRAY):
+        return match_end(LITERAL, buffer, position)
+
+    depth = 0
+    while True:
+        bracket = buffer[position]
+        if bracket not in DEPTH_CHANGE:
+            raise ValueError('Unterminated string at byte ' + str(position))
+        depth += DEPTH_CHANGE[bracket]
+        if depth == 0:
+            return position + 1
+        position = TO_BRACKET.match(buffer, position + 1).end()
+
+
+def match_end(pattern, buffer, position):
+    match = pattern.match(buffer, position)
+    if match is None:
+        raise ValueError('Invalid JSON value at byte ' + str(position))
+
+    return match.end()
+
+
+# The value parsed in full
+def read_value(buffer, position):
+    end = skip_value(buffer, position)
+    return json_codec.loads(buffer[position:end]), end
+
+
+def read_object(buffer, position, readers):
+    expect(buffer, position, OPEN_OBJECT)
+    value = {}
+    position = skip_whitespace(buffer, position + 1)
+    if buffer[position] == CLOSE_OBJECT:
+        return value, position + 1
+
+    while True:
+        expect(buffer, position, QUOTE)
+        end = match_end(STRING, buffer, position)
+        key = json_codec.loads(buffer[position:end])
+        position = skip_whitespace(buffer, end)
+        expect(buffer, position, COLON)
+        position = skip_whitespace(buffer, position + 1)
+
+        if key in readers:
+            value[key], position = readers[key](buffer, position)
+        else:
+            position = skip_value(buffer, position)
+
+        position = skip_whitespace(buffer, position)
+        if buffer[position] == CLOSE_OBJECT:
+            return value, position + 1
+        expect(buffer, position, COMMA)
+        position = skip_whitespace(buffer, position + 1)
+
+
+def read_array(buffer, position, item_reader):
+    expect(buffer, position, OPEN_ARRAY)
+    value = []
+    position = skip_whitespace(buffer, position + 1)
+    if buffer[position] == CLOSE_ARRAY:
+        return value, position + 1
+
+    while True:
+        item, position = item_reader(buffer, position)
+        value.append(item)
+
+        position = skip_whitespace(buffer, position)
+        if buffer[position] == CLOSE_ARRAY:
+            return value, position + 1
+        expect(buffer, position, COMMA)
+        position = skip_whitespace(buffer, position + 1)
+
+
+# Reader for objects keeping only the given members, each object parsed in full then reduced, for many
+# small objects of which a few members are wanted
+def member_reader(keys):
+    def read_members(buffer, position):
+        value, end = read_value(buffer, position)
+        if isinstance(value, dict):
+            value = {k: value[k] for k in keys if k in value}
+        return value, end
+
+    return read_members
@@ -0,0 +1,237 @@
+import json
+from .json_cache import canonical_json, same_value, structural_hash
+from .line_diff import myers_diff, group_changes
+
+# Structural diff of two JSON values.  Walks both trees together, skipping any subtree that is the same on
+# both sides, found by its structural hash and confirmed by comparing.  List items are matched on a key field
+# where every item has a unique one (e.g. "key" for constraints, "code" for types), so reordering is not a
+# change, otherwise on their hashes with a Myers diff.
+#
+# One walk (walk_diff) gives both the path level operations and, rendered from each as it is found, the same
+# changes as a full context line diff of the pretty printed json (as profile_diff.json_pretty), for the
+# existing report format.  tree_diff returns the operations, render_diff the lines.
+LIST_ITEM_KEYS = ['key', 'code', 'url', 'id', 'path']
+INDENT = '  '
+
+ADD = 'add'
+REMOVE = 'remove'
+CHANGE = 'change'
+
+
+def tree_diff(left, right) -> list:
+    return walk_diff(left, right)[0]
+
+
+def render_diff(left, right) -> list:
+    return group_changes(walk_diff(left, right)[1])
+
+
+# The one walk of both trees, returns the path level operations and the lines rendered for each as it is found
+def walk_diff(left, right):
+    ops = []
+    lines = []
+    diff_value(left, right, '', '', '', None, ops, lines, {})
+
+    return ops, lines
+
+
+def diff_value(left, right, path, indent, prefix, comma_left_right, ops, lines, hashes):
+    left_comma, right_comma = comma_left_right if comma_left_right else ('', '')
+
+    if same_value(left, right, hashes):
+        value_lines = pretty_lines(left, indent, prefix, '', hashes)
+        lines.extend((' ', line) for line in value_lines[:-1])
+        if left_comma == right_comma:
+            lines.append((' ', value_lines[-1] + left_comma))
+        else:
+            lines.append(('-', value_lines[-1] + left_comma))
+            lines.append(('+', value_lines[-1] + right_comma))
+
+    elif isinstance(left, dict) and isinstance(right, dict):
+        # Against an empty object, every key is added or removed, but the object is shown replaced whole
+        render_keys = bool(left and right)
+        if render_keys:
+            lines.append((' ', indent + prefix + '{'))
+        left_keys = sorted(left)
+        right_keys = sorted(right)
+        for key in sorted(set(left) | set(right)):
+            key_path = path + '.' + key if path else key
+            key_prefix = json.dumps(key) + ': '
+            left_comma = ',' if key in left and key != left_keys[-1] else ''
+            right_comma = ',' if key in right and key != right_keys[-1] else ''
+            if key not in right:
+                ops.append({'op': REMOVE, 'path': key_path, 'left': left[key]})
+                if render_keys:
+                    lines.extend(('-', line)
+                                 for line in pretty_lines(left[key], indent + INDENT, key_prefix, left_comma, hashes))
+            elif key not in left:
+                ops.append({'op': ADD, 'path': key_path, 'right': right[key]})
+                if render_keys:
+                    lines.extend(('+', line)
+                                 for line in pretty_lines(right[key], indent + INDENT, key_prefix, right_comma, hashes))
+            else:
+                diff_value(left[key], right[key], key_path, indent + INDENT, key_prefix, (left_comma, right_comma),
+                           ops, lines, hashes)
+        if render_keys:
+            append_closing(lines, indent + '}', comma_left_right)
+        else:
+            render_replaced(left, right, indent, prefix, comma_left_right, lines, hashes)
+
+    elif isinstance(left, list) and isinstance(right, list):
+        # As for objects, against an empty list the list is shown replaced whole
+        render_items = bool(left and right)
+        if render_items:
+            lines.append((' ', indent + prefix + '['))
+        matches = match_list_items(left, right, hashes)
+        # Keyed items are shown in left order, so each side's comma depends on what follows it here, not its index
+        last_left = max((n for n, (tag, i, j) in enumerate(matches) if i is not None), default=-1)
+        last_right = max((n for n, (tag, i, j) in enumerate(matches) if j is not None), default=-1)
+        for n, (tag, i, j) in enumerate(matches):
+            left_comma = ',' if i is not None and n < last_left else ''
+            right_comma = ',' if j is not None and n < last_right else ''
+            if tag == '-':
+                ops.append({'op': REMOVE, 'path': item_path(path, left[i], i, left, hashes), 'left': left[i]})
+                if render_items:
+                    lines.extend(('-', line)
+                                 for line in pretty_lines(left[i], indent + INDENT, '', left_comma, hashes))
+            elif tag == '+':
+                ops.append({'op': ADD, 'path': item_path(path, right[j], j, right, hashes), 'right': right[j]})
+                if render_items:
+                    lines.extend(('+', line)
+                                 for line in pretty_lines(right[j], indent + INDENT, '', right_comma, hashes))
+            else:
+                diff_value(left[i], right[j], item_path(path, left[i], i, left, hashes), indent + INDENT, '',
+                           (left_comma, right_comma), ops, lines, hashes)
+        if render_items:
+            append_closing(lines, indent + ']', comma_left_right)
+        else:
+            render_replaced(left, right, indent, prefix, comma_left_right, lines, hashes)
+
+    else:
+        ops.append({'op': CHANGE, 'path': path, 'left': left, 'right': right})
+        render_replaced(left, right, indent, prefix, comma_left_right, lines, hashes)
+
+
+def render_replaced(left, right, indent, prefix, comma_left_right, lines, hashes):
+    left_comma, right_comma = comma_left_right if comma_left_right else ('', '')
+    lines.extend(('-', line) for line in pretty_lines(left, indent, prefix, left_comma, hashes))
+    lines.extend(('+', line) for line in pretty_lines(right, indent, prefix, right_comma, hashes))
+
+
+def item_path(path, item, index, items, hashes):
+    key = get_list_key(items, hashes)
+    if key:
+        return path + '[' + key + '=' + str(item[key]) + ']'
+
+    return path + '[' + str(index) + ']'
+
+
+# Returns (tag, left index, right index), where tag is ' ' for a pair of items to compare, '-' left only, '+' right only
+def match_list_items(left, right, hashes) -> list:
+    key = get_list_key(left, hashes) if left else get_list_key(right, hashes)
+    if key and (not left or not right or key == get_list_key(right, hashes)):
+        right_index = {item[key]: j for j, item in enumerate(right)}
+        left_keys = {item[key] for item in left}
+        matches = [(' ', i, right_index[item[key]]) if item[key] in right_index else ('-', i, None)
+                   for i, item in enumerate(left)]
+        matches.extend(('+', None, j) for j, item in enumerate(right) if item[key] not in left_keys)
+        return matches
+
+    matches = []
+    removed = []
+    added = []
+
+    # Equal on hash and value, the index is carried along
+    for tag, (h, index, item) in myers_diff([HashedItem(structural_hash(item, hashes), i, item)
+                                             for i, item in enumerate(left)],
+                                            [HashedItem(structural_hash(item, hashes), j, item)
+                                             for j, item in enumerate(right)]):
+        if tag == '-':
+            removed.append(index)
+        elif tag == '+':
+            added.append(index)
+        else:
+            matches.extend(pair_changes(removed, added))
+            removed, added = [], []
+            matches.append((' ', index, None))
+    matches.extend(pair_changes(removed, added))
+
+    return fill_right_indexes(matches, len(right))
+
+
+# Changed items in a run are compared pairwise, any left over are removed or added
+def pair_changes(removed, added) -> list:
+    pairs = [(' ', i, j) for i, j in zip(removed, added)]
+    pairs.extend(('-', i, None) for i in removed[len(added):])
+    pairs.extend(('+', None, j) for j in added[len(removed):])
+
+    return pairs
+
+
+def fill_right_indexes(matches, right_length) -> list:
+    # Unchanged items are in step, so the right index follows on from the previous right index
+    filled = []
+    next_right = 0
+    for tag, i, j in matches:
+        if tag == ' ' and j is None:
+            j = next_right
+        if j is not None:
+            next_right = j + 1
+        filled.append((tag, i, j))
+
+    return filled
+
+
+class HashedItem(tuple):
+    # Compared on the hash, then the item where the hashes are the same, carries the index along for the result
+    def __new__(cls, h, index, item):
+        return super().__new__(cls, (h, index, item))
+
+    def __eq__(self, other):
+        return self[0] == other[0] and self[2] == other[2]
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __hash__(self):
+        return hash(self[0])
+
+
+def get_list_key(items, hashes):
+    cache_key = ('key', id(items))
+    if cache_key not in hashes:
+        hashes[cache_key] = find_list_key(items)
+
+    return hashes[cache_key]
+
+
+def find_list_key(items):
+    if not items or not all(isinstance(item, dict) for item in items):
+        return None
+
+    for key in LIST_ITEM_KEYS:
+        values = [item.get(key) for item in items]
+        if all(isinstance(v, (str, int)) and not isinstance(v, bool) for v in values) and \
+                len(set(values)) == len(values):
+            return key
+
+    return None
+
+
+def append_closing(lines, closing, comma_left_right):
+    left_comma, right_comma = comma_left_right if comma_left_right else ('', '')
+
+    if left_comma == right_comma:
+        lines.append((' ', closing + left_comma))
+    else:
+        # Only one side has a following item
+        lines.append(('-', closing + left_comma))
+        lines.append(('+', closing + right_comma))
+
+
+def pretty_lines(value, indent, prefix, comma, hashes) -> list:
+    value_lines = canonical_json(value, hashes).splitlines()
+    value_lines = [indent + prefix + value_lines[0]] + [indent + line for line in value_lines[1:]]
+    value_lines[-1] = value_lines[-1] + comma
+
+    return value_lines
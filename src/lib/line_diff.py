@@ -0,0 +1,142 @@
+import difflib
+
+# Line diff engines for profile_diff.list_diff.  Each engine takes two lists of lines and returns the
+# full edit script as (tag, line) tuples, tag is ' ', '-' or '+', with every run of changes ordered
+# removals first then additions.
+#
+# myers   - Myers' O((N+M)D) algorithm, linear space (middle snake), after stripping the common prefix
+#           and suffix.  Finds a minimal diff, and is quick for the usual case of a few changes.
+# difflib - difflib.SequenceMatcher, the original engine.  Not always minimal.
+DEFAULT_ENGINE = 'myers'
+
+engine_settings = {'engine': DEFAULT_ENGINE}
+
+
+def set_diff_engine(engine):
+    if engine not in DIFF_ENGINES:
+        raise ValueError('Unknown diff engine: ' + str(engine) + '. Available: ' + ', '.join(DIFF_ENGINES))
+
+    engine_settings['engine'] = engine
+
+
+def diff_lines(left, right) -> list:
+    return DIFF_ENGINES[engine_settings['engine']](left, right)
+
+
+def difflib_diff(left, right) -> list:
+    ops = []
+    matcher = difflib.SequenceMatcher(None, left, right)
+
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.extend((' ', line) for line in left[i1:i2])
+        else:
+            ops.extend(('-', line) for line in left[i1:i2])
+            ops.extend(('+', line) for line in right[j1:j2])
+
+    return ops
+
+
+def myers_diff(left, right) -> list:
+    ops = []
+    myers_section(left, right, 0, len(left), 0, len(right), ops)
+
+    return group_changes(ops)
+
+
+def myers_section(a, b, a_lo, a_hi, b_lo, b_hi, ops):
+    while a_lo < a_hi and b_lo < b_hi and a[a_lo] == b[b_lo]:
+        ops.append((' ', a[a_lo]))
+        a_lo += 1
+        b_lo += 1
+
+    suffix_hi = a_hi
+    while a_lo < a_hi and b_lo < b_hi and a[a_hi - 1] == b[b_hi - 1]:
+        a_hi -= 1
+        b_hi -= 1
+
+    if a_lo == a_hi:
+        ops.extend(('+', b[j]) for j in range(b_lo, b_hi))
+    elif b_lo == b_hi:
+        ops.extend(('-', a[i]) for i in range(a_lo, a_hi))
+    else:
+        x, y, u, v = middle_snake(a, b, a_lo, a_hi, b_lo, b_hi)
+        myers_section(a, b, a_lo, x, b_lo, y, ops)
+        ops.extend((' ', a[i]) for i in range(x, u))
+        myers_section(a, b, u, a_hi, v, b_hi, ops)
+
+    ops.extend((' ', a[i]) for i in range(a_hi, suffix_hi))
+
+
+# Finds the middle snake of an optimal edit path, searching forwards from the start and backwards from
+# the end until they overlap.  Returns the snake as (x, y, u, v), the start and end in a and b.
+def middle_snake(a, b, a_lo, a_hi, b_lo, b_hi):
+    n = a_hi - a_lo
+    m = b_hi - b_lo
+    delta = n - m
+    odd = delta % 2 != 0
+    max_d = (n + m + 1) // 2
+    offset = max_d + 1
+    forward = [0] * (2 * offset + 1)
+    backward = [0] * (2 * offset + 1)
+
+    for d in range(max_d + 1):
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and forward[offset + k - 1] < forward[offset + k + 1]):
+                x = forward[offset + k + 1]
+            else:
+                x = forward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_lo + x] == b[b_lo + y]:
+                x += 1
+                y += 1
+            forward[offset + k] = x
+
+            if odd and delta - (d - 1) <= k <= delta + (d - 1) and x + backward[offset + delta - k] >= n:
+                return a_lo + start_x, b_lo + start_y, a_lo + x, b_lo + y
+
+        for k in range(-d, d + 1, 2):
+            if k == -d or (k != d and backward[offset + k - 1] < backward[offset + k + 1]):
+                x = backward[offset + k + 1]
+            else:
+                x = backward[offset + k - 1] + 1
+            y = x - k
+            start_x, start_y = x, y
+            while x < n and y < m and a[a_hi - 1 - x] == b[b_hi - 1 - y]:
+                x += 1
+                y += 1
+            backward[offset + k] = x
+
+            if not odd and -d <= delta - k <= d and x + forward[offset + delta - k] >= n:
+                return a_hi - x, b_hi - y, a_hi - start_x, b_hi - start_y
+
+    raise ValueError('No middle snake found, this should not happen')
+
+
+# Orders each run of changes as all removals then all additions, as difflib does
+def group_changes(ops) -> list:
+    grouped = []
+    removed = []
+    added = []
+
+    for op in ops:
+        if op[0] == '-':
+            removed.append(op)
+        elif op[0] == '+':
+            added.append(op)
+        else:
+            grouped.extend(removed)
+            grouped.extend(added)
+            removed.clear()
+            added.clear()
+            grouped.append(op)
+
+    grouped.extend(removed)
+    grouped.extend(added)
+
+    return grouped
+
+
+DIFF_ENGINES = {'myers': myers_diff,
+                'difflib': difflib_diff}
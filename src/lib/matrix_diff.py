@@ -0,0 +1,193 @@
+import argparse
+import json
+import os
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+from . import base_definitions
+from . import batch_diff
+from . import instrumentation
+from . import line_diff
+from . import profile_ancestors
+from . import profile_diff
+from . import profile_report
+from .profile_args import check_resource_properties
+from .profile_elements import extract_elements, align_elements
+from .profile_corpus import read_profile
+
+# Diffs one (left) profile against many right profiles, e.g. a national base against each supplier
+# profile.  The left profile is prepared once: its elements extracted, and the base component of each
+# of its elements looked up, then each right profile is read and diffed against it in turn, or over a
+# process pool, one report each.  The results are combined in a matrix of element against right profile.
+MATRIX_FILE = 'matrix.md'
+MATRIX_JSON_FILE = 'matrix.json'
+
+SAME = 'Same'
+DIFFERS = 'Differs'
+ADDED = 'Added'
+REMOVED = 'Removed'
+
+# base_components is the memo for base_definitions.get_base_component_memo
+PreparedProfile = namedtuple('PreparedProfile', ['profile', 'version', 'elements', 'element_ids', 'base_components'])
+
+# The prepared left profile, set in each worker
+worker_state = {'left': None}
+
+
+def prepare_profile(profile, version) -> PreparedProfile:
+    with instrumentation.span('prepare_profile'):
+        base_definitions.prefetch_definitions(base_definitions.required_definitions(profile, version))
+        elements = extract_elements(profile, version=version)
+        # Read before any workers are forked, so each has them
+        profile_ancestors.get_ancestors(profile, version)
+        base_components = {}
+        for element in align_elements(elements, {}):
+            for component in align_elements(element.left, {}):
+                if component.key not in profile_diff.IGNORED_COMPONENTS:
+                    base_definitions.get_base_component_memo(base_components, element, component.key, version)
+
+    return PreparedProfile(profile,
+                           version,
+                           elements,
+                           [e['id'] for e in profile['differential']['element'] if 'id' in e],
+                           base_components)
+
+
+def matrix_diff(left_file, right_files, output_dir, template, workers=None, definition_args=None,
+                left_version=None, diff_engine=None):
+    os.makedirs(output_dir, exist_ok=True)
+
+    if definition_args is not None:
+        base_definitions.configure_definition_sources(definition_args)
+        profile_report.configure_template_cache(definition_args)
+
+    if diff_engine is not None:
+        line_diff.set_diff_engine(diff_engine)
+
+    left, left_ver, left_name, left_type = read_profile(left_file)
+    if not left_ver and not left_version:
+        raise ValueError("Left version is not supplied in the StructureDefinition and must be supplied.\n"
+                         "Supplied left version: " + left_file + "\n")
+    left_ver = left_ver if left_ver else str(left_version)
+
+    # Rights are only read here to check them and find the definitions they need, one at a time
+    jobs = []
+    required = set()
+    for right_file in right_files:
+        job, right_required = prepare_right(left_file, left_ver, left_type, right_file)
+        jobs.append(dict(job, left_name=left_name))
+        required |= right_required
+    jobs = batch_diff.assign_report_files(jobs, template)
+
+    base_definitions.prefetch_definitions(required)
+    prepared = prepare_profile(left, left_ver)
+
+    if workers is not None and workers <= 1:
+        worker_state['left'] = prepared
+        results = [diff_right(job, output_dir, template) for job in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers,
+                                 initializer=init_worker,
+                                 initargs=(definition_args, base_definitions.export_cache(), diff_engine,
+                                           prepared, list(profile_ancestors.ancestor_sources))) as executor:
+            results = list(executor.map(diff_right, jobs, [output_dir] * len(jobs), [template] * len(jobs)))
+
+    matrix = get_matrix(prepared, left_name, results)
+    write_matrix(matrix, output_dir)
+    return matrix
+
+
+def prepare_right(left_file, left_ver, left_type, right_file):
+    job = {'right': right_file, 'right_name': os.path.basename(right_file), 'leftversion': None,
+           'rightversion': None, 'error': None}
+    try:
+        right, right_ver, right_name, right_type = read_profile(right_file)
+        versions = argparse.Namespace(leftprofile=left_file, rightprofile=right_file,
+                                      leftversion=None, rightversion=None)
+        job['leftversion'], job['rightversion'] = check_resource_properties(left_type, right_type, left_ver,
+                                                                            right_ver, versions)
+        job['right_name'] = right_name
+        return job, base_definitions.required_definitions(right, job['leftversion'])
+    except (ValueError, TypeError, NotImplementedError, OSError) as e:
+        # Missing, unreadable or not comparable with the left, reported in the matrix
+        job['error'] = type(e).__name__ + ': ' + str(e).split('\n')[0]
+        return job, set()
+
+
+def init_worker(definition_args, cache_entries, diff_engine, prepared, ancestor_sources=()):
+    batch_diff.init_worker(definition_args, cache_entries, diff_engine, ancestor_sources)
+    worker_state['left'] = prepared
+
+
+def diff_right(job, output_dir, template):
+    left = worker_state['left']
+    result = {'right': job['right'],
+              'right_name': job['right_name'],
+              'report': None,
+              'error': job['error'],
+              'elements': {}}
+    if job['error']:
+        return result
+
+    # One bad profile should not lose the rest, the error is recorded in the matrix
+    try:
+        with instrumentation.span('diff_right', right=job['right']):
+            right = read_profile(job['right'])[0]
+            right_elements = extract_elements(right, version=left.version)
+            aligned = align_elements(left.elements, right_elements)
+            result['elements'] = {element.key: element_status(element) for element in aligned}
+
+            element_level_diff = profile_diff.element_diff(left.profile, right)
+            ancestors = profile_ancestors.common_ancestors(left.profile, right, left.version)
+            component_level_diff = profile_diff.detailed_diff(left.elements, right_elements, left.version,
+                                                              left.base_components, ancestors)
+            report = profile_report.get_diff_report(left.profile, left.version, right, job['rightversion'],
+                                                    element_level_diff, component_level_diff)
+            profile_report.render_report(report, template, os.path.join(output_dir, job['report']))
+        result['report'] = job['report']
+    except Exception as e:
+        result['error'] = type(e).__name__ + ': ' + str(e).split('\n')[0]
+
+    return result
+
+
+def element_status(element):
+    if not element.left:
+        return ADDED
+    if not element.right:
+        return REMOVED
+
+    left = {k: v for k, v in element.left.items() if k not in profile_diff.IGNORED_COMPONENTS}
+    right = {k: v for k, v in element.right.items() if k not in profile_diff.IGNORED_COMPONENTS}
+    return SAME if left == right else DIFFERS
+
+
+# Rows are the left element ids in order, then the ids only in right profiles in the order first seen
+def get_matrix(prepared, left_name, results):
+    element_ids = list(prepared.element_ids)
+    seen = set(element_ids)
+    for result in results:
+        for element_id in result['elements']:
+            if element_id not in seen:
+                seen.add(element_id)
+                element_ids.append(element_id)
+
+    return {'left': left_name,
+            'rights': [{k: result[k] for k in ['right', 'right_name', 'report', 'error']} for result in results],
+            'elements': [{'id': element_id,
+                          'results': [result['elements'].get(element_id, '') for result in results]}
+                         for element_id in element_ids]}
+
+
+def write_matrix(matrix, output_dir):
+    with open(os.path.join(output_dir, MATRIX_JSON_FILE), 'w') as f:
+        json.dump(matrix, f, indent=2)
+
+    with open(os.path.join(output_dir, MATRIX_FILE), 'w') as f:
+        f.write('# FHIR Profile Diff Matrix  \n')
+        f.write('**Lefthand Profile:** ' + matrix['left'] + '  \n\n')
+        f.write('|Element|' + '|'.join(right['right_name'] for right in matrix['rights']) + '|\n')
+        f.write('|----|' + '----|' * len(matrix['rights']) + '\n')
+        f.write('|Report|' + '|'.join('[' + right['report'] + '](' + right['report'] + ')' if right['report']
+                                      else right['error'] for right in matrix['rights']) + '|\n')
+        for element in matrix['elements']:
+            f.write('|' + element['id'] + '|' + '|'.join(element['results']) + '|\n')
@@ -0,0 +1,137 @@
+import os
+import tarfile
+import threading
+from . import json_codec
+
+# Reads definitions from FHIR NPM packages, e.g. hl7.fhir.r3.core or hl7.fhir.r4.core, either the
+# .tgz as published or an unpacked package folder.  Nothing is read until a definition is requested,
+# then the package is indexed once (from .index.json if the package has one, otherwise a single scan)
+# and only the requested member is read from then on.
+CORE_URL = 'http://hl7.org/fhir/StructureDefinition/'
+PACKAGE_FOLDER = 'package'
+INDEX_FILE = '.index.json'
+MANIFEST_FILE = 'package.json'
+
+# Registered packages, searched in the order they were added.  Definitions can be read from
+# several threads at once (see base_definitions.prefetch_definitions), a tar file can not.
+package_sources = []
+package_lock = threading.Lock()
+
+
+def add_package(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError('FHIR package not found: ' + str(path))
+
+    package = {'path': path, 'indexed': False}
+    package_sources.append(package)
+    return package
+
+
+def clear_packages():
+    for package in package_sources:
+        close_package(package)
+    package_sources.clear()
+
+
+# Returns the raw json of the core definition for the resource type, or None if no package has it
+def get_definition_text(resource_type, version):
+    return get_resource_text(CORE_URL + resource_type, version)
+
+
+def get_resource_text(url, version=None):
+    with package_lock:
+        for package in package_sources:
+            index_package(package)
+            if version and not package_supports_version(package, version):
+                continue
+            if url in package['urls']:
+                return read_member(package, package['urls'][url]['filename'])
+
+    return None
+
+
+def package_supports_version(package, version):
+    # Only the major version is used to pick base definitions, see base_definitions.get_profile_url
+    if not package['fhir_versions']:
+        return True
+
+    return any(str(v)[0] == str(version)[0] for v in package['fhir_versions'])
+
+
+def index_package(package):
+    if package['indexed']:
+        return package
+
+    if os.path.isdir(package['path']):
+        root = package['path']
+        if os.path.isdir(os.path.join(root, PACKAGE_FOLDER)):
+            root = os.path.join(root, PACKAGE_FOLDER)
+        package['root'] = root
+        package['tar'] = None
+        names = sorted(n for n in os.listdir(root) if n.endswith('.json'))
+    else:
+        package['root'] = PACKAGE_FOLDER
+        package['tar'] = tarfile.open(package['path'], 'r:gz')
+        # Only reads the member headers, the contents are read on demand
+        package['members'] = {os.path.basename(m.name): m
+                              for m in package['tar'].getmembers()
+                              if m.isfile() and os.path.dirname(os.path.normpath(m.name)) == PACKAGE_FOLDER}
+        names = sorted(n for n in package['members'] if n.endswith('.json'))
+
+    manifest = read_member_json(package, MANIFEST_FILE) if MANIFEST_FILE in names else {}
+    package['fhir_versions'] = manifest.get('fhirVersions', manifest.get('fhir-version-list', []))
+
+    if INDEX_FILE in names:
+        entries = read_member_json(package, INDEX_FILE).get('files', [])
+    else:
+        entries = scan_package(package, [n for n in names if n not in [MANIFEST_FILE, INDEX_FILE]])
+
+    package['entries'] = entries
+    package['urls'] = {e['url']: e for e in entries if e.get('url')}
+    package['ids'] = {e['resourceType'] + '/' + e['id']: e for e in entries if e.get('resourceType') and e.get('id')}
+    package['indexed'] = True
+
+    return package
+
+
+def scan_package(package, names):
+    entries = []
+    for name in names:
+        try:
+            resource = read_member_json(package, name)
+        except ValueError:
+            continue
+        if not isinstance(resource, dict) or 'resourceType' not in resource:
+            continue
+        entries.append(index_entry(resource, name))
+
+    return entries
+
+
+# Same fields as the entries in a package .index.json
+def index_entry(resource, filename):
+    entry = {'filename': filename, 'resourceType': resource['resourceType']}
+    for field in ['id', 'url', 'version', 'kind', 'type']:
+        if field in resource:
+            entry[field] = resource[field]
+
+    return entry
+
+
+def read_member_json(package, name):
+    return json_codec.loads(read_member(package, name))
+
+
+def read_member(package, name):
+    if package['tar'] is None:
+        with open(os.path.join(package['root'], name), encoding='utf-8') as f:
+            return f.read()
+
+    return package['tar'].extractfile(package['members'][name]).read().decode('utf-8')
+
+
+def close_package(package):
+    if package.get('tar') is not None:
+        package['tar'].close()
+        package['tar'] = None
+    package['indexed'] = False
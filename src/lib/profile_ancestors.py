@@ -0,0 +1,145 @@
+import re
+from collections import namedtuple
+from . import base_definitions
+from . import instrumentation
+from . import json_codec
+from . import package_source
+from .profile_corpus import get_corpus, load_profile
+
+# The profiles a profile is derived from, following its baseDefinition to the profile it constrains, then that
+# profile's, until a core definition (see base_definitions), e.g. a supplier profile -> CareConnect -> core.
+# Ancestors are found by url in the corpora added with add_ancestor_source (see profile_corpus), in the order
+# added, then in the packages registered with package_source.
+#
+# Each ancestor is read once, and its differential indexed by element id, so looking up what an ancestor
+# constrains is a dict access.  The chain from each url is also kept, so it is only followed once.  A diff's
+# base is the nearest ancestor both profiles share that constrains the component, or the core definition
+# where none does (see profile_diff.component_level_diff).
+Ancestor = namedtuple('Ancestor', ['url', 'name', 'base_definition', 'element_index'])
+
+CORE_URL = package_source.CORE_URL
+CONSTRAINT = 'constraint'
+SLICE_NAME = re.compile(r':[^.]*')
+
+# Corpus paths searched for ancestors
+ancestor_sources = []
+# (url, version) -> Ancestor, or None if no source has a profile with the url
+ancestors = {}
+# (url, version) -> tuple of the Ancestors from the url, nearest first
+chains = {}
+
+
+def add_ancestor_source(path):
+    if path not in ancestor_sources:
+        ancestor_sources.append(path)
+        # Urls not found before may be in this one
+        clear_ancestors()
+
+
+def clear_ancestor_sources():
+    ancestor_sources.clear()
+    clear_ancestors()
+
+
+def clear_ancestors():
+    ancestors.clear()
+    chains.clear()
+
+
+def get_ancestors(profile, version):
+    return get_chain(profile.get('baseDefinition'), version)
+
+
+# Ancestors of the left profile that the right profile also has, i.e. what they both derive from, nearest first
+def common_ancestors(left, right, version):
+    right_urls = {a.url for a in get_ancestors(right, version)}
+    return tuple(a for a in get_ancestors(left, version) if a.url in right_urls)
+
+
+def get_chain(url, version, seen=()):
+    chain_key = (url, version)
+    if chain_key in chains:
+        return chains[chain_key]
+
+    # A chain that loops back on itself ends at the repeated url
+    if url in seen:
+        return ()
+
+    ancestor = get_ancestor(url, version)
+    if ancestor is None:
+        chain = ()
+    else:
+        chain = (ancestor,) + get_chain(ancestor.base_definition, version, seen + (url,))
+
+    chains[chain_key] = chain
+    return chain
+
+
+def get_ancestor(url, version):
+    # Core definitions are always from base_definitions
+    if not url or url.startswith(CORE_URL):
+        return None
+
+    ancestor_key = (url, version)
+    if ancestor_key in ancestors:
+        instrumentation.count('ancestor_cache_hits')
+        return ancestors[ancestor_key]
+
+    instrumentation.count('ancestor_cache_misses')
+    with instrumentation.span('read_ancestor', url=url):
+        profile = find_ancestor_profile(url, version)
+        if profile is None or profile.get('derivation', CONSTRAINT) != CONSTRAINT:
+            ancestors[ancestor_key] = None
+        else:
+            ancestors[ancestor_key] = Ancestor(url, profile.get('name'), profile.get('baseDefinition'),
+                                               index_differential(profile))
+
+    return ancestors[ancestor_key]
+
+
+def find_ancestor_profile(url, version):
+    for path in ancestor_sources:
+        corpus = get_corpus(path)
+        if url in corpus['urls']:
+            return load_profile(corpus, corpus['urls'][url])[0]
+
+    resource_text = package_source.get_resource_text(url, version)
+    if resource_text is not None:
+        return json_codec.loads(resource_text)
+
+    return None
+
+
+# Lower case element id -> differential element, as base_definitions.index_definition does for snapshots
+def index_differential(profile):
+    element_index = {}
+    for e in profile.get('differential', {}).get('element', []):
+        if 'id' in e:
+            element_index.setdefault(e['id'].lower(), e)
+
+    return element_index
+
+
+# Returns (the nearest ancestor that constrains the component of the element, its value), or (None, {}).  A slice
+# the ancestors do not have is constrained as the element it slices, e.g. code.coding:snomedCT as code.coding.
+def find_constraint(ancestor_chain, element_id, component):
+    for e in constrained_ids(element_id):
+        for ancestor in ancestor_chain:
+            value = base_definitions.search_index(ancestor.element_index, e, component)
+            if value != {}:
+                return ancestor, value
+
+    return None, {}
+
+
+def constrained_ids(element_id):
+    if ':' in element_id:
+        return [element_id, SLICE_NAME.sub('', element_id)]
+
+    return [element_id]
+
+
+# Everything the ancestors could constrain the element with, e.g. to key results by
+def inherited_elements(ancestor_chain, element_id):
+    return [[a.url, a.name, [a.element_index.get(e.lower()) for e in constrained_ids(element_id)]]
+            for a in ancestor_chain]
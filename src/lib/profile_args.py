@@ -1,6 +1,11 @@
 import argparse
 import os
-from .structuredefinition_reader import read_profile
+from . import instrumentation
+from . import json_codec
+from .profile_corpus import read_profile
+from .definition_cache import DEFAULT_DIRECTORY
+from .line_diff import DIFF_ENGINES, DEFAULT_ENGINE
+from .structured_report import OUTPUT_FORMATS, DEFAULT_FORMAT
 
 
 DEFAULT_TEMPLATE = '/../templates/markdown.md.jinja2'
@@ -8,15 +13,30 @@ DEFAULT_TEMPLATE = '/../templates/markdown.md.jinja2'
 
 def get_args():
     parser = argparse.ArgumentParser()
-    parser.add_argument("leftprofile", type=str, help="Filename of left-hand profile to compare")
-    parser.add_argument("rightprofile", type=str, help="Filename of right-hand profile to compare")
+    parser.add_argument("leftprofile", type=str, help="Filename of left-hand profile to compare, or "
+                                                      "<bundle, directory or package>#<url, name or type>")
+    parser.add_argument("rightprofile", type=str, help="Filename of right-hand profile to compare, or "
+                                                       "<bundle, directory or package>#<url, name or type>")
     # Only specifying major version, since the def's are being downloaded.  Would probably need more complex package
     # management for finer control of the base versions
     parser.add_argument("-lv", "--leftversion", type=int, help="Base FHIR (only major) version of left-hand profile.")
     parser.add_argument("-rv", "--rightversion", type=int, help="Base FHIR (only major) version of right-hand profile.")
     parser.add_argument("-t", "--template", type=str, help="Jinja2 template.  Provide custom template for output. "
                                                            "Name before extension of template will be output filename")
+    parser.add_argument("-o", "--output", type=str, help="Output filename, or - for stdout with json/ndjson.  "
+                                                         "Default: name before extension of template, or "
+                                                         "diff.json/diff.ndjson, in the current directory")
+    parser.add_argument("-f", "--format", type=str, choices=OUTPUT_FORMATS, default=DEFAULT_FORMAT,
+                        help="Output format.  markdown (or the template's), or the element and component results "
+                             "as json, or ndjson streamed one record per line.  Default: " + DEFAULT_FORMAT)
+    add_diff_engine_arg(parser)
+    add_json_codec_arg(parser)
+    add_definition_args(parser)
+    add_instrumentation_args(parser)
     args = parser.parse_args()
+    # Before the profiles are read, so that is included
+    instrumentation.configure(args)
+    json_codec.set_codec(args.jsoncodec)
 
     left, left_ver, left_name, left_type = read_profile(args.leftprofile)
     right, right_ver, right_name, right_type = read_profile(args.rightprofile)
@@ -32,6 +52,105 @@ def get_args():
     return args
 
 
+def get_batch_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("-m", "--manifest", type=str, help="CSV or JSON manifest of left/right profile pairs, with "
+                                                           "columns left, right, and optionally leftversion, "
+                                                           "rightversion.")
+    parser.add_argument("-ld", "--leftdir", type=str, help="Directory of left-hand profiles, paired by resource type")
+    parser.add_argument("-rd", "--rightdir", type=str, help="Directory of right-hand profiles, paired by resource type")
+    parser.add_argument("-o", "--outputdir", type=str, default='./diffs', help="Directory to write reports and the "
+                                                                               "index to.  Default: ./diffs")
+    parser.add_argument("-w", "--workers", type=int, help="Number of worker processes.  Default: number of CPUs")
+    parser.add_argument("-t", "--template", type=str, help="Jinja2 template.  Provide custom template for output.")
+    add_diff_engine_arg(parser)
+    add_definition_args(parser)
+    args = parser.parse_args()
+
+    if not args.manifest and not (args.leftdir and args.rightdir):
+        parser.error("Either --manifest, or both --leftdir and --rightdir, must be supplied")
+
+    args.template = get_template(args)
+
+    return args
+
+
+def get_matrix_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("leftprofile", type=str, help="Filename of left-hand profile, compared with each right-hand "
+                                                      "profile")
+    parser.add_argument("rightprofiles", type=str, nargs="+", help="Filenames of right-hand profiles, or directories "
+                                                                   "of them, or <bundle, directory or package>#<url, "
+                                                                   "name or type>")
+    parser.add_argument("-lv", "--leftversion", type=int, help="Base FHIR (only major) version of left-hand profile.")
+    parser.add_argument("-o", "--outputdir", type=str, default='./matrix', help="Directory to write reports and the "
+                                                                               "matrix to.  Default: ./matrix")
+    parser.add_argument("-w", "--workers", type=int, help="Number of worker processes.  Default: number of CPUs")
+    parser.add_argument("-t", "--template", type=str, help="Jinja2 template.  Provide custom template for output.")
+    add_diff_engine_arg(parser)
+    add_definition_args(parser)
+    args = parser.parse_args()
+
+    args.template = get_template(args)
+
+    return args
+
+
+def get_ig_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("leftig", type=str, help="Left-hand implementation guide: a Bundle, directory or FHIR package "
+                                                 "(.tgz or unpacked folder) of profiles")
+    parser.add_argument("rightig", type=str, help="Right-hand implementation guide, as leftig.  Profiles are paired "
+                                                  "by url, or by resource type and name")
+    parser.add_argument("-o", "--outputdir", type=str, default='./igdiff', help="Directory to write reports and the "
+                                                                               "summary to.  Default: ./igdiff")
+    parser.add_argument("-w", "--workers", type=int, help="Number of worker processes.  Default: number of CPUs")
+    parser.add_argument("-t", "--template", type=str, help="Jinja2 template.  Provide custom template for output.")
+    add_diff_engine_arg(parser)
+    add_definition_args(parser)
+    args = parser.parse_args()
+
+    args.template = get_template(args)
+
+    return args
+
+
+def add_diff_engine_arg(parser):
+    parser.add_argument("-de", "--diffengine", type=str, choices=list(DIFF_ENGINES), default=DEFAULT_ENGINE,
+                        help="Line diff engine.  Default: " + DEFAULT_ENGINE)
+
+
+def add_json_codec_arg(parser):
+    parser.add_argument("-jc", "--jsoncodec", type=str, choices=list(json_codec.CODECS),
+                        default=json_codec.DEFAULT_CODEC,
+                        help="JSON parser and serializer, the output is the same with either.  Default: " +
+                             json_codec.DEFAULT_CODEC + " (orjson if it is installed)")
+
+
+def add_definition_args(parser):
+    parser.add_argument("-p", "--package", type=str, action="append", default=[],
+                        help="FHIR NPM package (.tgz or unpacked folder) to read base definitions from, e.g. "
+                             "hl7.fhir.r3.core.  Can be given more than once.  Falls back to downloading.")
+    parser.add_argument("-a", "--ancestors", type=str, action="append", default=[],
+                        help="Bundle, directory or FHIR package of the profiles the compared profiles are derived "
+                             "from, to follow their baseDefinition through.  Can be given more than once.  Packages "
+                             "given with --package are also searched.")
+    parser.add_argument("-cd", "--cachedir", type=str, default=DEFAULT_DIRECTORY,
+                        help="Directory to cache downloaded base definitions in.  Default: " + DEFAULT_DIRECTORY)
+    parser.add_argument("--nocache", action="store_true", help="Do not use the base definition cache directory.")
+    parser.add_argument("--offline", action="store_true", help="Never download base definitions, only use the "
+                                                                "cache.  Fails if a definition has not been cached.")
+
+
+def add_instrumentation_args(parser):
+    parser.add_argument("--stats", action="store_true",
+                        help="Write timings per phase and counters (base lookups, cache hits, bytes downloaded, "
+                             "components diffed...) as JSON to stderr.")
+    parser.add_argument("--stats-file", type=str, help="Write the --stats JSON to this file instead.")
+    parser.add_argument("--trace", type=str, help="Write a trace of every timed phase to this file, in the Chrome "
+                                                  "trace format (chrome://tracing or https://ui.perfetto.dev).")
+
+
 def check_resource_properties(left_type, right_type, left_version, right_version, args):
     if left_type != right_type:
         raise ValueError("Profile resource types do not match.\n" 
@@ -0,0 +1,212 @@
+import os
+import tarfile
+from . import instrumentation
+from . import json_stream
+from . import structuredefinition_reader
+from .package_source import PACKAGE_FOLDER, MANIFEST_FILE
+
+# Profiles in a corpus: a Bundle, a directory tree of resources (some of which can be Bundles), or a FHIR NPM
+# package (.tgz or unpacked folder), e.g. an implementation guide's output.  The corpus is indexed in one pass,
+# each file read with json_stream for only the INDEX_FIELDS of its resources and, for a Bundle, where each
+# entry's resource starts and ends, so no resource is parsed in full.  A profile is parsed when it is loaded,
+# from only its own bytes.
+#
+# Any of the tools can be given a profile in a corpus as <corpus>#<selector>, where the selector is the
+# profile's url, name or, if there is only one profile of it in the corpus, resource type, e.g.
+#
+#   ./ig/bundle.json#http://example.org/StructureDefinition/MyPatient
+#   ./hl7.fhir.uk.core.tgz#UKCore-Patient
+CORPUS_SEPARATOR = '#'
+PROFILE_RESOURCE_TYPE = 'StructureDefinition'
+INDEX_FIELDS = ['resourceType', 'id', 'url', 'version', 'name', 'fhirVersion', 'kind', 'abstract', 'type',
+                'baseDefinition', 'derivation']
+TAR_EXTENSIONS = ('.tgz', '.tar.gz')
+
+# Indexed corpora by path, a corpus is only indexed once
+corpora = {}
+
+
+def read_profile(location):
+    path, separator, selector = location.partition(CORPUS_SEPARATOR)
+    if not separator or os.path.exists(location):
+        return structuredefinition_reader.read_profile(location)
+
+    corpus = get_corpus(path)
+    return load_profile(corpus, find_profile(corpus, selector))
+
+
+def get_corpus(path):
+    if path not in corpora:
+        corpora[path] = index_corpus(path)
+
+    return corpora[path]
+
+
+# A forked process shares its parent's open tar files, and their positions, so opens its own.  The members
+# found when indexing are read from the new one just the same.
+def reopen_corpora():
+    for corpus in corpora.values():
+        if corpus['tar'] is not None:
+            corpus['tar'] = tarfile.open(corpus['path'], 'r:gz')
+
+
+def clear_corpora():
+    for corpus in corpora.values():
+        if corpus['tar'] is not None:
+            corpus['tar'].close()
+    corpora.clear()
+
+
+def index_corpus(path):
+    if not os.path.exists(path):
+        raise FileNotFoundError('Profile corpus not found: ' + str(path))
+
+    corpus = {'path': path, 'root': path, 'tar': None, 'members': {}}
+    with instrumentation.span('index_corpus', path=path):
+        if os.path.isdir(path):
+            entries = index_directory(corpus)
+        elif path.lower().endswith(TAR_EXTENSIONS):
+            entries = index_tar(corpus)
+        else:
+            corpus['root'] = os.path.dirname(path)
+            entries = index_file(path, os.path.basename(path))
+
+    corpus['entries'] = entries
+    corpus['urls'] = {}
+    corpus['names'] = {}
+    corpus['types'] = {}
+    # The first of any duplicates is used
+    for entry in entries:
+        if entry.get('url'):
+            corpus['urls'].setdefault(entry['url'], entry)
+        if entry.get('name'):
+            corpus['names'].setdefault(entry['name'], entry)
+        if entry.get('type'):
+            corpus['types'].setdefault(entry['type'], []).append(entry)
+
+    return corpus
+
+
+# An unpacked package only has its package folder read, as package_source does, otherwise the whole tree
+def index_directory(corpus):
+    if os.path.isfile(os.path.join(corpus['path'], PACKAGE_FOLDER, MANIFEST_FILE)):
+        corpus['root'] = os.path.join(corpus['path'], PACKAGE_FOLDER)
+        names = sorted(n for n in os.listdir(corpus['root']) if n.endswith('.json'))
+    else:
+        names = sorted(os.path.relpath(os.path.join(directory, n), corpus['root'])
+                       for directory, _, filenames in os.walk(corpus['root'])
+                       for n in filenames if n.lower().endswith('.json'))
+
+    return [entry for name in names for entry in index_file(os.path.join(corpus['root'], name), name)]
+
+
+def index_file(path, filename):
+    try:
+        with json_stream.open_buffer(path) as buffer:
+            return index_buffer(buffer, filename)
+    except ValueError:
+        # Empty, or not a JSON object
+        return []
+
+
+# Members are read in order, as reading a gzipped tar out of order means decompressing it again from the start
+def index_tar(corpus):
+    corpus['tar'] = tarfile.open(corpus['path'], 'r:gz')
+    entries = []
+    for member in corpus['tar']:
+        if member.isfile() and os.path.dirname(os.path.normpath(member.name)) == PACKAGE_FOLDER and \
+                member.name.endswith('.json'):
+            filename = os.path.basename(member.name)
+            corpus['members'][filename] = member
+            try:
+                entries.extend(index_buffer(corpus['tar'].extractfile(member).read(), filename))
+            except ValueError:
+                continue
+
+    return entries
+
+
+def index_buffer(buffer, filename):
+    resource = json_stream.read_buffer(buffer, read_resource_index, filename)
+    # The file as a whole, not a part of it
+    resource.update(start=None, end=None)
+
+    return [dict(entry, filename=filename) for entry in flatten_bundle(resource)
+            if entry.get('resourceType') == PROFILE_RESOURCE_TYPE]
+
+
+def flatten_bundle(resource):
+    if resource.get('resourceType') != 'Bundle':
+        yield resource
+        return
+
+    for entry in resource.get('entry', []):
+        if entry is not None:
+            yield from flatten_bundle(entry)
+
+
+def read_resource_index(buffer, position):
+    return json_stream.read_object(buffer, position, INDEX_READERS)
+
+
+# Whether there is a differential, without reading it
+def read_present(buffer, position):
+    return True, json_stream.skip_value(buffer, position)
+
+
+def read_bundle_entry(buffer, position):
+    entry, end = json_stream.read_object(buffer, position, {'resource': read_located_resource})
+    return entry.get('resource'), end
+
+
+def read_located_resource(buffer, position):
+    resource, end = read_resource_index(buffer, position)
+    resource.update(start=position, end=end)
+    return resource, end
+
+
+INDEX_READERS = dict({field: json_stream.read_value for field in INDEX_FIELDS},
+                     differential=read_present,
+                     entry=lambda b, p: json_stream.read_array(b, p, read_bundle_entry))
+
+
+def find_profile(corpus, selector):
+    for index in ['urls', 'names']:
+        if selector in corpus[index]:
+            return corpus[index][selector]
+
+    profiles = corpus['types'].get(selector, [])
+    if len(profiles) == 1:
+        return profiles[0]
+
+    if profiles:
+        raise ValueError('More than one profile with resource type ' + selector + ' in ' + corpus['path'] +
+                         ', use its url or name.\n\n' + '\n'.join(profile_location(corpus, p) for p in profiles))
+
+    raise ValueError('No profile with url, name or resource type ' + selector + ' in ' + corpus['path'])
+
+
+# Returns the same as structuredefinition_reader.read_profile
+def load_profile(corpus, entry):
+    with instrumentation.span('load_profile', file=profile_location(corpus, entry)):
+        if corpus['tar'] is None:
+            with json_stream.open_buffer(os.path.join(corpus['root'], entry['filename'])) as buffer:
+                profile = read_entry(buffer, entry)
+        else:
+            profile = read_entry(corpus['tar'].extractfile(corpus['members'][entry['filename']]).read(), entry)
+
+    # Must at least have a differential
+    structuredefinition_reader.check_profile(profile, 'differential')
+    return profile, *structuredefinition_reader.get_profile_meta(profile)
+
+
+def read_entry(buffer, entry):
+    if entry['start'] is None:
+        return structuredefinition_reader.read_profile_buffer(buffer, 0, len(buffer))
+
+    return structuredefinition_reader.read_profile_buffer(buffer, entry['start'], entry['end'])
+
+
+# <corpus>#<selector> to read the profile with read_profile
+def profile_location(corpus, entry):
+    return corpus['path'] + CORPUS_SEPARATOR + (entry.get('url') or entry.get('name') or entry['type'])
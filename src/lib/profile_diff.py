@@ -1,8 +1,18 @@
-import json
-import difflib
-from itertools import islice
+from collections import namedtuple
+from . import instrumentation
+from . import profile_ancestors
+from . import result_cache
+from .json_cache import canonical_json
+from .line_diff import diff_lines
+from .json_tree_diff import render_diff
 from .profile_elements import extract_elements, align_elements, is_valid_dict
-from .base_definitions import get_base_component
+from .base_definitions import get_base_component, get_base_component_memo
+
+# Result of diffing one component of an element.  table_result is the (left, right) cells of the report table,
+# match is the pretty printed value when both sides are the same object, component_diff is the diff when
+# they differ (or the value on the side it is defined), and base describes the base element's value, and where
+# the profiles have ancestors (see profile_ancestors) which of them introduced it.
+ComponentResult = namedtuple('ComponentResult', ['table_result', 'match', 'component_diff', 'base'])
 
 # Components within element that should not be diff-ed
 IGNORED_COMPONENTS = ['id', 'path', 'base']
@@ -10,6 +20,7 @@ IGNORED_COMPONENTS = ['id', 'path', 'base']
 # Constants for use in table results.
 MATCH_RESULT = 'Match'
 MATCH_WITH_VALUE_RESULT = 'Match. "{component}" == '
+REORDERED_RESULT = 'Match, in a different order'
 DIFF_RESULT = 'See diff'
 NOT_DEFINED_RESULT = 'Not defined'
 NOTHING_TO_DIFF = 'Nothing to diff, value below'
@@ -17,6 +28,8 @@ SAME_AS_BASE_RESULT = 'Same as base'
 BASE_WITH_VALUE_RESULT = '"{component}" == '
 BASE_NOT_DEFINED_RESULT = '"{component}" is not defined in the base element definition.'
 BASE_NOT_DEFINED_IS_SLICE_RESULT = '"{component}" is a custom slice and therefore not defined in the base'
+BASE_INTRODUCED_BY_RESULT = 'Introduced by {ancestor}  \n'
+CORE_DEFINITION = 'the core definition'
 
 
 def element_diff(left, right):
@@ -27,43 +40,71 @@ def element_diff(left, right):
 
 
 def component_diff(left, right, version):
-    left_elements = extract_elements(left)
-    right_elements = extract_elements(right)
-    return detailed_diff(left_elements, right_elements, version)
+    with instrumentation.span('extract_elements'):
+        left_elements = extract_elements(left, version=version)
+        right_elements = extract_elements(right, version=version)
+    ancestors = profile_ancestors.common_ancestors(left, right, version)
+    with instrumentation.span('detailed_diff'):
+        return detailed_diff(left_elements, right_elements, version, ancestors=ancestors)
 
 
-def detailed_diff(left, right, version):
-    elements_table = align_elements(left, right)
+# base_components memoises the base lookups, see base_definitions.get_base_component_memo.  ancestors are the
+# profiles' common ancestors, see profile_ancestors.common_ancestors.
+def detailed_diff(left, right, version, base_components=None, ancestors=()):
     diff = dict()
 
-    for element_operands in elements_table:
-        left_element = tuple(*element_operands.values())[0]
-        right_element = tuple(*element_operands.values())[1]
-        components_table = align_elements(left_element, right_element)
-
-        for component in components_table:
-            diff |= component_level_diff(element_operands, component, version)
+    for element_key, component_key, result in iter_detailed_diff(left, right, version, base_components, ancestors):
+        diff[element_key] = {component_key: result}
 
     return diff
 
 
-def component_level_diff(element, component, version):
-    element_key = str(*element.keys())
-    component_results = {}
-    component_key = str(*component.keys())
+# Yields (element id, component key, ComponentResult) for every component, as each is diffed
+def iter_detailed_diff(left, right, version, base_components=None, ancestors=()):
+    with instrumentation.span('align_elements'):
+        aligned = align_elements(left, right)
+
+    for element in aligned:
+        # Unchanged since the last run, see result_cache
+        key = result_cache.element_key(element, version, ancestors) if result_cache.enabled() else None
+        element_results = result_cache.get(key) if key else None
+
+        if element_results is None:
+            element_results = []
+            for component in align_elements(element.left, element.right):
+                result = component_level_diff(element, component, version, base_components, ancestors)
+                if result is not None:
+                    element_results.append((component.key, result))
+            if key:
+                result_cache.put(key, element_results)
+        else:
+            # Read back from json as lists
+            element_results = [(component_key, ComponentResult(*result)) for component_key, result in element_results]
+
+        for component_key, result in element_results:
+            yield element.key, component_key, result
+
+
+def component_level_diff(element, component, version, base_components=None, ancestors=()):
+    if component.key in IGNORED_COMPONENTS:
+        return None
+
+    instrumentation.count('components_diffed')
+    ancestor, base_component = profile_ancestors.find_constraint(ancestors, element.key, component.key)
+    if ancestor is not None:
+        introduced_by = (ancestor.name + ' (' + ancestor.url + ')') if ancestor.name else ancestor.url
+    else:
+        # Only said where there are ancestors it could have been from
+        introduced_by = CORE_DEFINITION if ancestors else None
+        if base_components is None:
+            base_component = get_base_component(element, component.key, version)
+        else:
+            base_component = get_base_component_memo(base_components, element, component.key, version)
 
-    if component_key not in IGNORED_COMPONENTS:
-        left_component = tuple(*component.values())[0]
-        right_component = tuple(*component.values())[1]
-        base_component = get_base_component(element, component_key, version)
-        component_results = {element_key: base_component_diff(component_key,
-                                                              left_component,
-                                                              right_component,
-                                                              base_component)}
-    return component_results
+    return base_component_diff(component.key, component.left, component.right, base_component, introduced_by)
 
 
-def base_component_diff(component_key, left, right, base):
+def base_component_diff(component_key, left, right, base, introduced_by=None) -> ComponentResult:
     table_result = {}
     match = {}
     component_diff = {}
@@ -76,20 +117,23 @@ def base_component_diff(component_key, left, right, base):
         table_result = (MATCH_RESULT, MATCH_RESULT)
     elif component_key not in IGNORED_COMPONENTS:
         component_diff, table_result = object_component_diff(left, right, base)
+        if table_result == (DIFF_RESULT, DIFF_RESULT) and not component_diff:
+            # Only list items matched on a key are in a different order, see json_tree_diff
+            match = json_pretty(left)
+            table_result = (REORDERED_RESULT, REORDERED_RESULT)
 
     if is_valid_dict(base):
         base = '```json\n' + json_pretty(base) + '\n```'
     elif base == {}:
         base = BASE_NOT_DEFINED_RESULT.replace('{component}', component_key)
+        introduced_by = None
     else:
         base = BASE_WITH_VALUE_RESULT.replace('{component}', component_key) + str(base)
 
-    return {
-        component_key: {'table_result': table_result,
-                        'match': match,
-                        'component_diff': component_diff,
-                        'base': base}
-    }
+    if introduced_by:
+        base = BASE_INTRODUCED_BY_RESULT.replace('{ancestor}', introduced_by) + base
+
+    return ComponentResult(table_result, match, component_diff, base)
 
 
 def object_component_diff(left, right, base):
@@ -135,31 +179,23 @@ def primitive_component_diff(left, right, base, component_key):
 
 
 def list_diff(left, right) -> str:
-    diff_text = ''
+    return format_diff(diff_lines(left, right))
 
-    # Ensure context covers full diff
-    diff_generator = difflib.unified_diff(left,
-                                          right,
-                                          n=max(len(left), len(right)))
 
-    # Remove line number and operand details
-    for diff in islice(diff_generator, 3, None):
-        diff_text = diff_text + diff + '  \n'
-
-    return diff_text
+def json_diff(left, right) -> str:
+    # Structural diff, rendered as a line diff of the pretty printed json
+    return format_diff(render_diff(left, right))
 
 
-def json_diff(left, right) -> str:
-    left_lines = json_pretty(left).splitlines()
-    right_lines = json_pretty(right).splitlines()
+def format_diff(diff) -> str:
+    # Nothing to show if there are no changes, otherwise the full context
+    if all(tag == ' ' for tag, line in diff):
+        return ''
 
-    return list_diff(left_lines, right_lines)
+    return ''.join(tag + line + '  \n' for tag, line in diff)
 
 
 def json_pretty(data):
-    return json.dumps(
-        data,
-        indent=2,
-        sort_keys=True
-    )
+    # Shared with json_diff, a repeated value (e.g. the same base component) is only serialized once
+    return canonical_json(data)
 
@@ -1,64 +1,79 @@
 import json
+import sys
+from collections import namedtuple
+from . import snapshot_generator
 
+# Element (or component) key with the corresponding left and right values, an empty dict on the side it is missing
+AlignedElement = namedtuple('AlignedElement', ['key', 'left', 'right'])
 
-def extract_elements(profile) -> list:
+
+def extract_elements(profile, snapshot_index=None, version=None) -> list:
     diff_elements = extract_diff_elements(profile)
-    return add_snapshot_elements_to_diff(profile, diff_elements)
+    return add_snapshot_elements_to_diff(profile, diff_elements, snapshot_index, version)
 
 
 def extract_diff_elements(profile) -> dict:
-    return dict(zip([e['id'] for e in profile['differential']['element'] if 'id' in e],
-                    [e for e in profile['differential']['element']]))
+    elements = [intern_element(e) for e in profile['differential']['element']]
+    return dict(zip([e['id'] for e in elements if 'id' in e], elements))
+
+
+# Element ids and paths repeat across profiles (every AllergyIntolerance profile has
+# AllergyIntolerance.code), interned so each is only held once however many profiles are loaded
+def intern_element(element) -> dict:
+    for key in ['id', 'path']:
+        if isinstance(element.get(key), str):
+            element[key] = sys.intern(element[key])
 
+    return element
 
-def add_snapshot_elements_to_diff(profile, diff_elements) -> dict:
+
+# Snapshot element id -> snapshot element.  Can be built once and passed to anything else
+# that needs to look up snapshot elements, otherwise it is built when needed.  A profile without a
+# snapshot has one generated, for the version or its fhirVersion.
+def get_snapshot_index(profile, version=None) -> dict:
     if not profile:
         raise ValueError('Empty profile passed.\n\nProfile -->\n\n' +
                          json.dumps(profile, indent=2))
 
-    # Just return without base paths, other searches will be attempted if empty
-    # TODO think about integrating a tool to generate the snapshot if it's missing
     if 'snapshot' not in profile:
-        return diff_elements
+        version = version or profile.get('fhirVersion')
+        # Just return without base paths, other searches will be attempted if empty
+        if not version or 'type' not in profile or 'differential' not in profile:
+            return {}
+        snapshot = snapshot_generator.generate_snapshot(profile, version)
+        return {e['id']: e for e in snapshot['element'] if 'id' in e}
 
     if 'element' not in profile['snapshot']:
         raise ValueError('Elements are missing in profile.\n\nProfile -->\n\n' +
                          json.dumps(profile, indent=2))
 
+    return {e['id']: e for e in profile['snapshot']['element'] if 'id' in e}
+
+
+def add_snapshot_elements_to_diff(profile, diff_elements, snapshot_index=None, version=None) -> dict:
+    if snapshot_index is None:
+        snapshot_index = get_snapshot_index(profile, version)
+
     for de in diff_elements.values():
-        for e in profile['snapshot']['element']:
-            if 'id' in e \
-                    and 'id' in de \
-                    and de['id'] == e['id']:
-                de['base'] = e['base']
+        if 'id' in de and de['id'] in snapshot_index and 'base' in snapshot_index[de['id']]:
+            de['base'] = snapshot_index[de['id']]['base']
+            if isinstance(de['base'].get('path'), str):
+                de['base']['path'] = sys.intern(de['base']['path'])
 
     return diff_elements
 
 
-# Reasonably efficient and very simple algorithm to align elements based on element id
-# If id in left and right match, pop elements off each list into tuple and append to output list
-# Non-matching elements in left and right input lists appended to output list with corresponding empty dict in tuple
+# Align elements based on element id, a single pass over each side using dict lookups.
+# Output is in left order, followed by the elements only in right in right order.
+# Elements only on one side have a corresponding empty dict on the other.
 def align_elements(left, right):
     if not isinstance(left, dict) or not isinstance(right, dict):
         raise TypeError('Unexpected data in profile_elements.align_elements.'
                         '\n\nLeft is a ' + str(type(left)) + '. Contents:\n\n' + str(left) +
                         '\n\nRight is a ' + str(type(left)) + '. Contents:\n\n' + str(right))
 
-    copy_left = left.copy()
-    copy_right = right.copy()
-
-    diff_table = []
-    for lft in left:
-        for r in right:
-            if lft == r:
-                diff_table.append({lft: (copy_left.pop(lft), copy_right.pop(r))})
-                break
-
-    for lft in copy_left:
-        diff_table.append({lft: (copy_left[lft], {})})
-
-    for r in copy_right:
-        diff_table.append({r: ({}, copy_right[r])})
+    diff_table = [AlignedElement(key, value, right[key] if key in right else {}) for key, value in left.items()]
+    diff_table.extend(AlignedElement(key, {}, value) for key, value in right.items() if key not in left)
 
     return diff_table
 
@@ -0,0 +1,298 @@
+import copy
+import random
+
+# Generates StructureDefinitions shaped like the CareConnect profiles in tests/data, from a seed, so
+# pairs of any size can be made for benchmarks and stress tests and made again exactly.
+#
+# A profile is a differential of constraints on the AllergyIntolerance elements, in tree order, with
+# extension slices, coding slices (as coding:snomedCT), nested extension slices inside slices down to
+# slice_depth, restricted choice [x] types, bindings and references, and a snapshot with the base path
+# of every element.  More slices are added round by round until there are size differential elements.
+#
+# A pair is a profile and a copy of it with divergence of its elements changed, removed or added to.
+# Only changes the diff can show are made: object components (binding, type) are changed, primitive
+# components are only added or removed, base paths are never changed.
+RESOURCE_TYPE = 'AllergyIntolerance'
+FHIR_VERSION = '3.0.1'
+BASE_URL = 'https://example.org/fhir/StructureDefinition/'
+EXTENSION_BASE_URL = 'https://example.org/fhir/StructureDefinition/Extension-'
+
+# (name, min, max, datatype), datatype is a list of type codes for a choice element
+RESOURCE_ELEMENTS = [('identifier', 0, '*', 'Identifier'),
+                     ('clinicalStatus', 0, '1', 'code'),
+                     ('verificationStatus', 1, '1', 'code'),
+                     ('type', 0, '1', 'code'),
+                     ('category', 0, '*', 'code'),
+                     ('criticality', 0, '1', 'code'),
+                     ('code', 0, '1', 'CodeableConcept'),
+                     ('patient', 1, '1', 'Reference'),
+                     ('onset[x]', 0, '1', ['dateTime', 'Age', 'Period', 'Range', 'string']),
+                     ('assertedDate', 0, '1', 'dateTime'),
+                     ('recorder', 0, '1', 'Reference'),
+                     ('asserter', 0, '1', 'Reference'),
+                     ('lastOccurrence', 0, '1', 'dateTime'),
+                     ('note', 0, '*', 'Annotation'),
+                     ('reaction', 0, '*', 'BackboneElement')]
+
+REACTION_ELEMENTS = [('substance', 0, '1', 'CodeableConcept'),
+                     ('manifestation', 1, '*', 'CodeableConcept'),
+                     ('description', 0, '1', 'string'),
+                     ('onset', 0, '1', 'dateTime'),
+                     ('severity', 0, '1', 'code'),
+                     ('exposureRoute', 0, '1', 'CodeableConcept')]
+
+DATATYPE_ELEMENTS = {'Identifier': [('system', 0, '1', 'uri'),
+                                    ('value', 0, '1', 'string'),
+                                    ('assigner', 0, '1', 'Reference')],
+                     'Coding': [('system', 0, '1', 'uri'),
+                                ('code', 0, '1', 'code'),
+                                ('display', 0, '1', 'string')],
+                     'Annotation': [('author[x]', 0, '1', ['Reference', 'string']),
+                                    ('time', 0, '1', 'dateTime'),
+                                    ('text', 1, '1', 'string')]}
+
+REFERENCE_TARGETS = ['Patient', 'Practitioner', 'Organization', 'RelatedPerson', 'Encounter']
+CODE_SYSTEMS = ['snomedCT', 'readCodes', 'dmd', 'icd10', 'local']
+EXTENSION_NAMES = ['encounter', 'allergyEnd', 'evidence', 'descriptionId', 'certainty', 'source']
+BINDING_STRENGTHS = ['required', 'extensible', 'preferred', 'example']
+
+
+def generate_profile(size=100, slice_depth=2, seed=0, name='Generated-AllergyIntolerance-1') -> dict:
+    rng = random.Random(seed)
+    slicing_points = []
+    root = resource_tree(rng, slice_depth, slicing_points)
+    count = count_elements(root)
+
+    generation = 0
+    while count < size:
+        generation += 1
+        for parent, new_slice in slicing_points:
+            added = new_slice(generation)
+            parent[1].append(added)
+            count += count_elements(added)
+
+    return profile_from_elements(flatten(root)[:size], name)
+
+
+def generate_pair(size=100, slice_depth=2, divergence=0.05, seed=0) -> tuple:
+    left = generate_profile(size, slice_depth, seed, 'Generated-AllergyIntolerance-Left-1')
+    right = diverge_profile(left, divergence, random.Random(str(seed) + '-right'),
+                            'Generated-AllergyIntolerance-Right-1')
+
+    return left, right
+
+
+def diverge_profile(profile, divergence, rng, name) -> dict:
+    bases = {e['id']: e['base'] for e in profile['snapshot']['element']}
+    elements = []
+    added = 0
+
+    for e in copy.deepcopy(profile['differential']['element']):
+        e['base'] = bases[e['id']]
+        if e['id'] == RESOURCE_TYPE or rng.random() >= divergence:
+            elements.append(e)
+            continue
+
+        change = rng.choice(['component', 'component', 'remove', 'add'])
+        if change == 'component':
+            elements.append(change_component(e, rng))
+        elif change == 'add':
+            added += 1
+            elements.append(e)
+            elements.extend(flatten(node(extension_slice(RESOURCE_TYPE, 'divergent' + str(added), rng),
+                                         'DomainResource.extension', 0, '*')))
+        # Otherwise removed
+
+    return profile_from_elements(elements, name)
+
+
+def change_component(element, rng) -> dict:
+    if 'binding' in element:
+        element['binding'] = dict(element['binding'],
+                                  strength=rng.choice([s for s in BINDING_STRENGTHS
+                                                       if s != element['binding']['strength']]))
+    elif 'type' in element:
+        element['type'] = [dict(element['type'][0],
+                                profile=EXTENSION_BASE_URL + 'Changed' + str(rng.randrange(1000)))]
+    elif 'short' in element:
+        del element['short']
+    else:
+        element['short'] = 'Changed ' + element['id'].split('.')[-1]
+
+    return element
+
+
+# Node is [differential element, children, snapshot base].  Each slicing point is registered with
+# a function making a new slice for it, for the later generations.
+def resource_tree(rng, slice_depth, slicing_points):
+    root = node({'id': RESOURCE_TYPE, 'path': RESOURCE_TYPE}, RESOURCE_TYPE, 0, '*')
+
+    extensions = node(slicing(RESOURCE_TYPE + '.extension', RESOURCE_TYPE + '.extension'),
+                      'DomainResource.extension', 0, '*')
+    for n in range(2):
+        extensions[1].append(node(extension_slice(RESOURCE_TYPE, EXTENSION_NAMES[n], rng),
+                                  'DomainResource.extension', 0, '*'))
+    slicing_points.append((extensions,
+                           lambda g: node(extension_slice(RESOURCE_TYPE, slice_name(EXTENSION_NAMES, g), rng),
+                                          'DomainResource.extension', 0, '*')))
+    root[1].append(extensions)
+
+    for name, minimum, maximum, datatype in RESOURCE_ELEMENTS:
+        element_id = RESOURCE_TYPE + '.' + name
+        if datatype == 'BackboneElement':
+            backbone = node(constrain({'id': element_id, 'path': element_id}, datatype, rng),
+                            element_id, minimum, maximum)
+            for child, child_min, child_max, child_type in REACTION_ELEMENTS:
+                backbone[1].append(element_node(element_id + '.' + child, element_id + '.' + child,
+                                                child_min, child_max, child_type, rng, slice_depth, slicing_points))
+            root[1].append(backbone)
+        else:
+            root[1].append(element_node(element_id, element_id, minimum, maximum, datatype,
+                                        rng, slice_depth, slicing_points))
+
+    return root
+
+
+def element_node(element_id, base_path, minimum, maximum, datatype, rng, slice_depth, slicing_points):
+    element = node(constrain({'id': element_id, 'path': element_id}, datatype, rng), base_path, minimum, maximum)
+
+    if datatype == 'CodeableConcept' and slice_depth > 0:
+        coding_id = element_id + '.coding'
+        coding = node(slicing(coding_id, coding_id), 'CodeableConcept.coding', 0, '*')
+        coding[1].append(coding_slice(coding_id, CODE_SYSTEMS[0], rng, slice_depth))
+        slicing_points.append((coding, lambda g: coding_slice(coding_id, slice_name(CODE_SYSTEMS, g), rng,
+                                                              slice_depth)))
+        element[1].append(coding)
+    elif isinstance(datatype, str) and datatype in DATATYPE_ELEMENTS:
+        for child, child_min, child_max, child_type in DATATYPE_ELEMENTS[datatype]:
+            element[1].append(element_node(element_id + '.' + child, datatype + '.' + child,
+                                           child_min, child_max, child_type, rng, 0, slicing_points))
+
+    return element
+
+
+# A coding slice as coding:snomedCT, its path is the unsliced path
+def coding_slice(coding_id, name, rng, slice_depth):
+    slice_id = coding_id + ':' + name
+    path = unsliced_path(coding_id)
+    coding = node({'id': slice_id,
+                   'path': path,
+                   'sliceName': name,
+                   'max': '1',
+                   'binding': binding(name, rng)}, 'CodeableConcept.coding', 0, '*')
+    nested_extensions(coding, slice_id, 'Element.extension', name, slice_depth - 1)
+    for child, child_min, child_max, child_type in DATATYPE_ELEMENTS['Coding']:
+        coding[1].append(node({'id': slice_id + '.' + child, 'path': path + '.' + child, 'min': 1},
+                              'Coding.' + child, child_min, child_max))
+
+    return coding
+
+
+# An extension slice within a slice, which has its own extension slice, down to depth
+def nested_extensions(parent, parent_id, base_path, name, depth):
+    if depth <= 0:
+        return
+
+    extension_name = name + 'Extension' + str(depth)
+    extension_id = parent_id + '.extension:' + extension_name
+    extensions = node(slicing(parent_id + '.extension', unsliced_path(parent_id + '.extension')), base_path, 0, '*')
+    extension = node({'id': extension_id,
+                      'path': unsliced_path(extension_id),
+                      'sliceName': extension_name,
+                      'type': [{'code': 'Extension', 'profile': EXTENSION_BASE_URL + extension_name}]},
+                     base_path, 0, '*')
+    nested_extensions(extension, extension_id, 'Extension.extension', name, depth - 1)
+    extensions[1].append(extension)
+    parent[1].append(extensions)
+
+
+def constrain(element, datatype, rng):
+    if isinstance(datatype, list):
+        # Choice, restricted to some of the types
+        element['type'] = [{'code': code} for code in datatype if rng.random() < 0.6] or [{'code': datatype[0]}]
+        if rng.random() < 0.5:
+            element['mustSupport'] = True
+    elif datatype == 'Reference':
+        element['type'] = [{'code': 'Reference',
+                            'targetProfile': BASE_URL + 'Profile-' + rng.choice(REFERENCE_TARGETS) + '-1'}]
+    elif datatype == 'code':
+        element['binding'] = binding(element['id'].split('.')[-1], rng)
+    elif rng.random() < 0.3:
+        element['min'] = 1
+
+    if rng.random() < 0.3:
+        element['short'] = 'Generated ' + element['id'].split('.')[-1]
+
+    return element
+
+
+def binding(name, rng):
+    return {'strength': rng.choice(BINDING_STRENGTHS),
+            'description': 'A code from ' + name,
+            'valueSetReference': {'reference': BASE_URL.replace('StructureDefinition', 'ValueSet') + name + '-1'}}
+
+
+def extension_slice(parent_id, name, rng):
+    return {'id': parent_id + '.extension:' + name,
+            'path': parent_id + '.extension',
+            'sliceName': name,
+            'max': rng.choice(['1', '*']),
+            'type': [{'code': 'Extension', 'profile': EXTENSION_BASE_URL + name}]}
+
+
+def slicing(element_id, path):
+    return {'id': element_id,
+            'path': path,
+            'slicing': {'discriminator': [{'type': 'value', 'path': 'url'}], 'rules': 'open'}}
+
+
+# Names are reused in later generations with the generation number, so are unique within a slicing point
+def slice_name(names, generation):
+    return names[generation % len(names)] + str(generation)
+
+
+def unsliced_path(element_id):
+    return '.'.join(part.split(':')[0] for part in element_id.split('.'))
+
+
+def node(element, base_path, minimum, maximum):
+    return [element, [], {'path': base_path, 'min': minimum, 'max': maximum}]
+
+
+def count_elements(tree) -> int:
+    return 1 + sum(count_elements(child) for child in tree[1])
+
+
+def flatten(tree) -> list:
+    element, children, base = tree
+    elements = [dict(element, base=base)]
+    for child in children:
+        elements.extend(flatten(child))
+
+    return elements
+
+
+# Elements carry their base, which only goes in the snapshot
+def profile_from_elements(elements, name) -> dict:
+    differential = []
+    snapshot = []
+    for e in elements:
+        differential.append({k: v for k, v in e.items() if k != 'base'})
+        snapshot.append(dict(e,
+                             min=e.get('min', e['base']['min']),
+                             max=e.get('max', e['base']['max']),
+                             definition='Generated definition of ' + e['id']))
+
+    return {'resourceType': 'StructureDefinition',
+            'url': BASE_URL + name,
+            'version': '1.0.0',
+            'name': name,
+            'status': 'draft',
+            'fhirVersion': FHIR_VERSION,
+            'kind': 'resource',
+            'abstract': False,
+            'type': RESOURCE_TYPE,
+            'baseDefinition': 'http://hl7.org/fhir/StructureDefinition/' + RESOURCE_TYPE,
+            'derivation': 'constraint',
+            'snapshot': {'element': snapshot},
+            'differential': {'element': differential}}
@@ -0,0 +1,87 @@
+import os
+from collections import namedtuple
+from jinja2 import Environment, FileSystemLoader, FileSystemBytecodeCache
+from . import profile_diff as pd
+from . import base_definitions
+from . import instrumentation
+from . import result_cache
+
+# Number of template events joined per write, and the size of the file write buffer
+STREAM_BUFFER_SIZE = 64
+WRITE_BUFFER_SIZE = 1024 * 1024
+TEMPLATE_CACHE_FOLDER = 'templates'
+
+# Everything a report template is rendered from.  component_results is element id -> component key ->
+# profile_diff.ComponentResult
+DiffReport = namedtuple('DiffReport', ['resource_type', 'left_profile', 'left_version', 'right_profile',
+                                       'right_version', 'element_level_diff', 'component_results'])
+
+# One Environment per template directory, which keeps compiled templates in memory and only reloads
+# one if the file's mtime changes.  With a bytecode cache directory set, compiled templates are also
+# kept on disk between runs, and only used while the checksum of the template source matches.
+template_environments = {}
+template_settings = {'bytecode_cache': None}
+
+
+# Takes the parsed definition source arguments, the template cache goes in the same cache directory
+def configure_template_cache(args):
+    template_environments.clear()
+    template_settings['bytecode_cache'] = None if args.nocache else os.path.join(args.cachedir, TEMPLATE_CACHE_FOLDER)
+
+
+def get_template(template):
+    directory, name = os.path.split(os.path.abspath(template))
+
+    if directory not in template_environments:
+        bytecode_cache = None
+        if template_settings['bytecode_cache']:
+            os.makedirs(template_settings['bytecode_cache'], exist_ok=True)
+            bytecode_cache = FileSystemBytecodeCache(template_settings['bytecode_cache'])
+        template_environments[directory] = Environment(loader=FileSystemLoader(directory),
+                                                       bytecode_cache=bytecode_cache,
+                                                       auto_reload=True)
+
+    return template_environments[directory].get_template(name)
+
+
+def write_report(left, left_version, right, right_version, template, diff_file):
+    base_definitions.prefetch_definitions(base_definitions.required_definitions(left, left_version) |
+                                          base_definitions.required_definitions(right, left_version))
+    with instrumentation.span('element_diff'):
+        element_level_diff = pd.element_diff(left, right)
+    result_cache.load(left, right, left_version)
+    with instrumentation.span('component_diff'):
+        component_level_diff = pd.component_diff(left, right, left_version)  # TODO support multiple versions
+    result_cache.save()
+
+    return render_report(get_diff_report(left, left_version, right, right_version,
+                                         element_level_diff, component_level_diff),
+                         template, diff_file)
+
+
+def get_diff_report(left, left_version, right, right_version, element_level_diff, component_level_diff):
+    return DiffReport(resource_type=left['type'],
+                      left_profile=left['name'],
+                      left_version=left_version,
+                      right_profile=right['name'],
+                      right_version=right_version,
+                      element_level_diff=element_level_diff,
+                      component_results=component_level_diff)
+
+
+def render_report(report, template, diff_file):
+    t = get_template(template)
+    # Streamed straight to the file, a few template events at a time, so the report is never held in memory whole.
+    # The fields are also passed on their own, for templates written before DiffReport.
+    diff_stream = t.stream(report=report, **report._asdict())
+    diff_stream.enable_buffering(STREAM_BUFFER_SIZE)
+
+    with instrumentation.span('render'), open(diff_file, 'w', buffering=WRITE_BUFFER_SIZE) as diff:
+        diff_stream.dump(diff)
+
+    return diff_file
+
+
+# Name before extension of template is the output filename, i.e. markdown.md.jinja2 -> markdown.md
+def get_report_filename(template):
+    return os.path.basename(template).rsplit('.', 1)[0]
@@ -0,0 +1,105 @@
+import hashlib
+import json
+import os
+from . import base_definitions
+from . import instrumentation
+from . import line_diff
+from .definition_cache import atomic_write
+from .profile_ancestors import inherited_elements
+
+# Per element results of profile_diff.detailed_diff, kept between runs so a re-run after a small edit
+# only diffs the elements that changed.  An element's key is a hash of its left and right values, the
+# base version, the base definitions it is looked up in (their sha256, so a different package or a
+# newer download is a different key), what the profiles' ancestors constrain it with (see
+# profile_ancestors), the line diff engine (see line_diff) and the tool version (a hash of the source
+# that produces the results, so any change to the diff invalidates everything).  An element with a base
+# definition that is empty, i.e. not found or failed to download, has no key, its results are not kept.
+#
+#   <directory>/<sha256 of left url, right url, version>.json   element key -> result, one per profile pair
+#
+# load reads the file for a pair, save writes back only the results used in the run, so results for
+# elements that have since changed are dropped.
+RESULT_CACHE_FOLDER = 'results'
+TOOL_SOURCES = ['profile_diff.py', 'profile_elements.py', 'base_definitions.py', 'json_tree_diff.py',
+                'json_cache.py', 'line_diff.py', 'result_cache.py', 'profile_ancestors.py']
+
+cache_settings = {'directory': None}
+pair_cache = {'file': None, 'results': {}, 'used': {}}
+tool = {'version': None}
+
+
+# Takes the parsed definition source arguments, results go in the same cache directory
+def configure(args):
+    cache_settings['directory'] = None if args.nocache else os.path.join(args.cachedir, RESULT_CACHE_FOLDER)
+    clear()
+
+
+def clear():
+    pair_cache['file'] = None
+    pair_cache['results'] = {}
+    pair_cache['used'] = {}
+
+
+def enabled():
+    return pair_cache['file'] is not None
+
+
+def load(left, right, version):
+    clear()
+    if not cache_settings['directory']:
+        return
+
+    pair_key = json.dumps([left.get('url', left.get('name')), right.get('url', right.get('name')), version])
+    pair_cache['file'] = os.path.join(cache_settings['directory'],
+                                      hashlib.sha256(pair_key.encode('utf-8')).hexdigest() + '.json')
+    try:
+        with open(pair_cache['file']) as f:
+            pair_cache['results'] = json.load(f)
+    except (OSError, ValueError):
+        # Missing or unreadable, start again
+        pair_cache['results'] = {}
+
+
+def save():
+    if enabled():
+        atomic_write(pair_cache['file'], json.dumps(pair_cache['used']).encode('utf-8'))
+
+
+# element is a profile_elements.AlignedElement, returns None if the results should not be cached
+def element_key(element, version, ancestors=()):
+    definition_digests = base_definitions.get_definition_digests(element, version)
+    if definition_digests is None:
+        return None
+
+    # What the ancestors constrain the element with, and the engine that diffs it, are part of the result
+    content = json.dumps([element.key, element.left, element.right, version, definition_digests,
+                          inherited_elements(ancestors, element.key), line_diff.engine_settings['engine'],
+                          get_tool_version()], sort_keys=True)
+    return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def get(key):
+    result = pair_cache['results'].get(key)
+    if result is None:
+        instrumentation.count('result_cache_misses')
+        return None
+
+    instrumentation.count('result_cache_hits')
+    pair_cache['used'][key] = result
+    return result
+
+
+def put(key, result):
+    pair_cache['used'][key] = result
+
+
+def get_tool_version():
+    if tool['version'] is None:
+        digest = hashlib.sha256()
+        directory = os.path.dirname(os.path.realpath(__file__))
+        for source in TOOL_SOURCES:
+            with open(os.path.join(directory, source), 'rb') as f:
+                digest.update(f.read())
+        tool['version'] = digest.hexdigest()
+
+    return tool['version']
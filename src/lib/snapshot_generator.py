@@ -0,0 +1,214 @@
+import re
+from collections import OrderedDict, namedtuple
+from . import base_definitions
+from . import instrumentation
+
+# Generates the snapshot of a profile that does not have one, from its differential merged over the snapshot
+# of the base definition of its type, so its elements still have their base (see profile_elements).  Elements
+# are laid out as the FHIR tooling's snapshot generators do:
+#
+#   - every element of the base definition is in the snapshot, with the differential's values merged over it
+#   - an element below one the base definition does not expand, e.g. code.coding under a CodeableConcept,
+#     expands its parent from the definition of the parent's (single) type, or its contentReference
+#   - a slice (element:slice) is a copy of the element it slices, after it and its other slices, and a
+#     reslice (element:slice/reslice) a copy of the slice
+#   - a choice type, value[x]:valueQuantity or valueQuantity as in STU3, is a copy of value[x] with only that
+#     type, so expands from it
+#
+# Elements the base definitions do not have are still added, without a base.  Each definition is read into a
+# BaseTree once for each (type, version), which is then copied for each profile.
+BaseTree = namedtuple('BaseTree', ['definition', 'elements', 'children'])
+
+# (type, version) -> BaseTree, least recently used evicted after as many as base_definitions caches.  The
+# definition is kept to check the tree is still for the cached definition.
+base_trees = OrderedDict()
+
+TYPE_CODE = re.compile(r'[A-Za-z][A-Za-z0-9]*')
+
+
+def generate_snapshot(profile, version) -> dict:
+    with instrumentation.span('generate_snapshot', profile=profile.get('name')):
+        nodes = {}
+        root_type = profile['type']
+        root = copy_base_tree(get_base_tree(root_type, version), root_type, root_type, root_type, nodes) or \
+            new_node({'id': root_type, 'path': root_type}, nodes)
+
+        for de in profile['differential']['element']:
+            if 'id' in de:
+                node = get_node(de['id'], root, nodes, version)
+                node['element'].update(de)
+
+        return {'element': list(flatten_nodes(root))}
+
+
+def get_base_tree(resource_type, version) -> BaseTree:
+    definition = base_definitions.get_definition(resource_type, version)
+    tree_key = (resource_type, version)
+
+    if tree_key in base_trees and base_trees[tree_key].definition is definition:
+        base_trees.move_to_end(tree_key)
+        instrumentation.count('base_tree_hits')
+        return base_trees[tree_key]
+
+    instrumentation.count('base_tree_misses')
+    elements = {}
+    children = {}
+    for e in definition.get('snapshot', {}).get('element', []) if definition else []:
+        if 'id' in e and e['id'] not in elements:
+            elements[e['id']] = e
+            if '.' in e['id']:
+                children.setdefault(split_element_id(e['id'])[0], []).append(e['id'])
+
+    base_trees[tree_key] = BaseTree(definition, elements, children)
+    while len(base_trees) > base_definitions.cache_limits['max_entries']:
+        base_trees.popitem(last=False)
+
+    return base_trees[tree_key]
+
+
+# Parent id and the last part of the id, i.e. ('A.code', 'coding:snomedCT') for A.code.coding:snomedCT.  Slice
+# names can not contain a '.'.
+def split_element_id(element_id):
+    parent_id, _, name = element_id.rpartition('.')
+    return parent_id, name
+
+
+# A node is the element, its child nodes in snapshot order, whether the children have been added yet, and
+# the (BaseTree, id) it was copied from, if it was
+def new_node(element, nodes, expanded=False, origin=None) -> dict:
+    node = {'element': element, 'children': [], 'expanded': expanded, 'origin': origin}
+    nodes[element['id']] = node
+    return node
+
+
+def copy_element(base_element, element_id, path) -> dict:
+    base = base_element.get('base') or {k: base_element[k] for k in ['path', 'min', 'max'] if k in base_element}
+    return dict(base_element, id=element_id, path=path, base=dict(base))
+
+
+# Copies the base element with the id and its descendants, as element_id at path
+def copy_base_tree(tree, base_id, element_id, path, nodes):
+    if base_id not in tree.elements:
+        return None
+
+    base_element = tree.elements[base_id]
+    node = new_node(copy_element(base_element, element_id, path), nodes, base_id in tree.children, (tree, base_id))
+    copy_base_children(tree, base_id, node, nodes)
+    return node
+
+
+def copy_base_children(tree, base_id, node, nodes):
+    base_path = tree.elements[base_id].get('path', base_id)
+    for child_id in tree.children.get(base_id, []):
+        child_path = tree.elements[child_id].get('path', child_id)
+        node['children'].append(copy_base_tree(tree, child_id,
+                                               node['element']['id'] + child_id[len(base_id):],
+                                               node['element']['path'] + child_path[len(base_path):],
+                                               nodes))
+
+
+# Adds the children of an element the base definition did not expand, from its type or contentReference, or
+# for a slice those of the element it slices
+def expand_node(node, nodes, version):
+    if node['expanded']:
+        return
+    node['expanded'] = True
+
+    element = node['element']
+    if node['origin'] and node['origin'][1] in node['origin'][0].children:
+        tree, base_id = node['origin']
+    elif 'contentReference' in element:
+        base_id = element['contentReference'].lstrip('#')
+        tree = get_base_tree(base_id.split('.')[0], version)
+    else:
+        codes = {t.get('code') for t in element.get('type', [])}
+        if len(codes) != 1:
+            return
+        base_id = codes.pop()
+        if not isinstance(base_id, str) or not TYPE_CODE.fullmatch(base_id):
+            return
+        tree = get_base_tree(base_id, version)
+
+    if base_id in tree.elements:
+        copy_base_children(tree, base_id, node, nodes)
+
+
+def get_node(element_id, root, nodes, version):
+    if element_id in nodes:
+        return nodes[element_id]
+
+    parent_id, name = split_element_id(element_id)
+    if not parent_id:
+        # Not the profile's type, kept at the end
+        node = new_node({'id': element_id, 'path': element_id}, nodes)
+        root['children'].append(node)
+        return node
+
+    parent = get_node(parent_id, root, nodes, version)
+    expand_node(parent, nodes, version)
+    if element_id in nodes:
+        return nodes[element_id]
+
+    element_name, _, slice_name = name.partition(':')
+    path = parent['element']['path'] + '.' + element_name
+    if slice_name:
+        # A reslice is a slice of the slice
+        sliced_id = parent_id + '.' + element_name + (':' + slice_name.rpartition('/')[0] if '/' in slice_name else '')
+        sliced = get_node(sliced_id, root, nodes, version)
+        # Its children come before its slices
+        expand_node(sliced, nodes, version)
+        element = slice_element(sliced, element_id, sliced['element']['path'])
+        element['sliceName'] = slice_name
+        if element_name.endswith('[x]'):
+            element['type'] = choice_types(element, element_name, slice_name)
+        return insert_after(parent, sliced, new_node(element, nodes, origin=sliced['origin']))
+
+    for choice in parent['children']:
+        choice_name = split_element_id(choice['element']['id'])[1]
+        if choice_name.endswith('[x]') and choice_types(choice['element'], choice_name, name):
+            element = slice_element(choice, element_id, parent['element']['path'] + '.' + name)
+            element['type'] = choice_types(element, choice_name, name)
+            return insert_after(parent, choice, new_node(element, nodes))
+
+    # Not in the base definitions
+    node = new_node({'id': element_id, 'path': path}, nodes)
+    parent['children'].append(node)
+    return node
+
+
+# A copy of the base element a slice is of, or for a reslice of the slice
+def slice_element(sliced, element_id, path):
+    if sliced['origin'] and 'sliceName' not in sliced['element']:
+        tree, base_id = sliced['origin']
+        element = copy_element(tree.elements[base_id], element_id, path)
+    else:
+        element = dict(sliced['element'], id=element_id, path=path)
+    element.pop('slicing', None)
+
+    return element
+
+
+# Types of a choice element that the name of its type slice, valueQuantity for value[x], is for
+def choice_types(element, choice_name, type_name):
+    prefix = choice_name[:-len('[x]')]
+    return [t for t in element.get('type', [])
+            if isinstance(t.get('code'), str) and t['code'] and
+            type_name == prefix + t['code'][0].upper() + t['code'][1:]]
+
+
+# After the sliced element and the slices of it already added
+def insert_after(parent, sliced, node):
+    children = parent['children']
+    position = children.index(sliced) + 1
+    slice_prefix = sliced['element']['id'] + ('/' if 'sliceName' in sliced['element'] else ':')
+    while position < len(children) and children[position]['element']['id'].startswith(slice_prefix):
+        position += 1
+    children.insert(position, node)
+
+    return node
+
+
+def flatten_nodes(node):
+    yield node['element']
+    for child in node['children']:
+        yield from flatten_nodes(child)
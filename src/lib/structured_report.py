@@ -0,0 +1,135 @@
+import json
+import sys
+from contextlib import nullcontext
+from . import base_definitions
+from . import instrumentation
+from . import profile_ancestors
+from . import result_cache
+from .line_diff import diff_lines
+from .profile_diff import iter_detailed_diff
+from .profile_elements import extract_elements
+
+# Machine readable output of the diff, instead of the markdown report.  Each record is a JSON object with
+# a "record" field giving its kind:
+#
+#   header     schema (SCHEMA_VERSION), resourceType, left and right ({name, url, version})
+#   element    id, change ("added", "removed" or "unchanged"), from the element level diff of the
+#              differential element ids, in diff order
+#   component  element (id), component (key), then the fields of profile_diff.ComponentResult:
+#              table_result ([left, right] cells of the report table), match (pretty printed json when the
+#              values are the same objects, otherwise {}), component_diff (line diff of the pretty printed
+#              json when they differ, or the value defined on one side only, otherwise {}) and base
+#              (description of the base element definition's value)
+#   summary    elements and components, the number of element and component records
+#
+# Unlike the markdown report, every component of an element is output, and the results are not kept in the
+# result cache (see result_cache), which holds every result of a run until it is saved.
+#
+# ndjson - one record per line, written as each component is diffed, so the output can be consumed before
+#          the run finishes and the results are never held in memory
+# json   - one object, {"header": {...}, "elements": [...], "components": [...], "summary": {...}}, where
+#          the records are the same, without the "record" field.  Also written as the results are produced.
+SCHEMA_VERSION = 1
+OUTPUT_FORMATS = ['markdown', 'json', 'ndjson']
+DEFAULT_FORMAT = 'markdown'
+FILE_EXTENSIONS = {'json': '.json', 'ndjson': '.ndjson'}
+
+ELEMENT_CHANGES = {' ': 'unchanged', '-': 'removed', '+': 'added'}
+
+
+def header_record(left, left_version, right, right_version):
+    return {'record': 'header',
+            'schema': SCHEMA_VERSION,
+            'resourceType': left['type'],
+            'left': profile_summary(left, left_version),
+            'right': profile_summary(right, right_version)}
+
+
+def profile_summary(profile, version):
+    return {'name': profile.get('name'), 'url': profile.get('url'), 'version': version}
+
+
+def iter_element_records(left, right):
+    left_ids = [e['id'] for e in left['differential']['element'] if 'id' in e]
+    right_ids = [e['id'] for e in right['differential']['element'] if 'id' in e]
+
+    with instrumentation.span('element_diff'):
+        diff = diff_lines(left_ids, right_ids)
+
+    for tag, element_id in diff:
+        yield {'record': 'element', 'id': element_id, 'change': ELEMENT_CHANGES[tag]}
+
+
+def iter_component_records(left, right, version):
+    with instrumentation.span('extract_elements'):
+        left_elements = extract_elements(left, version=version)
+        right_elements = extract_elements(right, version=version)
+
+    ancestors = profile_ancestors.common_ancestors(left, right, version)
+
+    for element_key, component_key, result in iter_detailed_diff(left_elements, right_elements, version,
+                                                                 ancestors=ancestors):
+        yield dict({'record': 'component', 'element': element_key, 'component': component_key}, **result._asdict())
+
+
+def write_structured_report(left, left_version, right, right_version, diff_file, output_format):
+    if output_format not in FILE_EXTENSIONS:
+        raise ValueError('Unknown output format: ' + str(output_format) + '. Available: ' +
+                         ', '.join(FILE_EXTENSIONS))
+
+    base_definitions.prefetch_definitions(base_definitions.required_definitions(left, left_version) |
+                                          base_definitions.required_definitions(right, left_version))
+    header = header_record(left, left_version, right, right_version)
+    elements = iter_element_records(left, right)
+    components = iter_component_records(left, right, left_version)
+
+    # Results are not cached, see above
+    result_cache.clear()
+    # '-' is stdout, flushed per record so a consumer sees each as it is produced
+    with nullcontext(sys.stdout) if diff_file == '-' else open(diff_file, 'w') as out, \
+            instrumentation.span('component_diff'):
+        if output_format == 'ndjson':
+            write_ndjson(header, elements, components, out, flush=diff_file == '-')
+        else:
+            write_json(header, elements, components, out)
+
+    return diff_file
+
+
+def write_ndjson(header, elements, components, out, flush=False):
+    summary = {'record': 'summary', 'elements': 0, 'components': 0}
+
+    write_line(header, out, flush)
+    for section, records in [('elements', elements), ('components', components)]:
+        for record in records:
+            summary[section] += 1
+            write_line(record, out, flush)
+    write_line(summary, out, flush)
+
+
+def write_line(record, out, flush):
+    out.write(json.dumps(record) + '\n')
+    if flush:
+        out.flush()
+
+
+def write_json(header, elements, components, out):
+    summary = {'elements': 0, 'components': 0}
+
+    out.write('{\n"header": ' + json.dumps(without_kind(header)))
+    for section, records in [('elements', elements), ('components', components)]:
+        out.write(',\n"' + section + '": [')
+        for record in records:
+            out.write((',\n' if summary[section] else '\n') + json.dumps(without_kind(record)))
+            summary[section] += 1
+        out.write('\n]')
+    out.write(',\n"summary": ' + json.dumps(summary) + '\n}\n')
+
+
+def without_kind(record):
+    return {k: v for k, v in record.items() if k != 'record'}
+
+
+# Default output filename for a format, i.e. diff.json
+def get_report_filename(output_format):
+    return 'diff' + FILE_EXTENSIONS[output_format]
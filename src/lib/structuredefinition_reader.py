@@ -1,16 +1,40 @@
 import json
 import os
+from . import instrumentation
+from . import json_codec
+from . import json_stream
 
 # Really useful package for converting xml to a dict, but additional logic will be needed to end up
 # with the same format as a straight json, given differences in naming e.g. resourceType
 # import xmltodict
 
+# Profiles at least this size are read a section at a time, with only what the diff uses
+SECTION_READ_BYTES = 16 * 1024 * 1024
+
+reader_settings = {'section_read_bytes': SECTION_READ_BYTES}
+
+# Top level fields kept by read_profile_sections, the differential in full and, from the snapshot, the id
+# and base of each element.  Everything else, i.e. the snapshot's element definitions, text, contained
+# resources, is skipped.
+PROFILE_FIELDS = ['resourceType', 'id', 'url', 'version', 'name', 'title', 'status', 'fhirVersion', 'kind',
+                  'abstract', 'type', 'baseDefinition', 'derivation']
+SNAPSHOT_ELEMENT_FIELDS = ['id', 'base']
+
+
+def set_section_read_bytes(section_read_bytes):
+    reader_settings['section_read_bytes'] = section_read_bytes
+
 
 def read_profile(filename):
     input_file_extension = os.path.splitext(filename)[1]
 
     if input_file_extension.lower() == '.json':
-        profile = json.load(open(filename))
+        with instrumentation.span('read_profile', file=filename):
+            if os.path.getsize(filename) >= reader_settings['section_read_bytes']:
+                profile = read_profile_sections(filename)
+            else:
+                with open(filename, 'rb') as f:
+                    profile = json_codec.loads(f.read())
         # Must at least have a differential
         check_profile(profile, 'differential')
         return profile, *get_profile_meta(profile)
@@ -25,6 +49,35 @@ def read_profile(filename):
         raise TypeError('Unrecognised file extension: ' + input_file_extension)
 
 
+def read_profile_sections(filename):
+    return json_stream.read_document(filename, read_profile_object)
+
+
+# A profile from part of a buffer, e.g. an entry in a Bundle, read a section at a time if it is large
+def read_profile_buffer(buffer, start, end):
+    if end - start >= reader_settings['section_read_bytes']:
+        return read_profile_object(buffer, json_stream.skip_whitespace(buffer, start))[0]
+
+    return json_codec.loads(buffer[start:end])
+
+
+def read_profile_object(buffer, position):
+    return json_stream.read_object(buffer, position, PROFILE_READERS)
+
+
+def read_elements(item_reader):
+    def read_view(buffer, position):
+        return json_stream.read_object(buffer, position, {
+            'element': lambda b, p: json_stream.read_array(b, p, item_reader)})
+
+    return read_view
+
+
+PROFILE_READERS = dict({field: json_stream.read_value for field in PROFILE_FIELDS},
+                       differential=read_elements(json_stream.read_value),
+                       snapshot=read_elements(json_stream.member_reader(SNAPSHOT_ELEMENT_FIELDS)))
+
+
 def check_profile(profile, view):
     if not isinstance(profile, dict):
         raise ValueError('Unexpected data types for element diff.\n\nProfile -> ' + str(profile))
@@ -1,6 +1,11 @@
 import pytest
 from pytest_lazyfixture import lazy_fixture
-import os, json
+import os, json, threading, time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from ...lib.profile_elements import AlignedElement
+from ...lib.profile_diff import ComponentResult
+from unittest import mock
+from collections import OrderedDict
 
 TEST_DIR = os.path.dirname(os.path.realpath(__file__))
 DATA_DIR = TEST_DIR + '/../data'
@@ -11,6 +16,59 @@ def data_dir():
     return DATA_DIR
 
 
+@pytest.fixture
+def local_definitions(data_dir):
+    # Base definitions read from the test data, an empty definition for anything else
+    def read_definition(resource_type, version):
+        filename = data_dir + '/' + resource_type.lower() + '.profile.json'
+        return open(filename).read() if os.path.exists(filename) else '{}'
+
+    with mock.patch('src.lib.base_definitions.resource_cache', OrderedDict()), \
+            mock.patch('src.lib.base_definitions.read_definition', side_effect=read_definition) as mocked:
+        yield mocked
+
+
+@pytest.fixture
+def stub_definition_server():
+    # Serves /<fhir version>/<type>.profile.json from the test data, slowly, counting requests per path.
+    # Paths listed in server.fail_once return a 503 the first time they are requested.
+    requests_seen = []
+    fail_once = set()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            time.sleep(0.05)
+            filename = DATA_DIR + '/' + self.path.rsplit('/', 1)[1].lower()
+            if self.path in fail_once:
+                fail_once.discard(self.path)
+                self.send_response(503)
+                self.end_headers()
+            elif os.path.exists(filename):
+                content = open(filename, 'rb').read()
+                self.send_response(200)
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+            else:
+                self.send_response(404)
+                self.send_header('Content-Length', '0')
+                self.end_headers()
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+    server.requests_seen = requests_seen
+    server.fail_once = fail_once
+    server.base_url = 'http://127.0.0.1:' + str(server.server_address[1]) + '/'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
 @pytest.fixture
 def data_allergyintolerance_stu3_base_profile() -> dict:
     test_data = open(DATA_DIR + '/allergyintolerance.profile.json')
@@ -161,125 +219,15 @@ def data_elements_valid_with_or_without_base_path():
 def data_left_right_elements_aligned_valid():
     return \
         [
-            {
-                "AllergyIntolerance.extension": (
-                    {
-                        "id": "AllergyIntolerance.extension",
-                        "path": "AllergyIntolerance.extension",
-                        "slicing": {
-                            "discriminator": [{"type": "value", "path": "url"}],
-                            "rules": "closed",
-                        },
-                    },
-                    {
-                        "id": "AllergyIntolerance.extension",
-                        "path": "AllergyIntolerance.extension",
-                        "slicing": {
-                            "discriminator": [{"type": "value", "path": "url"}],
-                            "rules": "open",
-                        },
-                    },
-                )
-            },
-            {
-                "AllergyIntolerance.extension:encounter": (
-                    {
-                        "id": "AllergyIntolerance.extension:encounter",
-                        "path": "AllergyIntolerance.extension",
-                        "sliceName": "encounter",
-                        "max": "1",
-                        "type": [
-                            {
-                                "code": "Extension",
-                                "profile": "http://hl7.org/fhir/StructureDefinition/encounter-associatedEncounter-LEFT",
-                            }
-                        ],
-                    },
-                    {
-                        "id": "AllergyIntolerance.extension:encounter",
-                        "path": "AllergyIntolerance.extension",
-                        "sliceName": "encounter",
-                        "max": "*",
-                        "type": [
-                            {
-                                "code": "Extension",
-                                "profile": "http://hl7.org/fhir/StructureDefinition/encounter-associatedEncounter-RIGHT",
-                            }
-                        ],
-                    },
-                )
-            },
-            {
-                "AllergyIntolerance.extension:allergyEnd": (
-                    {
-                        "id": "AllergyIntolerance.extension:allergyEnd",
-                        "path": "AllergyIntolerance.extension",
-                        "sliceName": "allergyEnd",
-                        "max": "1",
-                        "type": [
-                            {
-                                "code": "Extension",
-                                "profile": "https://fhir.hl7.org.uk/STU3/StructureDefinition/Extension-CareConnect-AllergyIntoleranceEnd-1",
-                            }
-                        ],
-                    },
-                    {
-                        "id": "AllergyIntolerance.extension:allergyEnd",
-                        "path": "AllergyIntolerance.extension",
-                        "sliceName": "allergyEnd",
-                        "max": "1",
-                        "type": [
-                            {
-                                "code": "Extension",
-                                "profile": "https://fhir.nhs.uk/STU3/StructureDefinition/Extension-CareConnect-GPC-AllergyIntoleranceEnd-1",
-                            }
-                        ],
-                    },
-                )
-            },
-            {
-                "AllergyIntolerance.extension:evidence": (
-                    {
-                        "id": "AllergyIntolerance.extension:evidence",
-                        "path": "AllergyIntolerance.extension",
-                        "sliceName": "evidence",
-                        "max": "1",
-                        "type": [
-                            {
-                                "code": "Extension",
-                                "profile": "https://fhir.hl7.org.uk/STU3/StructureDefinition/Extension-CareConnect-Evidence-1",
-                            }
-                        ],
-                    },
-                    {},
-                )
-            },
-            {
-                "AllergyIntolerance.identifier.system": (
-                    {},
-                    {
-                        "id": "AllergyIntolerance.identifier.system",
-                        "path": "AllergyIntolerance.identifier.system",
-                        "min": 1,
-                    },
-                )
-            },
-        ]
-
-
-@pytest.fixture
-def data_left_right_elements_operands_left_base_path():
-    return \
-        {
-            "AllergyIntolerance.extension": (
+            AlignedElement(
+                "AllergyIntolerance.extension",
                 {
                     "id": "AllergyIntolerance.extension",
                     "path": "AllergyIntolerance.extension",
                     "slicing": {
                         "discriminator": [{"type": "value", "path": "url"}],
-                        "rules": "open",
+                        "rules": "closed",
                     },
-                    "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
                 },
                 {
                     "id": "AllergyIntolerance.extension",
@@ -288,36 +236,139 @@ def data_left_right_elements_operands_left_base_path():
                         "discriminator": [{"type": "value", "path": "url"}],
                         "rules": "open",
                     },
-                    "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
                 },
-            )
-        }
-
-
-@pytest.fixture
-def data_left_right_elements_operands_right_base_path():
-    return \
-        {
-            "AllergyIntolerance.extension": (
+            ),
+            AlignedElement(
+                "AllergyIntolerance.extension:encounter",
                 {
-                    "id": "AllergyIntolerance.extension",
+                    "id": "AllergyIntolerance.extension:encounter",
                     "path": "AllergyIntolerance.extension",
-                    "slicing": {
-                        "discriminator": [{"type": "value", "path": "url"}],
-                        "rules": "open",
-                    }
+                    "sliceName": "encounter",
+                    "max": "1",
+                    "type": [
+                        {
+                            "code": "Extension",
+                            "profile": "http://hl7.org/fhir/StructureDefinition/encounter-associatedEncounter-LEFT",
+                        }
+                    ],
                 },
                 {
-                    "id": "AllergyIntolerance.extension",
+                    "id": "AllergyIntolerance.extension:encounter",
                     "path": "AllergyIntolerance.extension",
-                    "slicing": {
-                        "discriminator": [{"type": "value", "path": "url"}],
-                        "rules": "open",
-                    },
-                    "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
+                    "sliceName": "encounter",
+                    "max": "*",
+                    "type": [
+                        {
+                            "code": "Extension",
+                            "profile": "http://hl7.org/fhir/StructureDefinition/encounter-associatedEncounter-RIGHT",
+                        }
+                    ],
                 },
-            )
-        }
+            ),
+            AlignedElement(
+                "AllergyIntolerance.extension:allergyEnd",
+                {
+                    "id": "AllergyIntolerance.extension:allergyEnd",
+                    "path": "AllergyIntolerance.extension",
+                    "sliceName": "allergyEnd",
+                    "max": "1",
+                    "type": [
+                        {
+                            "code": "Extension",
+                            "profile": "https://fhir.hl7.org.uk/STU3/StructureDefinition/Extension-CareConnect-AllergyIntoleranceEnd-1",
+                        }
+                    ],
+                },
+                {
+                    "id": "AllergyIntolerance.extension:allergyEnd",
+                    "path": "AllergyIntolerance.extension",
+                    "sliceName": "allergyEnd",
+                    "max": "1",
+                    "type": [
+                        {
+                            "code": "Extension",
+                            "profile": "https://fhir.nhs.uk/STU3/StructureDefinition/Extension-CareConnect-GPC-AllergyIntoleranceEnd-1",
+                        }
+                    ],
+                },
+            ),
+            AlignedElement(
+                "AllergyIntolerance.extension:evidence",
+                {
+                    "id": "AllergyIntolerance.extension:evidence",
+                    "path": "AllergyIntolerance.extension",
+                    "sliceName": "evidence",
+                    "max": "1",
+                    "type": [
+                        {
+                            "code": "Extension",
+                            "profile": "https://fhir.hl7.org.uk/STU3/StructureDefinition/Extension-CareConnect-Evidence-1",
+                        }
+                    ],
+                },
+                {},
+            ),
+            AlignedElement(
+                "AllergyIntolerance.identifier.system",
+                {},
+                {
+                    "id": "AllergyIntolerance.identifier.system",
+                    "path": "AllergyIntolerance.identifier.system",
+                    "min": 1,
+                },
+            ),
+        ]
+
+
+@pytest.fixture
+def data_left_right_elements_operands_left_base_path():
+    return \
+        AlignedElement(
+            "AllergyIntolerance.extension",
+            {
+                "id": "AllergyIntolerance.extension",
+                "path": "AllergyIntolerance.extension",
+                "slicing": {
+                    "discriminator": [{"type": "value", "path": "url"}],
+                    "rules": "open",
+                },
+                "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
+            },
+            {
+                "id": "AllergyIntolerance.extension",
+                "path": "AllergyIntolerance.extension",
+                "slicing": {
+                    "discriminator": [{"type": "value", "path": "url"}],
+                    "rules": "open",
+                },
+                "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
+            },
+        )
+
+
+@pytest.fixture
+def data_left_right_elements_operands_right_base_path():
+    return \
+        AlignedElement(
+            "AllergyIntolerance.extension",
+            {
+                "id": "AllergyIntolerance.extension",
+                "path": "AllergyIntolerance.extension",
+                "slicing": {
+                    "discriminator": [{"type": "value", "path": "url"}],
+                    "rules": "open",
+                }
+            },
+            {
+                "id": "AllergyIntolerance.extension",
+                "path": "AllergyIntolerance.extension",
+                "slicing": {
+                    "discriminator": [{"type": "value", "path": "url"}],
+                    "rules": "open",
+                },
+                "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
+            },
+        )
 
 
 @pytest.fixture
@@ -341,28 +392,27 @@ def data_left_right_elements_operands_right_base_path_left_pretty():
 @pytest.fixture
 def data_left_right_elements_operands_non_matching_base_path():
     return \
-        {
-            "AllergyIntolerance.extension": (
-                {
-                    "id": "AllergyIntolerance.extension",
-                    "path": "AllergyIntolerance.extension",
-                    "slicing": {
-                        "discriminator": [{"type": "value", "path": "url"}],
-                        "rules": "open",
-                    },
-                    "base": {"path": "non_matching_resource.extension", "min": 0, "max": "*"},
+        AlignedElement(
+            "AllergyIntolerance.extension",
+            {
+                "id": "AllergyIntolerance.extension",
+                "path": "AllergyIntolerance.extension",
+                "slicing": {
+                    "discriminator": [{"type": "value", "path": "url"}],
+                    "rules": "open",
                 },
-                {
-                    "id": "AllergyIntolerance.extension",
-                    "path": "AllergyIntolerance.extension",
-                    "slicing": {
-                        "discriminator": [{"type": "value", "path": "url"}],
-                        "rules": "open",
-                    },
-                    "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
+                "base": {"path": "non_matching_resource.extension", "min": 0, "max": "*"},
+            },
+            {
+                "id": "AllergyIntolerance.extension",
+                "path": "AllergyIntolerance.extension",
+                "slicing": {
+                    "discriminator": [{"type": "value", "path": "url"}],
+                    "rules": "open",
                 },
-            )
-        }
+                "base": {"path": "DomainResource.extension", "min": 0, "max": "*"},
+            },
+        )
 
 
 @pytest.fixture(params=[
@@ -476,18 +526,12 @@ def data_operands_right_base_path_right():
 @pytest.fixture
 def data_component_diff_allergyintolerance_results():
     return \
-        {
-            'AllergyIntolerance.extension':
-                {
-                    'slicing':
-                        {
-                            'table_result': ('Match', 'Match'),
-                            'match': '{\n  "discriminator": [\n    {\n      "path": "url",\n      "type": "value"\n    }\n  ],\n  "rules": "open"\n}',
-                            'component_diff': {},
-                            'base': '```json\n{\n  "description": "Extensions are always sliced by (at least) url",\n  "discriminator": [\n    {\n      "path": "url",\n      "type": "value"\n    }\n  ],\n  "rules": "open"\n}\n```'
-                        }
-                }
-        }
+        ComponentResult(
+            table_result=('Match', 'Match'),
+            match='{\n  "discriminator": [\n    {\n      "path": "url",\n      "type": "value"\n    }\n  ],\n  "rules": "open"\n}',
+            component_diff={},
+            base='```json\n{\n  "description": "Extensions are always sliced by (at least) url",\n  "discriminator": [\n    {\n      "path": "url",\n      "type": "value"\n    }\n  ],\n  "rules": "open"\n}\n```'
+        )
 
 
 @pytest.fixture
@@ -1,12 +1,13 @@
 import pytest
 from parameterized import parameterized
 from ...lib import base_definitions
+from ...lib.profile_elements import AlignedElement
 from unittest import mock
-from collections import namedtuple
+from collections import namedtuple, OrderedDict
 
 
 # ----------------------- MOCKS -----------------------
-def mocked_response(url):
+def mocked_response(url, headers=None):
     Decode = namedtuple('Decode', 'decode')
     Response = namedtuple('Response', 'content ok status')
     # Lambda is mocking the decode function for the content object in the response
@@ -38,7 +39,7 @@ def test_get_profile_url_invalid(data_basic_primitive):
 
 
 @mock.patch('src.lib.base_definitions.get_profile_url', lambda resource_type, version: 'VALID_URL')
-@mock.patch('requests.get', side_effect=mocked_response)
+@mock.patch('src.lib.definition_cache.http_get', side_effect=mocked_response)
 def test_download_definition_valid(mocked):
     output_data = base_definitions.download_definition('AllergyIntolerance', '3.0.2')
     expected_data = {'responseType': 'AllergyIntolerance'}
@@ -46,7 +47,7 @@ def test_download_definition_valid(mocked):
 
 
 @mock.patch('src.lib.base_definitions.get_profile_url', lambda resource_type, version: 'NOT_FOUND')
-@mock.patch('requests.get', side_effect=mocked_response)
+@mock.patch('src.lib.definition_cache.http_get', side_effect=mocked_response)
 def test_download_definition_not_found(mocked):
     output_data = base_definitions.download_definition('AllergyIntolerance', '3.0.2')
     expected_data = '{}'
@@ -54,22 +55,63 @@ def test_download_definition_not_found(mocked):
 
 
 @mock.patch('src.lib.base_definitions.download_definition',
-            lambda resource_type, version: {'responseType': 'AllergyIntolerance'})
-@mock.patch('src.lib.base_definitions.resource_cache', {})
+            lambda resource_type, version: '{"type": "AllergyIntolerance", "snapshot": {"element": []}}')
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
 def test_get_definition_valid_not_found():
     output_data = base_definitions.get_definition('AllergyIntolerance', '3.0.2')
-    expected_data = {'responseType': 'AllergyIntolerance'}
+    expected_data = {'type': 'AllergyIntolerance', 'snapshot': {'element': []}}
     assert output_data == expected_data
 
 
 @mock.patch('src.lib.base_definitions.resource_cache',
-            {'AllergyIntolerance3.0.2': {'responseType': 'AllergyIntolerance'}})
+            OrderedDict({'AllergyIntolerance3.0.2': ({'responseType': 'AllergyIntolerance'}, {}, 0)}))
 def test_get_definition_valid_found():
     output_data = base_definitions.get_definition('AllergyIntolerance', '3.0.2')
     expected_data = {'responseType': 'AllergyIntolerance'}
     assert output_data == expected_data
 
 
+@mock.patch('src.lib.base_definitions.download_definition',
+            lambda resource_type, version: '{"snapshot": {"element": [{"id": "AllergyIntolerance.Extension"}]}}')
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+def test_get_element_index_valid():
+    output_data = base_definitions.get_element_index('AllergyIntolerance', '3.0.2')
+    expected_data = {'allergyintolerance.extension': {'id': 'AllergyIntolerance.Extension'}}
+    assert output_data == expected_data
+
+
+@mock.patch('src.lib.base_definitions.download_definition', side_effect=lambda resource_type, version: '{}')
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+def test_get_definition_cached(mocked):
+    base_definitions.get_definition('AllergyIntolerance', '3.0.2')
+    base_definitions.get_definition('AllergyIntolerance', '3.0.2')
+    mocked.assert_called_once_with('AllergyIntolerance', '3.0.2')
+
+
+@mock.patch('src.lib.base_definitions.download_definition', lambda resource_type, version: '{}')
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+@mock.patch('src.lib.base_definitions.cache_limits', {'max_entries': 2, 'max_bytes': 1024})
+def test_get_definition_evicts_least_recently_used():
+    base_definitions.get_definition('AllergyIntolerance', '3.0.2')
+    base_definitions.get_definition('Patient', '3.0.2')
+    base_definitions.get_definition('AllergyIntolerance', '3.0.2')
+    base_definitions.get_definition('Encounter', '3.0.2')
+    output_data = list(base_definitions.resource_cache.keys())
+    expected_data = ['AllergyIntolerance3.0.2', 'Encounter3.0.2']
+    assert output_data == expected_data
+
+
+@mock.patch('src.lib.base_definitions.download_definition', lambda resource_type, version: '{}')
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+@mock.patch('src.lib.base_definitions.cache_limits', {'max_entries': 64, 'max_bytes': 3})
+def test_get_definition_evicts_over_byte_limit():
+    base_definitions.get_definition('AllergyIntolerance', '3.0.2')
+    base_definitions.get_definition('Patient', '3.0.2')
+    output_data = list(base_definitions.resource_cache.keys())
+    expected_data = ['Patient3.0.2']
+    assert output_data == expected_data
+
+
 def test_search_definition_valid(data_domainresource_stu3_base_profile):
     output_data = base_definitions.search_definition(data_domainresource_stu3_base_profile,
                                                      'DomainResource.extension',
@@ -101,6 +143,14 @@ def test_search_definition_no_snapshot(data_snapshot_element_empty, data_input_e
     assert 'Snapshot is missing from base definition' in str(exception_info)
 
 
+def test_search_definition_case_insensitive(data_domainresource_stu3_base_profile):
+    output_data = base_definitions.search_definition(data_domainresource_stu3_base_profile,
+                                                     'domainresource.EXTENSION',
+                                                     'min')
+    expected_data = 0
+    assert output_data == expected_data
+
+
 def test_search_definition_empty_input(data_input_empty):
     output_data = base_definitions.search_definition(data_input_empty, data_input_empty, data_input_empty)
     expected_data = {}
@@ -125,7 +175,8 @@ def test_get_element_base_path_non_matching_base_path(data_left_right_elements_o
     assert 'Corresponding elements do not have the same base path definition' in str(exception_info)
 
 
-@mock.patch('src.lib.base_definitions.get_definition',
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+@mock.patch('src.lib.base_definitions.download_definition',
             lambda resource_type,
                    version: '{"snapshot": {"element": [{"id": "DomainResource.extension", "min": 0}]}}')
 def test_check_defined_base_path(data_left_right_elements_operands_base_path):
@@ -144,7 +195,8 @@ def test_check_defined_base_path_no_base_path(data_left_right_elements_operands_
     assert output_data == expected_data
 
 
-@mock.patch('src.lib.base_definitions.get_definition',
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+@mock.patch('src.lib.base_definitions.download_definition',
             lambda resource_type,
                    version: '{"snapshot": {"element": [{"id": "AllergyIntolerance.extension", "min": 0}]}}')
 def test_check_base_definition(data_left_right_elements_operands_base_path):
@@ -155,7 +207,8 @@ def test_check_base_definition(data_left_right_elements_operands_base_path):
     assert output_data == expected_data
 
 
-@mock.patch('src.lib.base_definitions.get_definition',
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+@mock.patch('src.lib.base_definitions.download_definition',
             lambda resource_type,
                    version: '{"snapshot": {"element": [{"id": "AllergyIntolerance.extension", "min": 0}]}}')
 def test_get_base_component_check_base_definition_found(data_left_right_elements_operands_base_path):
@@ -166,7 +219,8 @@ def test_get_base_component_check_base_definition_found(data_left_right_elements
     assert output_data == expected_data
 
 
-@mock.patch('src.lib.base_definitions.get_definition',
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+@mock.patch('src.lib.base_definitions.download_definition',
             lambda resource_type,
                    version: '{"snapshot": {"element": [{"id": "DomainResource.extension", "min": 0}]}}')
 def test_get_base_component_check_defined_base_path_found(data_left_right_elements_operands_base_path):
@@ -177,3 +231,67 @@ def test_get_base_component_check_defined_base_path_found(data_left_right_elemen
     assert output_data == expected_data
 
 
+
+
+def test_required_definitions(data_allergyintolerance_stu3_base_profile):
+    output_data = base_definitions.required_definitions(data_allergyintolerance_stu3_base_profile, '3.0.2')
+    expected_data = {('AllergyIntolerance', '3.0.2')}
+    assert output_data == expected_data
+
+
+def test_required_definitions_differential_only():
+    profile = {'differential': {'element': [{'id': 'AllergyIntolerance.reaction.note'}]},
+               'snapshot': {'element': [{'id': 'AllergyIntolerance.reaction',
+                                         'base': {'path': 'AllergyIntolerance.reaction'}},
+                                        {'id': 'AllergyIntolerance.reaction.id', 'base': {'path': 'Element.id'}},
+                                        {'id': 'AllergyIntolerance.reaction.modifierExtension',
+                                         'base': {'path': 'BackboneElement.modifierExtension'}},
+                                        {'id': 'AllergyIntolerance.reaction.note',
+                                         'base': {'path': 'AllergyIntolerance.reaction.note'}},
+                                        {'id': 'AllergyIntolerance.reaction.note.text',
+                                         'base': {'path': 'Annotation.text'}}]}}
+    output_data = base_definitions.required_definitions(profile, '3.0.2')
+    expected_data = {('AllergyIntolerance', '3.0.2')}
+    assert output_data == expected_data
+
+    profile['differential']['element'].append({'id': 'AllergyIntolerance.reaction.note.text'})
+    output_data = base_definitions.required_definitions(profile, '3.0.2')
+    expected_data = {('AllergyIntolerance', '3.0.2'), ('Annotation', '3.0.2')}
+    assert output_data == expected_data
+
+
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+def test_prefetch_definitions(stub_definition_server):
+    required = {('AllergyIntolerance', '3.0.2'), ('DomainResource', '3.0.2'), ('Element', '3.0.2')}
+    with mock.patch('src.lib.base_definitions.BASE_URL', stub_definition_server.base_url):
+        base_definitions.prefetch_definitions(required)
+        base_definitions.prefetch_definitions(required)
+    output_data = sorted(stub_definition_server.requests_seen)
+    expected_data = ['/STU3/AllergyIntolerance.profile.json',
+                     '/STU3/DomainResource.profile.json',
+                     '/STU3/Element.profile.json']
+    assert output_data == expected_data
+    assert base_definitions.get_definition('Element', '3.0.2') == {}
+    assert base_definitions.get_definition('DomainResource', '3.0.2')['type'] == 'DomainResource'
+
+
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+def test_prefetch_definitions_retried(stub_definition_server):
+    stub_definition_server.fail_once.add('/STU3/DomainResource.profile.json')
+    with mock.patch('src.lib.base_definitions.BASE_URL', stub_definition_server.base_url):
+        base_definitions.prefetch_definitions({('DomainResource', '3.0.2')})
+    assert len(stub_definition_server.requests_seen) == 2
+    assert base_definitions.get_definition('DomainResource', '3.0.2')['type'] == 'DomainResource'
+
+
+@mock.patch('src.lib.base_definitions.get_base_component', return_value={'code': 'Extension'})
+def test_get_base_component_memo(mocked):
+    base_components = {}
+    element = AlignedElement('AllergyIntolerance.extension:encounter',
+                             {'base': {'path': 'DomainResource.extension'}}, {})
+    base_definitions.get_base_component_memo(base_components, element, 'type', '3.0.1')
+    output_data = base_definitions.get_base_component_memo(base_components, element._replace(right=element.left),
+                                                           'type', '3.0.1')
+    expected_data = {'code': 'Extension'}
+    assert output_data == expected_data
+    mocked.assert_called_once()
@@ -0,0 +1,126 @@
+import json
+import os
+import shutil
+import pytest
+from ...lib import batch_diff
+from ...lib import profile_args
+from unittest import mock
+
+TEMPLATE = os.path.dirname(os.path.realpath(profile_args.__file__)) + profile_args.DEFAULT_TEMPLATE
+
+
+# ----------------------- MOCKS -----------------------
+@pytest.fixture
+def profile_dirs(tmp_path, data_dir):
+    left_dir = tmp_path / 'left'
+    right_dir = tmp_path / 'right'
+    left_dir.mkdir()
+    right_dir.mkdir()
+    shutil.copy(data_dir + '/CareConnect-AllergyIntolerance-1.json', str(left_dir))
+    shutil.copy(data_dir + '/CareConnect-GPC-AllergyIntolerance-1.json', str(right_dir))
+    # Not a profile, should be ignored
+    with open(str(left_dir / 'notes.json'), 'w') as f:
+        json.dump({'resourceType': 'Basic'}, f)
+    return str(left_dir), str(right_dir)
+
+
+# ----------------------- MOCKS -----------------------
+
+
+def test_read_manifest_csv(tmp_path):
+    manifest = tmp_path / 'pairs.csv'
+    manifest.write_text('left,right,leftversion,rightversion\na.json,b.json,3,\n')
+    output_data = batch_diff.read_manifest(str(manifest))
+    expected_data = [{'left': str(tmp_path / 'a.json'), 'right': str(tmp_path / 'b.json'),
+                      'leftversion': '3', 'rightversion': None}]
+    assert output_data == expected_data
+
+
+def test_read_manifest_json(tmp_path):
+    manifest = tmp_path / 'pairs.json'
+    manifest.write_text(json.dumps([{'left': 'a.json', 'right': 'b.json', 'leftversion': 3}]))
+    output_data = batch_diff.read_manifest(str(manifest))
+    expected_data = [{'left': str(tmp_path / 'a.json'), 'right': str(tmp_path / 'b.json'),
+                      'leftversion': '3', 'rightversion': None}]
+    assert output_data == expected_data
+
+
+def test_read_manifest_missing_right(tmp_path):
+    manifest = tmp_path / 'pairs.json'
+    manifest.write_text(json.dumps([{'left': 'a.json'}]))
+    with pytest.raises(ValueError) as exception_info:
+        batch_diff.read_manifest(str(manifest))
+    assert 'Manifest entry must have a left and right profile' in str(exception_info)
+
+
+def test_read_manifest_unrecognised(tmp_path):
+    manifest = tmp_path / 'pairs.txt'
+    manifest.write_text('')
+    with pytest.raises(TypeError) as exception_info:
+        batch_diff.read_manifest(str(manifest))
+    assert 'Unrecognised manifest file extension' in str(exception_info)
+
+
+def test_match_directories(profile_dirs):
+    output_data = batch_diff.match_directories(*profile_dirs)
+    expected_data = ([{'left': profile_dirs[0] + '/CareConnect-AllergyIntolerance-1.json',
+                       'right': profile_dirs[1] + '/CareConnect-GPC-AllergyIntolerance-1.json',
+                       'leftversion': None,
+                       'rightversion': None}], [])
+    assert output_data == expected_data
+
+
+def test_match_directories_duplicate_type(profile_dirs, data_dir):
+    shutil.copy(data_dir + '/CareConnect-GPC-AllergyIntolerance-1.json', profile_dirs[0])
+    with pytest.raises(ValueError) as exception_info:
+        batch_diff.match_directories(*profile_dirs)
+    assert 'More than one profile with resource type AllergyIntolerance' in str(exception_info)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_batch_diff(workers, local_definitions, profile_dirs, tmp_path):
+    pairs, unmatched = batch_diff.match_directories(*profile_dirs)
+    output_dir = str(tmp_path / 'out')
+    output_data = batch_diff.batch_diff(pairs, output_dir, TEMPLATE, workers=workers)
+    expected_report = 'CareConnect-AllergyIntolerance-1__CareConnect-GPC-AllergyIntolerance-1.md'
+    assert [r['error'] for r in output_data] == [None]
+    assert [r['report'] for r in output_data] == [expected_report]
+    assert sorted(os.listdir(output_dir)) == [expected_report, 'index.json', 'index.md']
+    # Base definitions are only read up front, once per resource type
+    assert sorted(c.args[0] for c in local_definitions.call_args_list) == \
+           sorted(set(c.args[0] for c in local_definitions.call_args_list))
+
+
+def test_batch_diff_error_recorded(local_definitions, profile_dirs, tmp_path):
+    pairs, unmatched = batch_diff.match_directories(*profile_dirs)
+    output_dir = str(tmp_path / 'out')
+    with mock.patch('src.lib.profile_report.write_report', side_effect=ValueError('Broken\nmore')):
+        output_data = batch_diff.batch_diff(pairs, output_dir, TEMPLATE, workers=1, unmatched=['x.json'])
+    assert output_data[0]['error'] == 'ValueError: Broken'
+    assert json.load(open(output_dir + '/index.json'))['unmatched'] == ['x.json']
+
+
+def test_batch_diff_pair_error_recorded(local_definitions, profile_dirs, tmp_path):
+    pairs, unmatched = batch_diff.match_directories(*profile_dirs)
+    other_type = str(tmp_path / 'other.json')
+    with open(other_type, 'w') as f:
+        json.dump(dict(json.load(open(pairs[0]['right'])), type='Observation'), f)
+    pairs = [{'left': profile_dirs[0] + '/missing.json', 'right': pairs[0]['right'], 'leftversion': None,
+              'rightversion': None},
+             {'left': pairs[0]['left'], 'right': other_type, 'leftversion': None, 'rightversion': None}] + pairs
+    output_dir = str(tmp_path / 'out')
+    output_data = batch_diff.batch_diff(pairs, output_dir, TEMPLATE, workers=1)
+    assert [r['error'].split(':')[0] if r['error'] else None for r in output_data] == \
+           ['FileNotFoundError', 'ValueError', None]
+    assert [r['left_name'] for r in output_data] == \
+           ['missing', 'CareConnect-AllergyIntolerance-1', 'CareConnect-AllergyIntolerance-1']
+    assert [r['report'] is None for r in output_data] == [True, True, False]
+    assert len(json.load(open(output_dir + '/index.json'))['results']) == 3
+    assert 'ValueError: Profile resource types do not match.' in open(output_dir + '/index.md').read()
+
+
+def test_assign_report_files_unique():
+    jobs = [{'left_name': 'a', 'right_name': 'b'}, {'left_name': 'a', 'right_name': 'b'}]
+    output_data = [j['report'] for j in batch_diff.assign_report_files(jobs, TEMPLATE)]
+    expected_data = ['a__b.md', 'a__b-2.md']
+    assert output_data == expected_data
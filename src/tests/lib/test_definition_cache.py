@@ -0,0 +1,173 @@
+import os
+import time
+import pytest
+import requests
+from ...lib import definition_cache
+from unittest import mock
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+
+# ----------------------- MOCKS -----------------------
+Response = namedtuple('Response', 'content ok status_code headers')
+
+
+def ok_response(url, headers=None):
+    return Response(b'{"type": "AllergyIntolerance"}', True, 200,
+                    {'ETag': '"abc"', 'Last-Modified': 'Wed, 21 Oct 2015 07:28:00 GMT'})
+
+
+def not_modified_response(url, headers=None):
+    assert headers == {'If-None-Match': '"abc"', 'If-Modified-Since': 'Wed, 21 Oct 2015 07:28:00 GMT'}
+    return Response(b'', False, 304, {})
+
+
+def not_found_response(url, headers=None):
+    return Response(b'', False, 404, {})
+
+
+def server_error_response(url, headers=None):
+    return Response(b'', False, 500, {})
+
+
+@pytest.fixture
+def cache_directory(tmp_path):
+    with mock.patch('src.lib.definition_cache.cache_settings', {'directory': str(tmp_path),
+                                                               'offline': False,
+                                                               'max_age': 60,
+                                                               'negative_ttl': 60}):
+        yield str(tmp_path)
+
+
+# ----------------------- MOCKS -----------------------
+
+
+@mock.patch('src.lib.definition_cache.http_get', side_effect=ok_response)
+def test_fetch_valid(mocked, cache_directory):
+    output_data = definition_cache.fetch('VALID_URL')
+    expected_data = '{"type": "AllergyIntolerance"}'
+    assert output_data == expected_data
+    assert len(os.listdir(os.path.join(cache_directory, 'objects'))) == 1
+
+
+@mock.patch('src.lib.definition_cache.http_get', side_effect=ok_response)
+def test_fetch_fresh_uses_cache(mocked, cache_directory):
+    definition_cache.fetch('VALID_URL')
+    output_data = definition_cache.fetch('VALID_URL')
+    expected_data = '{"type": "AllergyIntolerance"}'
+    assert output_data == expected_data
+    mocked.assert_called_once()
+
+
+def test_fetch_stale_revalidates(cache_directory):
+    with mock.patch('src.lib.definition_cache.http_get', side_effect=ok_response):
+        definition_cache.fetch('VALID_URL')
+
+    definition_cache.cache_settings['max_age'] = 0
+    with mock.patch('src.lib.definition_cache.http_get', side_effect=not_modified_response) as mocked:
+        output_data = definition_cache.fetch('VALID_URL')
+    expected_data = '{"type": "AllergyIntolerance"}'
+    assert output_data == expected_data
+    mocked.assert_called_once()
+
+
+@mock.patch('src.lib.definition_cache.http_get', side_effect=not_found_response)
+def test_fetch_not_found_negative_cached(mocked, cache_directory):
+    assert definition_cache.fetch('NOT_FOUND') is None
+    assert definition_cache.fetch('NOT_FOUND') is None
+    mocked.assert_called_once()
+
+
+@mock.patch('src.lib.definition_cache.http_get', side_effect=not_found_response)
+def test_fetch_not_found_negative_cache_expired(mocked, cache_directory):
+    definition_cache.cache_settings['negative_ttl'] = 0
+    definition_cache.fetch('NOT_FOUND')
+    definition_cache.fetch('NOT_FOUND')
+    assert mocked.call_count == 2
+
+
+@mock.patch('src.lib.definition_cache.http_get', side_effect=server_error_response)
+def test_fetch_server_error_not_cached(mocked, cache_directory):
+    definition_cache.fetch('ERROR')
+    definition_cache.fetch('ERROR')
+    assert mocked.call_count == 2
+
+
+@pytest.mark.parametrize('failed_response', [server_error_response,
+                                             mock.Mock(side_effect=requests.ConnectionError('Refused'))])
+def test_fetch_stale_revalidation_failed(failed_response, cache_directory, caplog):
+    with mock.patch('src.lib.definition_cache.http_get', side_effect=ok_response):
+        definition_cache.fetch('VALID_URL')
+
+    definition_cache.cache_settings['max_age'] = 0
+    with mock.patch('src.lib.definition_cache.http_get', side_effect=failed_response) as mocked:
+        output_data = definition_cache.fetch('VALID_URL')
+        # Not remembered, tried again
+        assert definition_cache.fetch('VALID_URL') == output_data
+    expected_data = '{"type": "AllergyIntolerance"}'
+    assert output_data == expected_data
+    assert mocked.call_count == 2
+    assert 'Unable to revalidate VALID_URL' in caplog.text
+
+
+def test_fetch_offline(cache_directory):
+    with mock.patch('src.lib.definition_cache.http_get', side_effect=ok_response):
+        definition_cache.fetch('VALID_URL')
+
+    definition_cache.cache_settings['offline'] = True
+    definition_cache.cache_settings['max_age'] = 0
+    with mock.patch('src.lib.definition_cache.http_get') as mocked:
+        output_data = definition_cache.fetch('VALID_URL')
+    expected_data = '{"type": "AllergyIntolerance"}'
+    assert output_data == expected_data
+    mocked.assert_not_called()
+
+
+@mock.patch('src.lib.definition_cache.http_get')
+def test_fetch_offline_not_cached(mocked, cache_directory):
+    definition_cache.cache_settings['offline'] = True
+    with pytest.raises(FileNotFoundError) as exception_info:
+        definition_cache.fetch('VALID_URL')
+    assert 'Offline and no cached copy' in str(exception_info)
+    mocked.assert_not_called()
+
+
+@mock.patch('src.lib.definition_cache.http_get', side_effect=ok_response)
+def test_fetch_corrupt_object_refetched(mocked, cache_directory):
+    definition_cache.fetch('VALID_URL')
+    object_dir = os.path.join(cache_directory, 'objects')
+    with open(os.path.join(object_dir, os.listdir(object_dir)[0]), 'wb') as f:
+        f.write(b'{"trunc')
+
+    output_data = definition_cache.fetch('VALID_URL')
+    expected_data = '{"type": "AllergyIntolerance"}'
+    assert output_data == expected_data
+    assert mocked.call_count == 2
+
+
+def test_atomic_write_leaves_no_temporary_files(tmp_path):
+    path = str(tmp_path / 'sub' / 'file.json')
+    definition_cache.atomic_write(path, b'{}')
+    definition_cache.atomic_write(path, b'[]')
+    assert os.listdir(str(tmp_path / 'sub')) == ['file.json']
+    assert open(path).read() == '[]'
+
+
+def test_is_fresh_not_found():
+    with mock.patch('src.lib.definition_cache.cache_settings', {'negative_ttl': 60, 'max_age': 60}):
+        assert definition_cache.is_fresh({'status': 404, 'fetched': time.time()}, None)
+        assert not definition_cache.is_fresh({'status': 404, 'fetched': time.time() - 120}, None)
+
+
+def test_fetch_collapses_concurrent_requests(stub_definition_server):
+    url = stub_definition_server.base_url + 'STU3/DomainResource.profile.json'
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        output_data = list(executor.map(definition_cache.fetch, [url] * 8))
+    assert len(set(output_data)) == 1
+    assert stub_definition_server.requests_seen == ['/STU3/DomainResource.profile.json']
+
+
+def test_fetch_not_found(stub_definition_server):
+    output_data = definition_cache.fetch(stub_definition_server.base_url + 'STU3/Unknown.profile.json')
+    expected_data = None
+    assert output_data == expected_data
@@ -0,0 +1,130 @@
+import functools
+import json
+import multiprocessing
+import os
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from unittest import mock
+from ...lib import ig_diff
+from ...lib import profile_args
+
+TEMPLATE = os.path.dirname(os.path.realpath(profile_args.__file__)) + profile_args.DEFAULT_TEMPLATE
+LEFT_PROFILE = 'CareConnect-AllergyIntolerance-1.json'
+RIGHT_PROFILE = 'CareConnect-GPC-AllergyIntolerance-1.json'
+
+
+@pytest.fixture(autouse=True)
+def corpora():
+    with mock.patch('src.lib.profile_corpus.corpora', {}), \
+            mock.patch('src.lib.profile_ancestors.ancestor_sources', []), \
+            mock.patch('src.lib.profile_ancestors.ancestors', {}), \
+            mock.patch('src.lib.profile_ancestors.chains', {}):
+        yield
+
+
+def entry(name, url=None, resource_type='AllergyIntolerance', differential=True):
+    return {'name': name, 'url': url, 'type': resource_type, 'differential': differential}
+
+
+def corpus(entries):
+    urls = {}
+    for e in entries:
+        if e.get('url'):
+            urls.setdefault(e['url'], e)
+    return {'path': 'ig', 'entries': entries, 'urls': urls}
+
+
+def test_pair_profiles():
+    left = corpus([entry('A', 'u/a'), entry('B', 'u/b'), entry('C', 'u/c'), entry('D', 'u/d', differential=False),
+                   entry('E', 'u/e', 'Patient')])
+    right = corpus([entry('B2', 'u/b'), entry('A', 'u/a2'), entry('A', 'u/a3'), entry('B3', 'u/b'),
+                    entry('E', 'u/e2', 'Observation'), entry('F', 'u/f')])
+    pairs, removed, added = ig_diff.pair_profiles(left, right)
+    output_data = [(l['name'], r['url'], matched_by) for l, r, matched_by in pairs]
+    expected_data = [('B', 'u/b', 'url'), ('A', 'u/a2', 'type+name')]
+    assert output_data == expected_data
+    assert [e['name'] for e in removed] == ['C', 'E']
+    assert [e['url'] for e in added] == ['u/a3', 'u/e2', 'u/f']
+
+
+@pytest.fixture
+def igs(data_dir, tmp_path):
+    left_profile = json.load(open(data_dir + '/' + LEFT_PROFILE))
+    right_profile = json.load(open(data_dir + '/' + RIGHT_PROFILE))
+    domain_resource = json.load(open(data_dir + '/domainresource.profile.json'))
+    removed = dict(left_profile, url='http://example.org/StructureDefinition/Removed', name='Removed')
+    renamed = dict(right_profile, url='http://example.org/StructureDefinition/Renamed')
+
+    left = str(tmp_path / 'left.json')
+    with open(left, 'w') as f:
+        json.dump({'resourceType': 'Bundle', 'type': 'collection',
+                   'entry': [{'resource': r} for r in [left_profile, right_profile, removed]]}, f, indent=2)
+
+    right = tmp_path / 'right'
+    right.mkdir()
+    for filename, profile in [('a.json', dict(right_profile, url=left_profile['url'], name=left_profile['name'])),
+                              ('b.json', renamed),
+                              ('c.json', domain_resource)]:
+        (right / filename).write_text(json.dumps(profile))
+
+    return left, str(right)
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_ig_diff(workers, igs, local_definitions, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    output_data = ig_diff.ig_diff(*igs, output_dir, TEMPLATE, workers=workers)
+    assert output_data['profiles'] == {'paired': 2, 'changed': 1, 'unchanged': 1, 'errors': 0, 'added': 1,
+                                       'removed': 1}
+    assert [(p['left_name'], p['matched_by'], p['status']) for p in output_data['pairs']] == \
+           [('CareConnect-AllergyIntolerance-1', 'url', 'Differs'),
+            ('CareConnect-GPC-AllergyIntolerance-1', 'type+name', 'Same')]
+    assert output_data['pairs'][0]['elements']['removed'] > 0
+    assert output_data['pairs'][1]['elements'] == {'added': 0, 'removed': 0, 'changed': 0}
+    assert [p['name'] for p in output_data['removed']] == ['Removed']
+    assert [p['location'] for p in output_data['added']] == \
+           [igs[1] + '#http://hl7.org/fhir/StructureDefinition/DomainResource']
+
+    expected_reports = ['CareConnect-AllergyIntolerance-1__CareConnect-AllergyIntolerance-1.md',
+                        'CareConnect-GPC-AllergyIntolerance-1__CareConnect-GPC-AllergyIntolerance-1.md']
+    assert [p['report'] for p in output_data['pairs']] == expected_reports
+    assert sorted(os.listdir(output_dir)) == sorted(expected_reports + ['summary.json', 'summary.md'])
+    assert json.load(open(output_dir + '/summary.json')) == output_data
+    assert '|Removed|AllergyIntolerance|http://example.org/StructureDefinition/Removed|' in \
+           open(output_dir + '/summary.md').read()
+
+
+def test_ig_diff_incomparable_pair(data_dir, local_definitions, tmp_path):
+    left_profile = json.load(open(data_dir + '/' + LEFT_PROFILE))
+    domain_resource = json.load(open(data_dir + '/domainresource.profile.json'))
+    for side, profile in [('left', left_profile), ('right', dict(domain_resource, url=left_profile['url']))]:
+        (tmp_path / side).mkdir()
+        (tmp_path / side / 'profile.json').write_text(json.dumps(profile))
+
+    output_data = ig_diff.ig_diff(str(tmp_path / 'left'), str(tmp_path / 'right'), str(tmp_path / 'out'), TEMPLATE,
+                                  workers=1)
+    assert output_data['profiles']['errors'] == 1
+    assert output_data['pairs'][0]['error'].startswith('ValueError: Profile resource types do not match')
+    assert output_data['pairs'][0]['report'] is None
+
+
+@pytest.mark.parametrize('workers, start_method', [(1, None), (2, 'spawn')])
+def test_ig_diff_ancestors(workers, start_method, data_dir, local_definitions, tmp_path):
+    parent = json.load(open(data_dir + '/' + LEFT_PROFILE))
+    child = dict(json.load(open(data_dir + '/' + RIGHT_PROFILE)), baseDefinition=parent['url'])
+    for side in ['left', 'right']:
+        (tmp_path / side).mkdir()
+        for filename, profile in [('parent.json', parent), ('child.json', child)]:
+            (tmp_path / side / filename).write_text(json.dumps(profile))
+
+    # Spawned workers only have what they are passed, not the guides added as ancestor sources here
+    executor = functools.partial(ProcessPoolExecutor, mp_context=multiprocessing.get_context(start_method))
+    with mock.patch('src.lib.ig_diff.ProcessPoolExecutor', executor):
+        output_data = ig_diff.ig_diff(str(tmp_path / 'left'), str(tmp_path / 'right'), str(tmp_path / 'out'),
+                                      TEMPLATE, workers=workers)
+    report = open(str(tmp_path / 'out' / output_data['pairs'][0]['report'])).read()
+    # The child's bases are from its parent in the guide, the parent's from the core definition
+    assert [p['left_name'] for p in output_data['pairs']] == ['CareConnect-GPC-AllergyIntolerance-1',
+                                                            'CareConnect-AllergyIntolerance-1']
+    assert 'Introduced by CareConnect-AllergyIntolerance-1 (' + parent['url'] + ')' in report
+    assert 'Introduced by' not in open(str(tmp_path / 'out' / output_data['pairs'][1]['report'])).read()
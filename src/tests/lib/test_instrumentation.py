@@ -0,0 +1,87 @@
+import argparse
+import json
+import pytest
+from ...lib import instrumentation
+from ...lib import profile_diff
+from unittest import mock
+
+
+@pytest.fixture
+def enabled():
+    instrumentation.enable(trace=True)
+    yield
+    instrumentation.disable()
+    instrumentation.reset()
+
+
+def test_disabled_records_nothing():
+    instrumentation.reset()
+    with instrumentation.span('phase') as span:
+        instrumentation.count('counter')
+    assert span is None
+    assert instrumentation.get_stats() == {'phases': {}, 'counters': {}}
+
+
+def test_span_and_count(enabled):
+    for _ in range(2):
+        with instrumentation.span('outer'):
+            with instrumentation.span('inner', type='AllergyIntolerance'):
+                instrumentation.count('lookups')
+                instrumentation.count('bytes', 10)
+    output_data = instrumentation.get_stats()
+    assert output_data['counters'] == {'lookups': 2, 'bytes': 20}
+    assert {name: phase['calls'] for name, phase in output_data['phases'].items()} == {'outer': 2, 'inner': 2}
+    assert output_data['phases']['outer']['seconds'] >= output_data['phases']['inner']['seconds']
+
+
+def test_trace_events(enabled):
+    with instrumentation.span('outer'):
+        with instrumentation.span('inner', type='AllergyIntolerance'):
+            pass
+    inner, outer = instrumentation.get_trace()['traceEvents']
+    assert (inner['name'], inner['args']) == ('inner', {'type': 'AllergyIntolerance', 'depth': 1})
+    assert (outer['name'], outer['args']) == ('outer', {'depth': 0})
+    assert outer['ts'] <= inner['ts'] and inner['ts'] + inner['dur'] <= outer['ts'] + outer['dur']
+
+
+def test_span_records_on_exception(enabled):
+    with pytest.raises(ValueError):
+        with instrumentation.span('failing'):
+            raise ValueError('Failed')
+    assert instrumentation.get_stats()['phases']['failing']['calls'] == 1
+
+
+@mock.patch('src.lib.profile_diff.get_base_component', return_value={})
+def test_components_diffed_counted(mocked, enabled, data_left_right_elements_operands_right_base_path):
+    profile_diff.component_level_diff(data_left_right_elements_operands_right_base_path,
+                                      data_left_right_elements_operands_right_base_path, '3.0.1')
+    assert instrumentation.get_stats()['counters']['components_diffed'] == 1
+
+
+def test_write_output(enabled, tmp_path):
+    with instrumentation.span('phase'):
+        instrumentation.count('counter')
+    args = argparse.Namespace(stats=False, stats_file=str(tmp_path / 'stats.json'), trace=str(tmp_path / 'trace.json'))
+    instrumentation.write_output(args)
+    assert json.load(open(args.stats_file))['counters'] == {'counter': 1}
+    assert json.load(open(args.trace))['traceEvents'][0]['ph'] == 'X'
+
+
+def test_write_output_stderr(enabled, capsys):
+    instrumentation.count('counter')
+    instrumentation.write_output(argparse.Namespace(stats=True, stats_file=None, trace=None))
+    output_data = capsys.readouterr()
+    assert output_data.out == ''
+    assert json.loads(output_data.err)['counters'] == {'counter': 1}
+
+
+@pytest.mark.parametrize('stats, stats_file, trace, expected_data', [
+    (False, None, None, {'enabled': False, 'trace': False}),
+    (True, None, None, {'enabled': True, 'trace': False}),
+    (False, 'stats.json', None, {'enabled': True, 'trace': False}),
+    (False, None, 'trace.json', {'enabled': True, 'trace': True}),
+])
+def test_configure(stats, stats_file, trace, expected_data):
+    with mock.patch('src.lib.instrumentation.settings', {'enabled': False, 'trace': False}):
+        instrumentation.configure(argparse.Namespace(stats=stats, stats_file=stats_file, trace=trace))
+        assert instrumentation.settings == expected_data
@@ -0,0 +1,74 @@
+import json
+import pytest
+from ...lib import json_cache
+from collections import OrderedDict
+from unittest import mock
+
+
+@pytest.fixture
+def empty_cache():
+    with mock.patch('src.lib.json_cache.serialization_cache', OrderedDict()), \
+            mock.patch('src.lib.json_cache.cache_limits', {'max_entries': 4096}), \
+            mock.patch('src.lib.json_cache.cache_stats', {'hits': 0, 'misses': 0}), \
+            mock.patch('src.lib.json_codec.codec_settings', {'codec': 'json'}):
+        yield json_cache.serialization_cache
+
+
+@pytest.mark.parametrize('value', [
+    {'b': [1, 2, {'d': None, 'c': True}], 'a': 'x'},
+    [1.5, 'a', []],
+    'string',
+    0,
+])
+def test_canonical_json(value, empty_cache):
+    output_data = json_cache.canonical_json(value)
+    expected_data = json.dumps(value, indent=2, sort_keys=True)
+    assert output_data == expected_data
+
+
+def test_canonical_json_equal_values_serialized_once(empty_cache):
+    with mock.patch('src.lib.json_codec.dumps_pretty', return_value='{}') as mocked:
+        json_cache.canonical_json({'code': 'Extension'})
+        json_cache.canonical_json({'code': 'Extension'})
+    mocked.assert_called_once()
+    assert json_cache.cache_stats == {'hits': 1, 'misses': 1}
+
+
+def test_canonical_json_types_not_confused(empty_cache):
+    assert json_cache.canonical_json({'a': 1}) != json_cache.canonical_json({'a': True})
+
+
+def test_canonical_json_not_cached_with_orjson(empty_cache):
+    with mock.patch('src.lib.json_codec.codec_settings', {'codec': 'orjson'}), \
+            mock.patch('src.lib.json_codec.dumps_pretty', return_value='{}') as mocked, \
+            mock.patch('src.lib.json_cache.structural_hash') as mocked_hash:
+        json_cache.canonical_json({'code': 'Extension'})
+        json_cache.canonical_json({'code': 'Extension'})
+    assert mocked.call_count == 2
+    mocked_hash.assert_not_called()
+    assert len(empty_cache) == 0
+
+
+def test_canonical_json_changed_value(empty_cache):
+    value = {'a': [1]}
+    json_cache.canonical_json(value)
+    value['a'].append(2)
+    output_data = json_cache.canonical_json(value)
+    expected_data = json.dumps(value, indent=2, sort_keys=True)
+    assert output_data == expected_data
+
+
+def test_canonical_json_hash_collision(empty_cache):
+    with mock.patch('src.lib.json_cache.structural_hash', return_value=1):
+        json_cache.canonical_json({'a': 1})
+        output_data = json_cache.canonical_json({'b': 2})
+    expected_data = json.dumps({'b': 2}, indent=2, sort_keys=True)
+    assert output_data == expected_data
+
+
+def test_set_cache_limits_evicts_least_recently_used(empty_cache):
+    json_cache.canonical_json({'a': 1})
+    json_cache.canonical_json({'b': 1})
+    json_cache.canonical_json({'a': 1})
+    json_cache.set_cache_limits(max_entries=1)
+    assert [entry[0] for entry in empty_cache.values()] == [{'a': 1}]
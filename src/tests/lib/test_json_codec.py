@@ -0,0 +1,84 @@
+import json
+import pytest
+from ...lib import json_codec
+from unittest import mock
+
+orjson = pytest.importorskip('orjson')
+
+VALUES = [
+    {'b': [1, 2, {'d': 'x', 'c': True}], 'a': 'x', 'e': {}, 'f': []},
+    {'short': 'Caf\u00e9', 'max': '*'},
+    ['\x7f', '\U0001f600', '\u2028'],
+    [1.5, 0.1, 1e16, 1e-05, 2.5e-10, -0.0, 123456789.125],
+    {'value': None, 'nan': float('nan'), 'inf': float('inf')},
+    {'big': 2 ** 70, 'min': -2 ** 63},
+    {1: 'int key'},
+    ('tuple', 1),
+    'string',
+    0,
+]
+
+
+@pytest.mark.parametrize('value', VALUES)
+def test_orjson_dumps_pretty_same_as_json(value):
+    output_data = json_codec.orjson_dumps_pretty(value)
+    expected_data = json.dumps(value, indent=2, sort_keys=True)
+    assert output_data == expected_data
+
+
+@pytest.mark.parametrize('text', [
+    '{"a": [1, 2.5, "x"], "b": {"c": null}}',
+    '{"a": 123456789012345678901234567890}',
+    '{"a": -9999999999999999999}',
+    '{"a": NaN, "b": Infinity}',
+    '"\\ud800"',
+])
+def test_orjson_loads_same_as_json(text):
+    for data in [text, text.encode('utf-8')]:
+        output_data = json_codec.orjson_loads(data)
+        expected_data = json.loads(data)
+        assert repr(output_data) == repr(expected_data)
+
+
+def test_orjson_loads_invalid():
+    with pytest.raises(json.JSONDecodeError):
+        json_codec.orjson_loads('{"a": ')
+
+
+@pytest.mark.parametrize('value', [
+    {'a': [1, 2.5, {'b': 'c'}]},
+    {'short': 'Caf\u00e9'},
+    # Look like floats orjson writes differently, but are in strings
+    {'id': '2e5', 'version': '0.00001', 'note': '": 1e16'},
+])
+def test_orjson_dumps_pretty_uses_orjson(value):
+    with mock.patch('src.lib.json_codec.json_dumps_pretty') as mocked:
+        output_data = json_codec.orjson_dumps_pretty(value)
+    mocked.assert_not_called()
+    assert output_data == json.dumps(value, indent=2, sort_keys=True)
+
+
+@pytest.mark.parametrize('text, expected_data', [
+    (b'[\n  1.5,\n  2\n]', False),
+    (b'[\n  1e16,\n  2\n]', True),
+    (b'{\n  "a": 0.00001\n}', True),
+    (b'{\n  "a": "1e16"\n}', False),
+    (b'{\n  "\\\\": 1e-7\n}', True),
+    (b'1e16', True),
+])
+def test_has_exponent_floats(text, expected_data):
+    output_data = json_codec.has_exponent_floats(text)
+    assert output_data == expected_data
+
+
+@mock.patch('src.lib.json_codec.codec_settings', {'codec': 'orjson'})
+def test_set_codec():
+    json_codec.set_codec('json')
+    assert json_codec.codec_settings['codec'] == 'json'
+    assert json_codec.dumps_pretty({'b': 1, 'a': 2}) == '{\n  "a": 2,\n  "b": 1\n}'
+
+
+def test_set_codec_unknown():
+    with pytest.raises(ValueError) as exception_info:
+        json_codec.set_codec('not_a_codec')
+    assert 'Unknown JSON codec' in str(exception_info)
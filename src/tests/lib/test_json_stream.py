@@ -0,0 +1,66 @@
+import json
+import pytest
+from ...lib import json_stream
+
+DOCUMENT = {'name': 'a "quoted" {name}',
+            'skipped': {'text': '}]\\"[{', 'nested': [[{}], [], {'x': [1, 2.5e3, None, True, False]}]},
+            'items': [{'id': 'a', 'drop': ['}'], 'keep': {'k': 'é'}}, {'id': 'b'}, 1, 'c'],
+            'empty': {},
+            'number': -12.5}
+
+
+def write_document(tmp_path, text):
+    filename = str(tmp_path / 'document.json')
+    with open(filename, 'w') as f:
+        f.write(text)
+    return filename
+
+
+def read_selected(buffer, position):
+    return json_stream.read_object(buffer, position, {
+        'name': json_stream.read_value,
+        'items': lambda b, p: json_stream.read_array(b, p, json_stream.member_reader(['id', 'keep'])),
+        'empty': lambda b, p: json_stream.read_object(b, p, {}),
+        'number': json_stream.read_value})
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_read_document_selected(indent, tmp_path):
+    filename = write_document(tmp_path, json.dumps(DOCUMENT, indent=indent))
+    output_data = json_stream.read_document(filename, read_selected)
+    expected_data = {'name': 'a "quoted" {name}',
+                     'items': [{'id': 'a', 'keep': {'k': 'é'}}, {'id': 'b'}, 1, 'c'],
+                     'empty': {},
+                     'number': -12.5}
+    assert output_data == expected_data
+
+
+def test_read_document_all(tmp_path):
+    filename = write_document(tmp_path, json.dumps(DOCUMENT, indent=2, ensure_ascii=False))
+    output_data = json_stream.read_document(filename, json_stream.read_value)
+    assert output_data == DOCUMENT
+
+
+@pytest.mark.parametrize('text', [' [] ', '{"a": [1, {"b": "]"}]}', '"[{"', '12', 'null'])
+def test_skip_value(text):
+    buffer = text.encode('utf-8')
+    position = json_stream.skip_whitespace(buffer, 0)
+    output_data = json_stream.skip_value(buffer, position)
+    expected_data = len(text.rstrip())
+    assert output_data == expected_data
+
+
+@pytest.mark.parametrize('text, expected_data', [
+    ('{"a": 1', 'Unexpected end of JSON'),
+    ('{"a": "1}', 'Invalid JSON value'),
+    ('{"a": 1} {}', 'Extra data after JSON'),
+    ('{"a" 1}', 'Expected :'),
+    ('{"a": 1 "b": 2}', 'Expected ,'),
+    ('[1]', 'Expected {'),
+    ('{"a": {"b": "1}}', 'Unterminated string'),
+])
+def test_read_document_invalid(text, expected_data, tmp_path):
+    filename = write_document(tmp_path, text)
+    with pytest.raises(ValueError) as exception_info:
+        json_stream.read_document(filename, lambda b, p: json_stream.read_object(b, p, {}))
+    assert expected_data in str(exception_info.value)
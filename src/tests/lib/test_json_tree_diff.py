@@ -0,0 +1,101 @@
+import json
+import random
+import pytest
+from ...lib import json_tree_diff
+from ...lib import profile_diff
+
+
+def random_value(rng, depth=0):
+    r = rng.random()
+    if depth > 3 or r < 0.4:
+        return rng.choice([1, 2, 'a', 'b', True, None])
+    if r < 0.7:
+        return {rng.choice('abcde'): random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))}
+    if rng.random() < 0.5:
+        return [{'key': k, 'v': random_value(rng, depth + 1)} for k in rng.sample('wxyz', rng.randint(0, 4))]
+    return [random_value(rng, depth + 1) for _ in range(rng.randint(0, 4))]
+
+
+@pytest.mark.parametrize('left, right, expected_data', [
+    ({'a': 1}, {'a': 1}, []),
+    ({'a': 1}, {'a': 2}, [{'op': 'change', 'path': 'a', 'left': 1, 'right': 2}]),
+    ({'a': 1}, {}, [{'op': 'remove', 'path': 'a', 'left': 1}]),
+    ({}, {'b': {'c': 1}}, [{'op': 'add', 'path': 'b', 'right': {'c': 1}}]),
+    ({'a': [1, 2, 3]}, {'a': [1, 3]}, [{'op': 'remove', 'path': 'a[1]', 'left': 2}]),
+    ([{'code': 'Reference', 'x': 1}], [{'code': 'Reference', 'x': 2}],
+     [{'op': 'change', 'path': '[code=Reference].x', 'left': 1, 'right': 2}]),
+])
+def test_tree_diff(left, right, expected_data):
+    output_data = json_tree_diff.tree_diff(left, right)
+    assert output_data == expected_data
+
+
+def test_tree_diff_keyed_reorder():
+    left = [{'key': 'ele-1', 'severity': 'error'}, {'key': 'ext-1', 'severity': 'error'}]
+    right = [{'key': 'ext-1', 'severity': 'error'}, {'key': 'ele-1', 'severity': 'warning'}]
+    output_data = json_tree_diff.tree_diff(left, right)
+    expected_data = [{'op': 'change', 'path': '[key=ele-1].severity', 'left': 'error', 'right': 'warning'}]
+    assert output_data == expected_data
+
+
+@pytest.mark.parametrize('items, expected_data', [
+    ([{'key': 'a'}, {'key': 'b'}], 'key'),
+    ([{'key': 'a'}, {'key': 'a', 'code': 'b'}], None),
+    ([{'code': 'a'}, {'code': 'b'}], 'code'),
+    ([1, 2], None),
+    ([], None),
+])
+def test_find_list_key(items, expected_data):
+    output_data = json_tree_diff.find_list_key(items)
+    assert output_data == expected_data
+
+
+def test_structural_hash():
+    assert json_tree_diff.structural_hash({'a': [1, {'b': 2}]}, {}) == \
+           json_tree_diff.structural_hash({'a': [1, {'b': 2}]}, {})
+    assert json_tree_diff.structural_hash({'a': 1}, {}) != json_tree_diff.structural_hash({'a': True}, {})
+
+
+@pytest.mark.parametrize('left, right', [
+    ({'min': -1}, {'min': -2}),
+    ({'a': [-1]}, {'a': [-2]}),
+    ([{'a': 2 ** 61 - 1}], [{'a': 0}]),
+])
+def test_hash_collisions(left, right):
+    # Same hashes, different values
+    assert json_tree_diff.structural_hash(left, {}) == json_tree_diff.structural_hash(right, {})
+    assert json_tree_diff.tree_diff(left, right) != []
+    assert profile_diff.json_diff(left, right) != ''
+
+
+def test_render_diff_matches_line_diff(data_left_right_elements_operands_right_base_path,
+                                       data_diff_operands_right_base_path):
+    output_data = profile_diff.format_diff(json_tree_diff.render_diff(
+        data_left_right_elements_operands_right_base_path.left,
+        data_left_right_elements_operands_right_base_path.right))
+    expected_data = data_diff_operands_right_base_path
+    assert output_data == expected_data
+
+
+def test_render_diff_sides():
+    rng = random.Random(0)
+    for _ in range(500):
+        left = random_value(rng)
+        right = random_value(rng)
+        output_data = json_tree_diff.render_diff(left, right)
+        assert [line for tag, line in output_data if tag != '+'] == profile_diff.json_pretty(left).splitlines()
+        # Keyed list items are shown in left order, the right side is the same json with those reordered
+        right_lines = [line for tag, line in output_data if tag != '-']
+        assert json.loads('\n'.join(right_lines)) == json.loads(profile_diff.json_pretty(right)) or \
+               json_tree_diff.tree_diff(json.loads('\n'.join(right_lines)), right) == []
+
+
+def test_walk_diff_lines_from_ops():
+    rng = random.Random(1)
+    for _ in range(500):
+        left = random_value(rng)
+        right = random_value(rng)
+        ops, lines = json_tree_diff.walk_diff(left, right)
+        assert ops == json_tree_diff.tree_diff(left, right)
+        # Lines only change where there is an operation
+        assert bool(ops) == any(tag != ' ' for tag, line in lines)
@@ -0,0 +1,61 @@
+import random
+import pytest
+from ...lib import line_diff
+from unittest import mock
+
+
+def lcs_length(a, b):
+    lengths = [[0] * (len(b) + 1) for _ in range(len(a) + 1)]
+    for i in range(len(a) - 1, -1, -1):
+        for j in range(len(b) - 1, -1, -1):
+            lengths[i][j] = lengths[i + 1][j + 1] + 1 if a[i] == b[j] else max(lengths[i + 1][j], lengths[i][j + 1])
+    return lengths[0][0]
+
+
+@pytest.mark.parametrize('left, right, expected_data', [
+    ([], [], []),
+    (['a'], [], [('-', 'a')]),
+    ([], ['a'], [('+', 'a')]),
+    (['a', 'b', 'c'], ['a', 'b', 'c'], [(' ', 'a'), (' ', 'b'), (' ', 'c')]),
+    (['a', 'b', 'c'], ['a', 'x', 'c'], [(' ', 'a'), ('-', 'b'), ('+', 'x'), (' ', 'c')]),
+    (['a', 'b'], ['x', 'y'], [('-', 'a'), ('-', 'b'), ('+', 'x'), ('+', 'y')]),
+    (['a', 'b', 'c', 'd'], ['b', 'c', 'e'], [('-', 'a'), (' ', 'b'), (' ', 'c'), ('-', 'd'), ('+', 'e')]),
+])
+def test_myers_diff(left, right, expected_data):
+    output_data = line_diff.myers_diff(left, right)
+    assert output_data == expected_data
+
+
+def test_myers_diff_minimal():
+    rng = random.Random(0)
+    for _ in range(500):
+        left = [rng.choice('abcd') for _ in range(rng.randint(0, 12))]
+        right = [rng.choice('abcd') for _ in range(rng.randint(0, 12))]
+        output_data = line_diff.myers_diff(left, right)
+        assert [line for tag, line in output_data if tag != '+'] == left
+        assert [line for tag, line in output_data if tag != '-'] == right
+        assert sum(1 for tag, line in output_data if tag == ' ') == lcs_length(left, right)
+
+
+def test_difflib_diff():
+    output_data = line_diff.difflib_diff(['a', 'b', 'c'], ['a', 'x', 'c'])
+    expected_data = [(' ', 'a'), ('-', 'b'), ('+', 'x'), (' ', 'c')]
+    assert output_data == expected_data
+
+
+def test_group_changes():
+    output_data = line_diff.group_changes([('-', 'a'), ('+', 'x'), ('-', 'b'), (' ', 'c'), ('+', 'y'), ('-', 'd')])
+    expected_data = [('-', 'a'), ('-', 'b'), ('+', 'x'), (' ', 'c'), ('-', 'd'), ('+', 'y')]
+    assert output_data == expected_data
+
+
+@mock.patch('src.lib.line_diff.engine_settings', {'engine': 'myers'})
+def test_set_diff_engine():
+    line_diff.set_diff_engine('difflib')
+    assert line_diff.engine_settings['engine'] == 'difflib'
+
+
+def test_set_diff_engine_unknown():
+    with pytest.raises(ValueError) as exception_info:
+        line_diff.set_diff_engine('not_an_engine')
+    assert 'Unknown diff engine' in str(exception_info)
@@ -0,0 +1,90 @@
+import json
+import os
+import pytest
+from ...lib import matrix_diff
+from ...lib import profile_args
+from ...lib import profile_report
+from ...lib.profile_elements import AlignedElement
+
+TEMPLATE = os.path.dirname(os.path.realpath(profile_args.__file__)) + profile_args.DEFAULT_TEMPLATE
+LEFT_PROFILE = 'CareConnect-AllergyIntolerance-1.json'
+RIGHT_PROFILE = 'CareConnect-GPC-AllergyIntolerance-1.json'
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_matrix_diff(workers, local_definitions, data_dir, tmp_path):
+    output_dir = str(tmp_path / 'out')
+    output_data = matrix_diff.matrix_diff(data_dir + '/' + LEFT_PROFILE,
+                                          [data_dir + '/' + RIGHT_PROFILE, data_dir + '/' + LEFT_PROFILE],
+                                          output_dir, TEMPLATE, workers=workers)
+    expected_reports = ['CareConnect-AllergyIntolerance-1__CareConnect-GPC-AllergyIntolerance-1.md',
+                        'CareConnect-AllergyIntolerance-1__CareConnect-AllergyIntolerance-1.md']
+    assert [r['report'] for r in output_data['rights']] == expected_reports
+    assert sorted(os.listdir(output_dir)) == sorted(expected_reports + ['matrix.json', 'matrix.md'])
+    assert json.load(open(output_dir + '/matrix.json')) == output_data
+    # Against itself every element is the same
+    assert all(e['results'][1] == 'Same' for e in output_data['elements'] if e['results'][1])
+    assert {'id': 'AllergyIntolerance.code.coding', 'results': ['Removed', 'Same']} in output_data['elements']
+
+
+def test_matrix_diff_report_matches_pair_report(local_definitions, data_dir, tmp_path):
+    matrix_diff.matrix_diff(data_dir + '/' + LEFT_PROFILE, [data_dir + '/' + RIGHT_PROFILE],
+                            str(tmp_path), TEMPLATE, workers=1)
+    left = json.load(open(data_dir + '/' + LEFT_PROFILE))
+    right = json.load(open(data_dir + '/' + RIGHT_PROFILE))
+    pair_report = profile_report.write_report(left, left['fhirVersion'], right, right['fhirVersion'], TEMPLATE,
+                                              str(tmp_path / 'pair.md'))
+    output_data = open(str(tmp_path / 'CareConnect-AllergyIntolerance-1__CareConnect-GPC-AllergyIntolerance-1.md'))
+    assert output_data.read() == open(pair_report).read()
+
+
+def test_matrix_diff_incomparable_right(local_definitions, data_dir, tmp_path):
+    output_data = matrix_diff.matrix_diff(data_dir + '/' + LEFT_PROFILE, [data_dir + '/domainresource.profile.json'],
+                                          str(tmp_path), TEMPLATE, workers=1)
+    assert output_data['rights'][0]['error'].startswith('ValueError: Profile resource types do not match')
+    assert output_data['rights'][0]['report'] is None
+
+
+def test_matrix_diff_missing_right(local_definitions, data_dir, tmp_path):
+    right_files = [str(tmp_path / 'missing.json'), data_dir + '/' + RIGHT_PROFILE]
+    output_data = matrix_diff.matrix_diff(data_dir + '/' + LEFT_PROFILE, right_files, str(tmp_path / 'out'), TEMPLATE,
+                                          workers=1)
+    assert output_data['rights'][0]['error'].startswith('FileNotFoundError: ')
+    assert output_data['rights'][0]['report'] is None
+    assert output_data['rights'][1]['error'] is None
+    assert 'FileNotFoundError: ' in open(str(tmp_path / 'out' / matrix_diff.MATRIX_FILE)).read()
+
+
+def test_prepare_profile_base_components(local_definitions, data_dir):
+    left = json.load(open(data_dir + '/' + LEFT_PROFILE))
+    output_data = matrix_diff.prepare_profile(left, '3.0.1')
+    assert output_data.element_ids[0] == 'AllergyIntolerance.extension'
+    assert output_data.base_components[('AllergyIntolerance.identifier.value', 'min', '3.0.1', 'Identifier.value')] \
+           == {}
+    assert len(output_data.base_components) == \
+           sum(len([k for k in e if k not in ['id', 'path', 'base']]) for e in output_data.elements.values())
+
+
+@pytest.mark.parametrize('left, right, expected_data', [
+    ({'id': 'a', 'min': 1}, {}, 'Removed'),
+    ({}, {'id': 'a', 'min': 1}, 'Added'),
+    ({'id': 'a', 'min': 1, 'base': {'path': 'a'}}, {'id': 'a', 'min': 1}, 'Same'),
+    ({'id': 'a', 'min': 1}, {'id': 'a', 'min': 0}, 'Differs'),
+])
+def test_element_status(left, right, expected_data):
+    output_data = matrix_diff.element_status(AlignedElement('a', left, right))
+    assert output_data == expected_data
+
+
+def test_get_matrix_right_only_elements():
+    prepared = matrix_diff.PreparedProfile({}, '3.0.1', {}, ['a', 'b'], {})
+    results = [{'right': 'r1', 'right_name': 'R1', 'report': 'r1.md', 'error': None,
+                'elements': {'a': 'Same', 'b': 'Removed', 'c': 'Added'}},
+               {'right': 'r2', 'right_name': 'R2', 'report': 'r2.md', 'error': None,
+                'elements': {'a': 'Differs', 'b': 'Removed', 'd': 'Added'}}]
+    output_data = matrix_diff.get_matrix(prepared, 'L', results)['elements']
+    expected_data = [{'id': 'a', 'results': ['Same', 'Differs']},
+                     {'id': 'b', 'results': ['Removed', 'Removed']},
+                     {'id': 'c', 'results': ['Added', '']},
+                     {'id': 'd', 'results': ['', 'Added']}]
+    assert output_data == expected_data
@@ -0,0 +1,108 @@
+import io
+import json
+import os
+import tarfile
+import pytest
+from ...lib import package_source
+from ...lib import base_definitions
+from unittest import mock
+from collections import OrderedDict
+
+
+# ----------------------- MOCKS -----------------------
+def package_files(data_dir, with_index):
+    definition = open(data_dir + '/allergyintolerance.profile.json').read()
+    files = {'package.json': json.dumps({'name': 'hl7.fhir.r3.core', 'fhirVersions': ['3.0.2']}),
+             'StructureDefinition-AllergyIntolerance.json': definition,
+             'ValueSet-not-a-definition.json': json.dumps({'resourceType': 'ValueSet', 'id': 'x'})}
+    if with_index:
+        files['.index.json'] = json.dumps({'index-version': 1, 'files': [
+            {'filename': 'StructureDefinition-AllergyIntolerance.json',
+             'resourceType': 'StructureDefinition',
+             'id': 'AllergyIntolerance',
+             'url': 'http://hl7.org/fhir/StructureDefinition/AllergyIntolerance',
+             'kind': 'resource',
+             'type': 'AllergyIntolerance'}]})
+    return files
+
+
+@pytest.fixture(params=[True, False])
+def package_tgz(request, tmp_path, data_dir):
+    path = str(tmp_path / 'hl7.fhir.r3.core.tgz')
+    with tarfile.open(path, 'w:gz') as tar:
+        for name, content in package_files(data_dir, request.param).items():
+            data = content.encode('utf-8')
+            info = tarfile.TarInfo('package/' + name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+    return path
+
+
+@pytest.fixture(params=[True, False])
+def package_folder(request, tmp_path, data_dir):
+    os.makedirs(str(tmp_path / 'package'))
+    for name, content in package_files(data_dir, request.param).items():
+        with open(str(tmp_path / 'package' / name), 'w') as f:
+            f.write(content)
+    return str(tmp_path)
+
+
+@pytest.fixture
+def packages():
+    with mock.patch('src.lib.package_source.package_sources', []):
+        yield package_source.package_sources
+        package_source.clear_packages()
+
+
+# ----------------------- MOCKS -----------------------
+
+
+def test_get_definition_text_tgz(packages, package_tgz, data_allergyintolerance_stu3_base_profile):
+    package_source.add_package(package_tgz)
+    output_data = json.loads(package_source.get_definition_text('AllergyIntolerance', '3.0.2'))
+    expected_data = data_allergyintolerance_stu3_base_profile
+    assert output_data == expected_data
+
+
+def test_get_definition_text_folder(packages, package_folder, data_allergyintolerance_stu3_base_profile):
+    package_source.add_package(package_folder)
+    output_data = json.loads(package_source.get_definition_text('AllergyIntolerance', '3.0.2'))
+    expected_data = data_allergyintolerance_stu3_base_profile
+    assert output_data == expected_data
+
+
+def test_get_definition_text_not_in_package(packages, package_tgz):
+    package_source.add_package(package_tgz)
+    output_data = package_source.get_definition_text('Patient', '3.0.2')
+    expected_data = None
+    assert output_data == expected_data
+
+
+def test_get_definition_text_other_version(packages, package_tgz):
+    package_source.add_package(package_tgz)
+    output_data = package_source.get_definition_text('AllergyIntolerance', '4.0.1')
+    expected_data = None
+    assert output_data == expected_data
+
+
+def test_index_package_ids(packages, package_folder):
+    package = package_source.index_package(package_source.add_package(package_folder))
+    assert 'StructureDefinition/AllergyIntolerance' in package['ids']
+
+
+def test_add_package_not_found(packages):
+    with pytest.raises(FileNotFoundError) as exception_info:
+        package_source.add_package('not/a/package.tgz')
+    assert 'FHIR package not found' in str(exception_info)
+
+
+@mock.patch('src.lib.base_definitions.resource_cache', OrderedDict())
+@mock.patch('src.lib.base_definitions.download_definition')
+def test_base_definitions_uses_package(mocked, packages, package_tgz):
+    package_source.add_package(package_tgz)
+    output_data = base_definitions.search_index(base_definitions.get_element_index('AllergyIntolerance', '3.0.2'),
+                                                'AllergyIntolerance.code',
+                                                'min')
+    expected_data = 0
+    assert output_data == expected_data
+    mocked.assert_not_called()
@@ -0,0 +1,132 @@
+import json
+import pytest
+from unittest import mock
+from ...lib import profile_ancestors
+from ...lib import profile_corpus
+from ...lib import profile_diff
+from ...lib import package_source
+
+VERSION = '3.0.1'
+PARENT_PROFILE = 'CareConnect-AllergyIntolerance-1.json'
+CHILD_PROFILE = 'CareConnect-GPC-AllergyIntolerance-1.json'
+PARENT_URL = 'https://fhir.hl7.org.uk/STU3/StructureDefinition/CareConnect-AllergyIntolerance-1'
+CHILD_URL = 'https://fhir.nhs.uk/STU3/StructureDefinition/CareConnect-GPC-AllergyIntolerance-1'
+PARENT_NAME = 'CareConnect-AllergyIntolerance-1'
+
+
+@pytest.fixture(autouse=True)
+def ancestor_state():
+    with mock.patch('src.lib.profile_ancestors.ancestor_sources', []), \
+            mock.patch('src.lib.profile_ancestors.ancestors', {}), \
+            mock.patch('src.lib.profile_ancestors.chains', {}), \
+            mock.patch('src.lib.profile_corpus.corpora', {}):
+        yield
+
+
+@pytest.fixture
+def profiles(data_dir):
+    parent = json.load(open(data_dir + '/' + PARENT_PROFILE))
+    # The GPC profile as derived from CareConnect, rather than the core definition
+    child = dict(json.load(open(data_dir + '/' + CHILD_PROFILE)), baseDefinition=PARENT_URL)
+    return parent, child
+
+
+@pytest.fixture
+def corpus(profiles, tmp_path):
+    path = str(tmp_path / 'bundle.json')
+    with open(path, 'w') as f:
+        json.dump({'resourceType': 'Bundle', 'type': 'collection',
+                   'entry': [{'resource': r} for r in profiles]}, f)
+    profile_ancestors.add_ancestor_source(path)
+    return path
+
+
+def derived(base_definition, url='http://example.org/StructureDefinition/Derived'):
+    return {'resourceType': 'StructureDefinition', 'url': url, 'name': url.rsplit('/', 1)[1],
+            'type': 'AllergyIntolerance', 'derivation': 'constraint', 'baseDefinition': base_definition,
+            'differential': {'element': [{'id': 'AllergyIntolerance', 'path': 'AllergyIntolerance'}]}}
+
+
+def test_get_ancestors(corpus):
+    with mock.patch('src.lib.profile_ancestors.load_profile', side_effect=profile_corpus.load_profile) as mocked:
+        output_data = profile_ancestors.get_ancestors(derived(CHILD_URL), VERSION)
+        # Each ancestor, and the chain from each, is only read once
+        assert profile_ancestors.get_ancestors(derived(CHILD_URL), VERSION) is output_data
+        assert profile_ancestors.get_ancestors(derived(PARENT_URL), VERSION) == output_data[1:]
+    assert [(a.url, a.base_definition) for a in output_data] == \
+           [(CHILD_URL, PARENT_URL), (PARENT_URL, 'http://hl7.org/fhir/StructureDefinition/AllergyIntolerance')]
+    assert output_data[1].element_index['allergyintolerance.identifier.system']['min'] == 1
+    assert mocked.call_count == 2
+
+
+def test_get_ancestors_not_found(corpus):
+    assert profile_ancestors.get_ancestors(derived('http://example.org/StructureDefinition/Missing'), VERSION) == ()
+    assert profile_ancestors.get_ancestors({'type': 'AllergyIntolerance'}, VERSION) == ()
+
+
+def test_get_ancestors_loop(tmp_path):
+    first = derived('http://example.org/StructureDefinition/B', 'http://example.org/StructureDefinition/A')
+    second = derived('http://example.org/StructureDefinition/A', 'http://example.org/StructureDefinition/B')
+    for profile in [first, second]:
+        (tmp_path / (profile['name'] + '.json')).write_text(json.dumps(profile))
+    profile_ancestors.add_ancestor_source(str(tmp_path))
+
+    output_data = profile_ancestors.get_ancestors(first, VERSION)
+    assert [a.name for a in output_data] == ['B', 'A']
+
+
+def test_get_ancestors_package(profiles, tmp_path):
+    package = tmp_path / 'package'
+    package.mkdir()
+    (package / 'package.json').write_text(json.dumps({'name': 'example', 'fhirVersions': [VERSION]}))
+    (package / 'StructureDefinition-parent.json').write_text(json.dumps(profiles[0]))
+    package_source.add_package(str(tmp_path))
+    try:
+        output_data = profile_ancestors.get_ancestors(profiles[1], VERSION)
+        # Not for the version
+        assert profile_ancestors.get_ancestors(profiles[1], '4.0.1') == ()
+    finally:
+        package_source.clear_packages()
+    assert [a.name for a in output_data] == [PARENT_NAME]
+
+
+def test_common_ancestors(corpus, profiles):
+    output_data = profile_ancestors.common_ancestors(derived(CHILD_URL), profiles[1], VERSION)
+    assert [a.url for a in output_data] == [PARENT_URL]
+    assert profile_ancestors.common_ancestors(profiles[1], profiles[0], VERSION) == ()
+
+
+@pytest.mark.parametrize('element_id, component, expected_data', [
+    ('AllergyIntolerance.identifier.system', 'min', (CHILD_URL, 1)),
+    ('AllergyIntolerance.identifier.assigner', 'type', (PARENT_URL, [{'code': 'Reference', 'targetProfile':
+        'https://fhir.hl7.org.uk/STU3/StructureDefinition/CareConnect-Organization-1'}])),
+    # As the element it slices
+    ('AllergyIntolerance.code.coding:other.system', 'min', (CHILD_URL, 1)),
+    ('AllergyIntolerance.reaction.substance.coding:other.version', 'max', (None, {})),
+    ('AllergyIntolerance.code.coding:snomedCT.system', 'min', (PARENT_URL, 1)),
+    ('AllergyIntolerance.clinicalStatus', 'binding', (None, {})),
+])
+def test_find_constraint(element_id, component, expected_data, corpus):
+    ancestors = profile_ancestors.get_ancestors(derived(CHILD_URL), VERSION)
+    ancestor, value = profile_ancestors.find_constraint(ancestors, element_id, component)
+    output_data = (ancestor.url if ancestor else None, value)
+    assert output_data == expected_data
+
+
+def test_component_diff_introduced_by(corpus, profiles, local_definitions):
+    right = dict(profiles[1], url='http://example.org/StructureDefinition/Other')
+    output_data = profile_diff.component_diff(profiles[1], right, VERSION)
+    introduced_by = 'Introduced by ' + PARENT_NAME + ' (' + PARENT_URL + ')  \n'
+    assert output_data['AllergyIntolerance.reaction.substance.coding:snomedCT.code']['min'].base == \
+        introduced_by + '"min" == 1'
+    assert output_data['AllergyIntolerance.reaction.substance.coding']['slicing'].base.startswith(
+        introduced_by + '```json\n')
+    assert output_data['AllergyIntolerance.clinicalStatus']['min'].base == \
+        'Introduced by the core definition  \n"min" == 0'
+    assert output_data['AllergyIntolerance.note']['mustSupport'].base == \
+        '"mustSupport" is not defined in the base element definition.'
+
+    # Only from the core definition without ancestors
+    output_data = profile_diff.component_diff(profiles[0], dict(profiles[0], url=right['url']), VERSION)
+    assert output_data['AllergyIntolerance.assertedDate']['min'].base == '"min" == 0'
+    assert not any(r.base.startswith('Introduced by') for e in output_data.values() for r in e.values())
@@ -0,0 +1,28 @@
+import pytest
+from ...lib import profile_args
+from unittest import mock
+
+LEFT_PROFILE = 'CareConnect-AllergyIntolerance-1.json'
+RIGHT_PROFILE = 'CareConnect-GPC-AllergyIntolerance-1.json'
+
+
+@pytest.fixture(autouse=True)
+def instrumentation_settings():
+    with mock.patch('src.lib.instrumentation.settings', {'enabled': False, 'trace': False}):
+        yield
+
+
+@pytest.mark.parametrize('arguments, expected_data', [
+    (['--stats', '{left}', '{right}'], (True, None)),
+    (['{left}', '{right}', '--stats'], (True, None)),
+    (['--stats-file', 'stats.json', '{left}', '{right}'], (False, 'stats.json')),
+    (['{left}', '{right}'], (False, None)),
+])
+def test_get_args_stats(arguments, expected_data, data_dir):
+    argv = [a.replace('{left}', data_dir + '/' + LEFT_PROFILE).replace('{right}', data_dir + '/' + RIGHT_PROFILE)
+            for a in arguments]
+    with mock.patch('sys.argv', ['fhir_structure_diff.py'] + argv):
+        args = profile_args.get_args()
+    output_data = (args.stats, args.stats_file)
+    assert output_data == expected_data
+    assert args.leftprofile['name'] == 'CareConnect-AllergyIntolerance-1'
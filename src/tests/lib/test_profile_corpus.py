@@ -0,0 +1,124 @@
+import json
+import os
+import tarfile
+import pytest
+from unittest import mock
+from ...lib import profile_corpus
+from ...lib.profile_elements import extract_elements
+
+LEFT_PROFILE = 'CareConnect-AllergyIntolerance-1.json'
+RIGHT_PROFILE = 'CareConnect-GPC-AllergyIntolerance-1.json'
+LEFT_URL = 'https://fhir.hl7.org.uk/STU3/StructureDefinition/CareConnect-AllergyIntolerance-1'
+RIGHT_NAME = 'CareConnect-GPC-AllergyIntolerance-1'
+VALUE_SET = {'resourceType': 'ValueSet', 'url': 'http://example.org/ValueSet/a', 'name': 'A'}
+
+
+@pytest.fixture(autouse=True)
+def corpora():
+    with mock.patch('src.lib.profile_corpus.corpora', {}):
+        yield
+
+
+@pytest.fixture
+def profiles(data_dir):
+    return [json.load(open(data_dir + '/' + LEFT_PROFILE)), json.load(open(data_dir + '/' + RIGHT_PROFILE))]
+
+
+def write_json(path, value, indent=2):
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'w') as f:
+        json.dump(value, f, indent=indent)
+    return path
+
+
+def bundle(resources):
+    return {'resourceType': 'Bundle', 'type': 'collection',
+            'entry': [{'fullUrl': r['url'], 'resource': r} for r in resources]}
+
+
+@pytest.mark.parametrize('indent', [None, 2])
+def test_bundle_corpus(indent, profiles, tmp_path):
+    path = write_json(str(tmp_path / 'bundle.json'), bundle([profiles[0], VALUE_SET, profiles[1]]), indent)
+    corpus = profile_corpus.get_corpus(path)
+    assert [e['name'] for e in corpus['entries']] == ['CareConnect-AllergyIntolerance-1', RIGHT_NAME]
+    assert all(e['filename'] == 'bundle.json' and e['differential'] for e in corpus['entries'])
+    assert list(corpus['urls'])[0] == LEFT_URL
+    assert [e['name'] for e in corpus['types']['AllergyIntolerance']] == [e['name'] for e in corpus['entries']]
+
+    output_data = [profile_corpus.load_profile(corpus, e)[0] for e in corpus['entries']]
+    assert output_data == profiles
+
+
+def test_directory_corpus(profiles, tmp_path):
+    write_json(str(tmp_path / 'ig' / 'a' / LEFT_PROFILE), profiles[0])
+    write_json(str(tmp_path / 'ig' / 'b' / 'bundle.json'), bundle([VALUE_SET, profiles[1]]))
+    write_json(str(tmp_path / 'ig' / 'valueset.json'), VALUE_SET)
+    write_json(str(tmp_path / 'ig' / 'list.json'), [profiles[0]])
+    (tmp_path / 'ig' / 'empty.json').write_text('')
+    (tmp_path / 'ig' / 'invalid.json').write_text('{"resourceType": ')
+    (tmp_path / 'ig' / 'readme.txt').write_text('{}')
+
+    corpus = profile_corpus.get_corpus(str(tmp_path / 'ig'))
+    output_data = [(e['filename'], e['name']) for e in corpus['entries']]
+    expected_data = [(os.path.join('a', LEFT_PROFILE), 'CareConnect-AllergyIntolerance-1'),
+                     (os.path.join('b', 'bundle.json'), RIGHT_NAME)]
+    assert output_data == expected_data
+    assert profile_corpus.load_profile(corpus, corpus['names'][RIGHT_NAME])[0] == profiles[1]
+
+
+@pytest.mark.parametrize('packed', [True, False])
+def test_package_corpus(packed, profiles, tmp_path):
+    package = tmp_path / 'ig'
+    write_json(str(package / 'package' / 'package.json'), {'name': 'example.ig', 'fhirVersions': ['3.0.1']})
+    write_json(str(package / 'package' / 'StructureDefinition-left.json'), profiles[0])
+    write_json(str(package / 'package' / 'StructureDefinition-right.json'), profiles[1])
+    # Only the package folder is read
+    write_json(str(package / 'package' / 'other' / 'right.json'), profiles[1])
+    path = str(package)
+    if packed:
+        path = str(tmp_path / 'ig.tgz')
+        with tarfile.open(path, 'w:gz') as tar:
+            tar.add(str(package / 'package'), arcname='package')
+
+    corpus = profile_corpus.get_corpus(path)
+    assert [e['filename'] for e in corpus['entries']] == ['StructureDefinition-left.json',
+                                                          'StructureDefinition-right.json']
+    output_data = profile_corpus.load_profile(corpus, corpus['urls'][LEFT_URL])
+    expected_data = (profiles[0], '3.0.1', 'CareConnect-AllergyIntolerance-1', 'AllergyIntolerance')
+    assert output_data == expected_data
+    profile_corpus.clear_corpora()
+
+
+@pytest.mark.parametrize('selector', [RIGHT_NAME, 'https://fhir.nhs.uk/STU3/StructureDefinition/' + RIGHT_NAME])
+def test_read_profile_location(selector, profiles, tmp_path):
+    path = write_json(str(tmp_path / 'bundle.json'), bundle([profiles[1], VALUE_SET]))
+    output_data = profile_corpus.read_profile(path + '#' + selector)
+    expected_data = (profiles[1], '3.0.1', RIGHT_NAME, 'AllergyIntolerance')
+    assert output_data == expected_data
+    # Read by type, as there is only the one
+    assert profile_corpus.read_profile(path + '#AllergyIntolerance') == expected_data
+
+
+def test_read_profile_location_file(data_dir, profiles):
+    output_data = profile_corpus.read_profile(data_dir + '/' + LEFT_PROFILE)[0]
+    assert output_data == profiles[0]
+
+
+def test_read_profile_location_not_unique(profiles, tmp_path):
+    path = write_json(str(tmp_path / 'bundle.json'), bundle(profiles))
+    with pytest.raises(ValueError) as exception_info:
+        profile_corpus.read_profile(path + '#AllergyIntolerance')
+    assert 'More than one profile with resource type AllergyIntolerance' in str(exception_info.value)
+    assert path + '#' + LEFT_URL in str(exception_info.value)
+
+    with pytest.raises(ValueError) as exception_info:
+        profile_corpus.read_profile(path + '#Patient')
+    assert 'No profile with url, name or resource type Patient' in str(exception_info.value)
+
+
+@mock.patch('src.lib.structuredefinition_reader.reader_settings', {'section_read_bytes': 0})
+def test_load_profile_sections(local_definitions, profiles, tmp_path):
+    path = write_json(str(tmp_path / 'bundle.json'), bundle(profiles))
+    output_data = profile_corpus.read_profile(path + '#' + RIGHT_NAME)[0]
+    assert 'text' not in output_data
+    assert extract_elements(output_data) == extract_elements(profiles[1])
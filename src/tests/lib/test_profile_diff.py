@@ -1,9 +1,11 @@
 import pytest
 from ...lib import profile_diff
-from ...lib import profile_elements
+from ...lib.profile_elements import AlignedElement
+from ...lib.profile_diff import ComponentResult
 from unittest import mock
 
 
+@mock.patch('src.lib.json_codec.codec_settings', {'codec': 'json'})
 @mock.patch('json.dumps')
 def test_json_pretty(mocked):
     profile_diff.json_pretty('{}')
@@ -13,20 +15,29 @@ def test_json_pretty(mocked):
 def test_json_diff(data_left_right_elements_operands_right_base_path,
                    data_diff_operands_right_base_path):
     output_data = profile_diff.json_diff(
-        data_left_right_elements_operands_right_base_path["AllergyIntolerance.extension"][0],
-        data_left_right_elements_operands_right_base_path["AllergyIntolerance.extension"][1]);
+        data_left_right_elements_operands_right_base_path.left,
+        data_left_right_elements_operands_right_base_path.right);
     expected_data = data_diff_operands_right_base_path
     assert output_data == expected_data
 
 
-def test_list_diff(data_operands_right_base_path_left,
+@pytest.mark.parametrize('engine', ['myers', 'difflib'])
+def test_list_diff(engine,
+                   data_operands_right_base_path_left,
                    data_operands_right_base_path_right,
                    data_diff_operands_right_base_path):
-    output_data = profile_diff.list_diff(data_operands_right_base_path_left, data_operands_right_base_path_right);
+    with mock.patch('src.lib.line_diff.engine_settings', {'engine': engine}):
+        output_data = profile_diff.list_diff(data_operands_right_base_path_left, data_operands_right_base_path_right);
     expected_data = data_diff_operands_right_base_path
     assert output_data == expected_data
 
 
+def test_list_diff_no_changes(data_operands_right_base_path_left):
+    output_data = profile_diff.list_diff(data_operands_right_base_path_left, data_operands_right_base_path_left)
+    expected_data = ''
+    assert output_data == expected_data
+
+
 def test_primitive_component_diff_all_same(data_basic_primitive):
     output_data = profile_diff.primitive_component_diff(data_basic_primitive,
                                                         data_basic_primitive,
@@ -76,8 +87,8 @@ def test_primitive_component_diff_empty(data_input_empty):
 def test_object_component_diff_json_diff(data_left_right_elements_operands_right_base_path,
                                          data_diff_operands_right_base_path):
     output_data = profile_diff.object_component_diff(
-        data_left_right_elements_operands_right_base_path["AllergyIntolerance.extension"][0],
-        data_left_right_elements_operands_right_base_path["AllergyIntolerance.extension"][1],
+        data_left_right_elements_operands_right_base_path.left,
+        data_left_right_elements_operands_right_base_path.right,
         [{'code': 'Extension'}])
     expected_data = (data_diff_operands_right_base_path, ('See diff', 'See diff'))
     assert output_data == expected_data
@@ -86,7 +97,7 @@ def test_object_component_diff_json_diff(data_left_right_elements_operands_right
 def test_object_component_diff_right_empty(data_left_right_elements_operands_right_base_path,
                                            data_left_right_elements_operands_right_base_path_left_pretty):
     output_data = profile_diff.object_component_diff(
-        data_left_right_elements_operands_right_base_path["AllergyIntolerance.extension"][0],
+        data_left_right_elements_operands_right_base_path.left,
         {},
         [{'code': 'Extension'}])
     expected_data = (data_left_right_elements_operands_right_base_path_left_pretty,
@@ -97,8 +108,7 @@ def test_object_component_diff_right_empty(data_left_right_elements_operands_rig
 def test_object_component_diff_left_empty(data_left_right_elements_operands_right_base_path,
                                           data_left_right_elements_operands_right_base_path_left_pretty):
     output_data = profile_diff.object_component_diff({},
-                                                     data_left_right_elements_operands_right_base_path[
-                                                         "AllergyIntolerance.extension"][0],
+                                                     data_left_right_elements_operands_right_base_path.left,
                                                      [{'code': 'Extension'}])
     expected_data = (data_left_right_elements_operands_right_base_path_left_pretty,
                      ('Not defined', 'Nothing to diff, value below'))
@@ -118,10 +128,10 @@ def test_base_component_diff_both_primitive(data_basic_primitive):
                                                    data_basic_primitive,
                                                    data_basic_primitive,
                                                    data_basic_primitive)
-    expected_data = {'key': {'table_result': ('Same as base', 'Same as base'),
-                             'match': {},
-                             'component_diff': {},
-                             'base': '"key" == ' + str(data_basic_primitive)}}
+    expected_data = ComponentResult(table_result=('Same as base', 'Same as base'),
+                                    match={},
+                                    component_diff={},
+                                    base='"key" == ' + str(data_basic_primitive))
     assert output_data == expected_data
 
 
@@ -130,10 +140,10 @@ def test_base_component_diff_not_primitive():
                                                    {'simple': 'json'},
                                                    {'simple': 'json'},
                                                    {'simple': 'json'})
-    expected_data = {'key': {'table_result': ('Match', 'Match'),
-                             'match': '{\n  "simple": "json"\n}',
-                             'component_diff': {},
-                             'base': '```json\n{\n  "simple": "json"\n}\n```'}}
+    expected_data = ComponentResult(table_result=('Match', 'Match'),
+                                    match='{\n  "simple": "json"\n}',
+                                    component_diff={},
+                                    base='```json\n{\n  "simple": "json"\n}\n```')
     assert output_data == expected_data
 
 
@@ -142,10 +152,10 @@ def test_base_component_diff_not_primitive_do_not_match():
                                                    {'simple': 'json'},
                                                    {'simple': 'Not matching'},
                                                    {'simple': 'json'})
-    expected_data = {'key': {'table_result': ('See diff', 'See diff'),
-                             'match': {},
-                             'component_diff': ' {  \n-  "simple": "json"  \n+  "simple": "Not matching"  \n }  \n',
-                             'base': '```json\n{\n  "simple": "json"\n}\n```'}}
+    expected_data = ComponentResult(table_result=('See diff', 'See diff'),
+                                    match={},
+                                    component_diff=' {  \n-  "simple": "json"  \n+  "simple": "Not matching"  \n }  \n',
+                                    base='```json\n{\n  "simple": "json"\n}\n```')
     assert output_data == expected_data
 
 
@@ -154,13 +164,21 @@ def test_base_component_diff_not_primitive_base_empty():
                                                    {'simple': 'json'},
                                                    {'simple': 'json'},
                                                    {})
-    expected_data = {'key': {'table_result': ('Match', 'Match'),
-                             'match': '{\n  "simple": "json"\n}',
-                             'component_diff': {},
-                             'base': '"key" is not defined in the base element definition.'}}
+    expected_data = ComponentResult(table_result=('Match', 'Match'),
+                                    match='{\n  "simple": "json"\n}',
+                                    component_diff={},
+                                    base='"key" is not defined in the base element definition.')
     assert output_data == expected_data
 
 
+def test_base_component_diff_reordered():
+    left = [{'key': 'a', 'severity': 'error'}, {'key': 'b'}]
+    output_data = profile_diff.base_component_diff('constraint', left, list(reversed(left)), {})
+    assert output_data.table_result == (profile_diff.REORDERED_RESULT, profile_diff.REORDERED_RESULT)
+    assert output_data.match == profile_diff.json_pretty(left)
+    assert not output_data.component_diff
+
+
 @mock.patch('src.lib.profile_diff.get_base_component',
             lambda element, component_key, version: \
                     {'discriminator':
@@ -174,42 +192,49 @@ def test_base_component_diff_not_primitive_base_empty():
 def test_component_level_diff(data_left_right_elements_operands_left_base_path,
                               data_component_diff_allergyintolerance_results):
     output_data = profile_diff.component_level_diff(data_left_right_elements_operands_left_base_path,
-                                                    {'slicing':
-                                                         (
-                                                             {'discriminator': [{'type': 'value', 'path': 'url'}], 'rules': 'open'},
-                                                             {'discriminator': [{'type': 'value', 'path': 'url'}], 'rules': 'open'}
-                                                         )
-                                                     },
+                                                    AlignedElement(
+                                                        'slicing',
+                                                        {'discriminator': [{'type': 'value', 'path': 'url'}], 'rules': 'open'},
+                                                        {'discriminator': [{'type': 'value', 'path': 'url'}], 'rules': 'open'}
+                                                    ),
                                                     '3.0.1')
     expected_data = data_component_diff_allergyintolerance_results
     assert output_data == expected_data
 
 
 @mock.patch('src.lib.profile_diff.component_level_diff',
-            lambda element_operands, component, version: \
-                    {'AllergyIntolerance.extension':
-                         {'max': {'table_result': ('Match. "max" == 1', 'Match. "max" == 1'),
-                                  'match': {},
-                                  'component_diff': {},
-                                  'base': '"max" == *'}
-                         }
-                    })
+            lambda element_operands, component, version, base_components=None, ancestors=(): \
+                    ComponentResult(table_result=('Match. "max" == 1', 'Match. "max" == 1'),
+                                    match={},
+                                    component_diff={},
+                                    base='"max" == *'))
 def test_detailed_diff():
     output_data = profile_diff.detailed_diff({"AllergyIntolerance.extension": {"max": "1"}},
                                              {"AllergyIntolerance.extension": {"max": "1"}},
                                              '3.0.1')
     expected_data = {'AllergyIntolerance.extension':
-                         {'max': {'table_result': ('Match. "max" == 1', 'Match. "max" == 1'),
-                                  'match': {},
-                                  'component_diff': {},
-                                  'base': '"max" == *'}
+                         {'max': ComponentResult(table_result=('Match. "max" == 1', 'Match. "max" == 1'),
+                                                 match={},
+                                                 component_diff={},
+                                                 base='"max" == *')
                          }
                     }
     assert output_data == expected_data
 
 
+@mock.patch('src.lib.profile_diff.component_level_diff',
+            lambda e, c, v, b, a: ComponentResult((c.left, c.right), {}, {}, ''))
+def test_iter_detailed_diff():
+    left = {'AllergyIntolerance.code': {'min': 1, 'short': 'Code'}}
+    right = {'AllergyIntolerance.code': {'min': 0, 'short': 'Code'}}
+    output_data = list(profile_diff.iter_detailed_diff(left, right, '3.0.1'))
+    expected_data = [('AllergyIntolerance.code', 'min', ComponentResult((1, 0), {}, {}, '')),
+                     ('AllergyIntolerance.code', 'short', ComponentResult(('Code', 'Code'), {}, {}, ''))]
+    assert output_data == expected_data
+
+
 @mock.patch('src.lib.profile_diff.detailed_diff',
-            lambda left_elements, right_elements, version: \
+            lambda left_elements, right_elements, version, ancestors=(): \
                     {'AllergyIntolerance.extension':
                          {'max': {'table_result': ('Match. "max" == 1', 'Match. "max" == 1'),
                                   'match': {},
@@ -66,6 +66,16 @@ def test_align_elements_valid(data_left_elements_valid,
     assert output_data == expected_data
 
 
+def test_align_elements_order():
+    output_data = profile_elements.align_elements({'a': 1, 'b': 0, 'c': 3},
+                                                  {'d': 4, 'c': 5, 'a': False})
+    expected_data = [profile_elements.AlignedElement('a', 1, False),
+                     profile_elements.AlignedElement('b', 0, {}),
+                     profile_elements.AlignedElement('c', 3, 5),
+                     profile_elements.AlignedElement('d', {}, 4)]
+    assert output_data == expected_data
+
+
 def test_align_elements_invalid(data_invalid_no_empty_dict):
     with pytest.raises(TypeError) as exception_info:
         profile_elements.align_elements(data_invalid_no_empty_dict, data_invalid_no_empty_dict)
@@ -105,3 +115,35 @@ def test_extract_elements(data_extract_diff_elements_valid,
     output_data = profile_elements.extract_elements(data_extract_diff_elements_valid)
     expected_data = data_diff_elements_valid
     assert output_data == expected_data
+
+
+def test_get_snapshot_index(data_allergyintolerance_stu3_base_profile):
+    output_data = profile_elements.get_snapshot_index(data_allergyintolerance_stu3_base_profile)
+    expected_data = data_allergyintolerance_stu3_base_profile['snapshot']['element'][1]
+    assert output_data['AllergyIntolerance.id'] == expected_data
+    assert len(output_data) == len(data_allergyintolerance_stu3_base_profile['snapshot']['element'])
+
+
+def test_get_snapshot_index_no_snapshot(data_extract_diff_elements_valid):
+    output_data = profile_elements.get_snapshot_index(data_extract_diff_elements_valid)
+    expected_data = {}
+    assert output_data == expected_data
+
+
+def test_add_snapshot_elements_to_diff_shared_index(data_allergyintolerance_stu3_base_profile,
+                                                    data_right_elements_valid,
+                                                    data_elements_valid_with_or_without_base_path):
+    snapshot_index = profile_elements.get_snapshot_index(data_allergyintolerance_stu3_base_profile)
+    output_data = profile_elements.add_snapshot_elements_to_diff({}, data_right_elements_valid, snapshot_index)
+    expected_data = data_elements_valid_with_or_without_base_path
+    assert output_data == expected_data
+
+
+def test_extract_diff_elements_interned():
+    # Built at runtime, so not already interned as a literal would be
+    element_id = ''.join(['AllergyIntolerance', '.code'])
+    profiles = [{'differential': {'element': [{'id': ''.join(['AllergyIntolerance', '.code']),
+                                               'path': ''.join(['AllergyIntolerance', '.code'])}]}}
+                for _ in range(2)]
+    first, second = [profile_elements.extract_diff_elements(p)[element_id] for p in profiles]
+    assert first['id'] is second['id'] is first['path']
@@ -0,0 +1,48 @@
+import copy
+import pytest
+from ...lib import profile_diff
+from ...lib import profile_generator
+from unittest import mock
+
+
+@pytest.mark.parametrize('size', [1, 50, 1000])
+def test_generate_profile_size(size):
+    output_data = profile_generator.generate_profile(size)
+    assert len(output_data['differential']['element']) == size
+    assert len(output_data['snapshot']['element']) == size
+
+
+def test_generate_profile_deterministic():
+    assert profile_generator.generate_profile(500, seed=3) == profile_generator.generate_profile(500, seed=3)
+    assert profile_generator.generate_profile(500, seed=3) != profile_generator.generate_profile(500, seed=4)
+
+
+def test_generate_profile_shapes():
+    profile = profile_generator.generate_profile(2000, slice_depth=3)
+    ids = [e['id'] for e in profile['differential']['element']]
+    assert len(set(ids)) == len(ids)
+    assert 'AllergyIntolerance.code.coding:snomedCT' in ids
+    assert 'AllergyIntolerance.code.coding:snomedCT.extension:snomedCTExtension2.extension:snomedCTExtension1' in ids
+    assert 'AllergyIntolerance.onset[x]' in ids
+    assert 'AllergyIntolerance.extension:encounter' in ids
+    assert all('base' in e and 'base' not in d
+               for e, d in zip(profile['snapshot']['element'], profile['differential']['element']))
+
+
+def test_generate_profile_slice_depth():
+    profile = profile_generator.generate_profile(100, slice_depth=1)
+    ids = [e['id'] for e in profile['differential']['element']]
+    assert 'AllergyIntolerance.code.coding:snomedCT' in ids
+    assert not any('snomedCT.extension' in i for i in ids)
+
+
+@pytest.mark.parametrize('divergence', [0, 0.1, 1])
+def test_generate_pair_diffs(divergence):
+    left, right = profile_generator.generate_pair(300, divergence=divergence)
+    with mock.patch('src.lib.profile_diff.get_base_component', return_value={}):
+        output_data = profile_diff.component_diff(copy.deepcopy(left), copy.deepcopy(right), left['fhirVersion'])
+    assert output_data
+    assert (profile_diff.element_diff(left, right) == '') == \
+           ([e['id'] for e in left['differential']['element']] == [e['id'] for e in right['differential']['element']])
+    if not divergence:
+        assert left['differential'] == right['differential']
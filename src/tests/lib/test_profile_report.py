@@ -0,0 +1,93 @@
+import os
+import argparse
+import pytest
+from jinja2 import Template
+from ...lib import profile_report
+from ...lib import profile_args
+from ...lib.profile_diff import ComponentResult
+from unittest import mock
+
+TEMPLATE = os.path.dirname(os.path.realpath(profile_args.__file__)) + profile_args.DEFAULT_TEMPLATE
+
+COMPONENT_RESULTS = {'AllergyIntolerance.extension':
+                         {'max': ComponentResult(table_result=('Match. "max" == 1', 'Match. "max" == 1'),
+                                                 match={},
+                                                 component_diff={},
+                                                 base='"max" == *')}}
+
+
+@pytest.fixture
+def template_cache():
+    with mock.patch('src.lib.profile_report.template_environments', {}), \
+            mock.patch('src.lib.profile_report.template_settings', {'bytecode_cache': None}):
+        yield
+
+
+def test_get_template_reused(template_cache):
+    output_data = profile_report.get_template(TEMPLATE)
+    expected_data = profile_report.get_template(TEMPLATE)
+    assert output_data is expected_data
+
+
+def test_get_template_reloaded_when_changed(template_cache, tmp_path):
+    template = tmp_path / 'report.md.jinja2'
+    template.write_text('one')
+    profile_report.get_template(str(template))
+    template.write_text('two')
+    os.utime(str(template), (0, os.path.getmtime(str(template)) + 10))
+    output_data = profile_report.get_template(str(template)).render()
+    expected_data = 'two'
+    assert output_data == expected_data
+
+
+def test_configure_template_cache_bytecode(template_cache, tmp_path):
+    profile_report.configure_template_cache(argparse.Namespace(nocache=False, cachedir=str(tmp_path)))
+    profile_report.get_template(TEMPLATE)
+    output_data = len(os.listdir(str(tmp_path / profile_report.TEMPLATE_CACHE_FOLDER)))
+    expected_data = 1
+    assert output_data == expected_data
+
+
+def test_configure_template_cache_nocache(template_cache, tmp_path):
+    profile_report.configure_template_cache(argparse.Namespace(nocache=True, cachedir=str(tmp_path)))
+    profile_report.get_template(TEMPLATE)
+    assert not os.path.exists(str(tmp_path / profile_report.TEMPLATE_CACHE_FOLDER))
+
+
+def test_get_report_filename():
+    output_data = profile_report.get_report_filename(TEMPLATE)
+    expected_data = 'markdown.md'
+    assert output_data == expected_data
+
+
+@mock.patch('src.lib.base_definitions.prefetch_definitions', lambda required: None)
+@mock.patch('src.lib.profile_diff.element_diff', lambda left, right: '-AllergyIntolerance.code  \n')
+@mock.patch('src.lib.profile_diff.component_diff', lambda left, right, version: COMPONENT_RESULTS)
+def test_write_report(template_cache, tmp_path, data_single_element):
+    profile = dict(data_single_element, type='AllergyIntolerance', name='Name')
+    diff_file = str(tmp_path / 'report.md')
+    output_data = profile_report.write_report(profile, '3.0.1', profile, '3.0.1', TEMPLATE, diff_file)
+    assert output_data == diff_file
+
+    report = profile_report.DiffReport(resource_type='AllergyIntolerance',
+                                       left_profile='Name',
+                                       left_version='3.0.1',
+                                       right_profile='Name',
+                                       right_version='3.0.1',
+                                       element_level_diff='-AllergyIntolerance.code  \n',
+                                       component_results=COMPONENT_RESULTS)
+    expected_data = Template(open(TEMPLATE).read()).render(report=report)
+    assert open(diff_file).read() == expected_data
+    assert '|Match. "max" == 1|Match. "max" == 1|' in expected_data
+
+
+def test_render_report_template_fields(template_cache, tmp_path):
+    # Templates written before DiffReport use the fields directly
+    template = tmp_path / 'report.md.jinja2'
+    template.write_text("{{left_profile}}{% for element in component_results %}"
+                        "{{component_results[element]['max']['table_result'][0]}}{% endfor %}")
+    report = profile_report.DiffReport('AllergyIntolerance', 'Name', '3.0.1', 'Name', '3.0.1', '', COMPONENT_RESULTS)
+    diff_file = profile_report.render_report(report, str(template), str(tmp_path / 'report.md'))
+    output_data = open(diff_file).read()
+    expected_data = 'NameMatch. "max" == 1'
+    assert output_data == expected_data
@@ -0,0 +1,125 @@
+import argparse
+import os
+import pytest
+from collections import OrderedDict
+from ...lib import base_definitions
+from ...lib import profile_diff
+from ...lib import result_cache
+from ...lib.profile_ancestors import Ancestor
+from ...lib.profile_diff import ComponentResult
+from ...lib.profile_elements import AlignedElement
+from unittest import mock
+
+LEFT = {'url': 'https://example.org/left', 'name': 'Left'}
+RIGHT = {'url': 'https://example.org/right', 'name': 'Right'}
+
+
+@pytest.fixture
+def cache_directory(tmp_path, local_definitions):
+    with mock.patch('src.lib.result_cache.cache_settings', {'directory': None}):
+        result_cache.configure(argparse.Namespace(nocache=False, cachedir=str(tmp_path)))
+        yield os.path.join(str(tmp_path), result_cache.RESULT_CACHE_FOLDER)
+        result_cache.clear()
+
+
+def elements(short):
+    return {'AllergyIntolerance.code': {'id': 'AllergyIntolerance.code', 'short': 'Code'},
+            'AllergyIntolerance.patient': {'id': 'AllergyIntolerance.patient', 'short': short}}
+
+
+def run_diff(left, right):
+    result_cache.load(LEFT, RIGHT, '3.0.1')
+    with mock.patch('src.lib.profile_diff.component_level_diff',
+                    side_effect=lambda e, c, v, b, a: ComponentResult([c.left, c.right], {}, {}, '')) as mocked:
+        output_data = profile_diff.detailed_diff(left, right, '3.0.1')
+    result_cache.save()
+    return output_data, mocked.call_count
+
+
+def test_rerun_uses_cached_results(cache_directory):
+    first, first_calls = run_diff(elements('Patient'), elements('Patient'))
+    second, second_calls = run_diff(elements('Patient'), elements('Patient'))
+    assert first == second
+    assert (first_calls, second_calls) == (4, 0)
+
+
+def test_rerun_recomputes_changed_element(cache_directory):
+    run_diff(elements('Patient'), elements('Patient'))
+    output_data, calls = run_diff(elements('Patient'), elements('The patient'))
+    assert output_data['AllergyIntolerance.patient'] == {'short': ComponentResult(['Patient', 'The patient'], {}, {}, '')}
+    assert calls == 2
+
+
+def test_save_drops_unused_results(cache_directory):
+    run_diff(elements('Patient'), elements('Patient'))
+    run_diff(elements('Patient'), elements('The patient'))
+    result_cache.load(LEFT, RIGHT, '3.0.1')
+    assert len(result_cache.pair_cache['results']) == 2
+
+
+def test_tool_version_invalidates(cache_directory):
+    run_diff(elements('Patient'), elements('Patient'))
+    with mock.patch('src.lib.result_cache.tool', {'version': 'different'}):
+        output_data, calls = run_diff(elements('Patient'), elements('Patient'))
+    assert calls == 4
+
+
+def test_element_key_ancestors(local_definitions):
+    element = AlignedElement('AllergyIntolerance.code:a', {'min': 1}, {'min': 0})
+    ancestor = Ancestor('https://example.org/parent', 'Parent', None, {'allergyintolerance.code': {'min': 1}})
+    output_data = result_cache.element_key(element, '3.0.1', (ancestor,))
+    assert output_data != result_cache.element_key(element, '3.0.1')
+    # Only what the ancestor constrains the element with
+    changed = ancestor._replace(element_index=dict(ancestor.element_index, **{'allergyintolerance.note': {}}))
+    assert result_cache.element_key(element, '3.0.1', (changed,)) == output_data
+    changed = ancestor._replace(element_index={'allergyintolerance.code': {'min': 0}})
+    assert result_cache.element_key(element, '3.0.1', (changed,)) != output_data
+
+
+def test_element_key_diff_engine(local_definitions):
+    element = AlignedElement('AllergyIntolerance.code', {'min': 1}, {'min': 0})
+    output_data = result_cache.element_key(element, '3.0.1')
+    with mock.patch.dict('src.lib.line_diff.engine_settings', {'engine': 'difflib'}):
+        assert result_cache.element_key(element, '3.0.1') != output_data
+    assert result_cache.element_key(element, '3.0.1') == output_data
+
+
+def test_element_key_definitions(local_definitions):
+    element = AlignedElement('AllergyIntolerance.code', {'min': 1}, {'min': 0})
+    output_data = result_cache.element_key(element, '3.0.1')
+    # A different copy of the base definition, e.g. from a package
+    definition, element_index, size, digest = base_definitions.resource_cache['AllergyIntolerance3.0.1']
+    base_definitions.resource_cache['AllergyIntolerance3.0.1'] = (definition, element_index, size, 'other')
+    assert result_cache.element_key(element, '3.0.1') != output_data
+    # Not found, or failed to download
+    assert result_cache.element_key(AlignedElement('Unknown.code', {'min': 1}, {'min': 0}), '3.0.1') is None
+
+
+def test_failed_definitions_not_cached(cache_directory, local_definitions):
+    left = {'AllergyIntolerance.code': {'id': 'AllergyIntolerance.code', 'short': 'Code'}}
+    right = {'AllergyIntolerance.code': {'id': 'AllergyIntolerance.code', 'short': 'Code'}}
+    # The first run is unable to download the base definition
+    with mock.patch('src.lib.base_definitions.resource_cache', OrderedDict()), \
+            mock.patch('src.lib.base_definitions.read_definition', return_value='{}'):
+        result_cache.load(LEFT, RIGHT, '3.0.1')
+        first = profile_diff.detailed_diff(left, right, '3.0.1')
+        result_cache.save()
+    assert first['AllergyIntolerance.code']['short'].base == \
+        '"short" is not defined in the base element definition.'
+
+    result_cache.load(LEFT, RIGHT, '3.0.1')
+    assert result_cache.pair_cache['results'] == {}
+    second = profile_diff.detailed_diff(left, right, '3.0.1')
+    result_cache.save()
+    assert second['AllergyIntolerance.code']['short'].base == \
+        '"short" == Code that identifies the allergy or intolerance'
+    result_cache.load(LEFT, RIGHT, '3.0.1')
+    assert len(result_cache.pair_cache['results']) == 1
+
+
+def test_nocache(tmp_path):
+    result_cache.configure(argparse.Namespace(nocache=True, cachedir=str(tmp_path)))
+    result_cache.load(LEFT, RIGHT, '3.0.1')
+    assert not result_cache.enabled()
+    result_cache.save()
+    assert os.listdir(str(tmp_path)) == []
@@ -0,0 +1,116 @@
+import json
+import os
+import pytest
+from unittest import mock
+from collections import OrderedDict
+from ...lib import snapshot_generator
+from ...lib import profile_elements
+
+VERSION = '3.0.1'
+
+
+@pytest.fixture
+def snapshot_definitions(data_dir):
+    # Base definitions, and the data types the profiles constrain, read from the test data
+    def read_definition(resource_type, version):
+        for filename in [data_dir + '/' + resource_type.lower() + '.profile.json',
+                         data_dir + '/datatypes/' + resource_type.lower() + '.profile.json']:
+            if os.path.exists(filename):
+                return open(filename).read()
+        return '{}'
+
+    with mock.patch('src.lib.base_definitions.resource_cache', OrderedDict()), \
+            mock.patch('src.lib.snapshot_generator.base_trees', OrderedDict()), \
+            mock.patch('src.lib.base_definitions.read_definition', side_effect=read_definition) as mocked:
+        yield mocked
+
+
+def element_ids(snapshot):
+    return [e['id'] for e in snapshot['element']]
+
+
+def differential(*elements):
+    return {'type': 'AllergyIntolerance', 'differential': {'element': list(elements)}}
+
+
+@pytest.mark.parametrize('filename', ['CareConnect-AllergyIntolerance-1.json',
+                                      'CareConnect-GPC-AllergyIntolerance-1.json'])
+def test_generate_snapshot(filename, data_dir, snapshot_definitions):
+    profile = json.load(open(data_dir + '/' + filename))
+    expected = {e['id']: e for e in profile.pop('snapshot')['element']}
+    output_data = snapshot_generator.generate_snapshot(profile, VERSION)
+    generated = {e['id']: e for e in output_data['element']}
+
+    # Every differential element has the base and position the published snapshot gives it
+    for de in profile['differential']['element']:
+        assert generated[de['id']]['base'] == expected[de['id']]['base']
+        assert generated[de['id']]['path'] == expected[de['id']]['path']
+    assert [i for i in element_ids(output_data) if i in expected] == [i for i in expected if i in generated]
+
+
+def test_generate_snapshot_slices(snapshot_definitions):
+    profile = differential({'id': 'AllergyIntolerance.code.coding:b', 'max': '1'},
+                           {'id': 'AllergyIntolerance.code.coding:a'},
+                           {'id': 'AllergyIntolerance.code.coding:a/x', 'min': 1},
+                           {'id': 'AllergyIntolerance.code.coding:a.system', 'min': 1},
+                           {'id': 'AllergyIntolerance.code.coding', 'slicing': {'rules': 'open'}, 'min': 1})
+    output_data = snapshot_generator.generate_snapshot(profile, VERSION)
+    ids = element_ids(output_data)
+    coding = ids.index('AllergyIntolerance.code.coding')
+    assert ids[coding + 1:coding + 3] == ['AllergyIntolerance.code.coding.id',
+                                          'AllergyIntolerance.code.coding.extension']
+    assert [i for i in ids if ':' in i and '.' not in i.rpartition(':')[2]] == \
+        ['AllergyIntolerance.code.coding:b', 'AllergyIntolerance.code.coding:a', 'AllergyIntolerance.code.coding:a/x']
+
+    elements = {e['id']: e for e in output_data['element']}
+    # A slice is of the base element, not the constrained one it slices
+    assert elements['AllergyIntolerance.code.coding:a']['min'] == 0
+    assert 'slicing' not in elements['AllergyIntolerance.code.coding:a']
+    assert elements['AllergyIntolerance.code.coding:a']['sliceName'] == 'a'
+    assert elements['AllergyIntolerance.code.coding:a/x']['sliceName'] == 'a/x'
+    assert elements['AllergyIntolerance.code.coding:a.system']['base']['path'] == 'Coding.system'
+    assert elements['AllergyIntolerance.code.coding:a.system']['min'] == 1
+
+
+@pytest.mark.parametrize('element_id', ['AllergyIntolerance.onset[x]:onsetPeriod',
+                                        'AllergyIntolerance.onsetPeriod'])
+def test_generate_snapshot_choice_types(element_id, snapshot_definitions):
+    output_data = snapshot_generator.generate_snapshot(differential({'id': element_id, 'min': 1}), VERSION)
+    elements = {e['id']: e for e in output_data['element']}
+    ids = element_ids(output_data)
+    assert ids[ids.index('AllergyIntolerance.onset[x]') + 1] == element_id
+    assert elements[element_id]['type'] == [{'code': 'Period'}]
+    assert elements[element_id]['base'] == {'path': 'AllergyIntolerance.onset[x]', 'min': 0, 'max': '1'}
+
+
+def test_generate_snapshot_unknown_element(snapshot_definitions):
+    profile = differential({'id': 'AllergyIntolerance.code.unknown', 'min': 1})
+    output_data = snapshot_generator.generate_snapshot(profile, VERSION)
+    ids = element_ids(output_data)
+    # After the children of code from CodeableConcept, without a base
+    assert ids[ids.index('AllergyIntolerance.code.unknown') - 1] == 'AllergyIntolerance.code.text'
+    assert output_data['element'][ids.index('AllergyIntolerance.code.unknown')] == \
+        {'id': 'AllergyIntolerance.code.unknown', 'path': 'AllergyIntolerance.code.unknown', 'min': 1}
+
+
+@mock.patch('src.lib.instrumentation.count')
+def test_generate_snapshot_base_tree_cache(mocked_count, snapshot_definitions):
+    profile = differential({'id': 'AllergyIntolerance.code.coding.system', 'min': 1})
+    first = snapshot_generator.generate_snapshot(profile, VERSION)
+    tree = snapshot_generator.base_trees[('Coding', VERSION)]
+    assert snapshot_generator.generate_snapshot(profile, VERSION) == first
+    assert snapshot_generator.base_trees[('Coding', VERSION)] is tree
+    counts = [c.args[0] for c in mocked_count.call_args_list]
+    assert counts.count('base_tree_misses') == 3
+    assert counts.count('base_tree_hits') == 3
+    # The cached tree is not changed by the profiles generated from it
+    assert tree.elements['Coding.system']['min'] == 0
+
+
+def test_extract_elements_generated_snapshot(data_dir, snapshot_definitions):
+    profile = json.load(open(data_dir + '/CareConnect-GPC-AllergyIntolerance-1.json'))
+    expected_data = profile_elements.extract_elements(profile)
+    profile.pop('snapshot')
+    assert profile_elements.extract_elements(profile, version=VERSION) == expected_data
+    # The profile's own fhirVersion is used otherwise
+    assert profile_elements.extract_elements(profile) == expected_data
@@ -0,0 +1,89 @@
+import io
+import json
+import pytest
+from ...lib import structured_report
+from unittest import mock
+
+LEFT_PROFILE = 'CareConnect-AllergyIntolerance-1.json'
+RIGHT_PROFILE = 'CareConnect-GPC-AllergyIntolerance-1.json'
+
+
+@pytest.fixture
+def profiles(data_dir, local_definitions):
+    with mock.patch('src.lib.result_cache.cache_settings', {'directory': None}):
+        yield json.load(open(data_dir + '/' + LEFT_PROFILE)), json.load(open(data_dir + '/' + RIGHT_PROFILE))
+
+
+def test_write_structured_report_ndjson(profiles, tmp_path):
+    left, right = profiles
+    diff_file = str(tmp_path / 'diff.ndjson')
+    structured_report.write_structured_report(left, '3.0.1', right, '3.0.1', diff_file, 'ndjson')
+    output_data = [json.loads(line) for line in open(diff_file)]
+
+    assert output_data[0]['record'] == 'header'
+    assert output_data[0]['right'] == {'name': 'CareConnect-GPC-AllergyIntolerance-1', 'version': '3.0.1',
+                                       'url': right['url']}
+    assert output_data[-1] == {'record': 'summary',
+                               'elements': sum(r['record'] == 'element' for r in output_data),
+                               'components': sum(r['record'] == 'component' for r in output_data)}
+    assert {'record': 'element', 'id': 'AllergyIntolerance.code.coding', 'change': 'removed'} in output_data
+    component = next(r for r in output_data
+                     if r['record'] == 'component' and (r['element'], r['component']) ==
+                     ('AllergyIntolerance.identifier.assigner', 'type'))
+    assert sorted(component) == ['base', 'component', 'component_diff', 'element', 'match', 'record',
+                                 'table_result']
+
+
+def test_write_structured_report_json_matches_ndjson(profiles, tmp_path):
+    left, right = profiles
+    structured_report.write_structured_report(left, '3.0.1', right, '3.0.1', str(tmp_path / 'diff.ndjson'),
+                                              'ndjson')
+    structured_report.write_structured_report(left, '3.0.1', right, '3.0.1', str(tmp_path / 'diff.json'), 'json')
+    records = [json.loads(line) for line in open(str(tmp_path / 'diff.ndjson'))]
+    output_data = json.load(open(str(tmp_path / 'diff.json')))
+    expected_data = {'header': structured_report.without_kind(records[0]),
+                     'elements': [structured_report.without_kind(r) for r in records if r['record'] == 'element'],
+                     'components': [structured_report.without_kind(r) for r in records
+                                    if r['record'] == 'component'],
+                     'summary': structured_report.without_kind(records[-1])}
+    assert output_data == expected_data
+
+
+def test_write_json_empty_sections():
+    out = io.StringIO()
+    structured_report.write_json({'record': 'header', 'schema': 1}, iter([]), iter([]), out)
+    output_data = json.loads(out.getvalue())
+    expected_data = {'header': {'schema': 1}, 'elements': [], 'components': [],
+                     'summary': {'elements': 0, 'components': 0}}
+    assert output_data == expected_data
+
+
+def test_write_ndjson_streams_records():
+    # Each record is written before the next is produced
+    out = io.StringIO()
+    written = []
+
+    def components():
+        for n in range(3):
+            written.append(out.getvalue().count('\n'))
+            yield {'record': 'component', 'n': n}
+
+    structured_report.write_ndjson({'record': 'header'}, iter([]), components(), out)
+    assert written == [1, 2, 3]
+
+
+@pytest.mark.parametrize('output_format', ['json', 'ndjson'])
+def test_write_structured_report_not_cached(output_format, profiles, tmp_path):
+    left, right = profiles
+    cache_dir = tmp_path / 'results'
+    with mock.patch('src.lib.result_cache.cache_settings', {'directory': str(cache_dir)}), \
+            mock.patch('src.lib.result_cache.pair_cache', {'file': None, 'results': {}, 'used': {}}) as pair_cache:
+        structured_report.write_structured_report(left, '3.0.1', right, '3.0.1', str(tmp_path / 'diff'), output_format)
+    assert pair_cache['used'] == {}
+    assert not cache_dir.exists()
+
+
+def test_write_structured_report_unknown_format(profiles, tmp_path):
+    left, right = profiles
+    with pytest.raises(ValueError):
+        structured_report.write_structured_report(left, '3.0.1', right, '3.0.1', str(tmp_path / 'diff'), 'markdown')
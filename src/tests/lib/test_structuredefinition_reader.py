@@ -1,6 +1,9 @@
+import json
 import pytest
+from unittest import mock
 
 from ...lib import structuredefinition_reader
+from ...lib.profile_elements import extract_elements
 
 
 def test_get_profile_type_valid(data_allergyintolerance_stu3_base_profile):
@@ -76,3 +79,24 @@ def test_read_profile_unrecognised_file_type():
     with pytest.raises(TypeError) as exception_info:
         structuredefinition_reader.read_profile('unknowm.filetype')
     assert 'Unrecognised file extension' in str(exception_info)
+
+
+def test_read_profile_sections(data_dir):
+    filename = data_dir + '/CareConnect-AllergyIntolerance-1.json'
+    profile = json.load(open(filename))
+    output_data = structuredefinition_reader.read_profile_sections(filename)
+    assert 'text' not in output_data
+    assert output_data['differential'] == profile['differential']
+    assert output_data['snapshot']['element'] == \
+           [{k: e[k] for k in ['id', 'base'] if k in e} for e in profile['snapshot']['element']]
+    assert {k: v for k, v in output_data.items() if k not in ['differential', 'snapshot']} == \
+           {k: profile[k] for k in structuredefinition_reader.PROFILE_FIELDS if k in profile}
+
+
+@mock.patch('src.lib.structuredefinition_reader.reader_settings', {'section_read_bytes': 0})
+def test_read_profile_sections_same_elements(data_dir, local_definitions):
+    filename = data_dir + '/CareConnect-AllergyIntolerance-1.json'
+    output_data = structuredefinition_reader.read_profile(filename)
+    expected_data = (json.load(open(filename)), '3.0.1', 'CareConnect-AllergyIntolerance-1', 'AllergyIntolerance')
+    assert output_data[1:] == expected_data[1:]
+    assert extract_elements(output_data[0]) == extract_elements(expected_data[0])